@@ -1,58 +1,233 @@
 import sqlite3
+import threading
 
 class SQLDatabase:
+    """ Store of the installed rules
+
+        Rules are kept in a sqlite database, which is opened once (in WAL mode) and shared by all threads.
+        An in-memory copy of the database serves all lookups, so the disk is only accessed to store changes.
+        Several commands can be stored within a single transaction (see `insert_commands`).
+        The activation and expiration times of the rules (if any) are stored as well (see `RuleScheduler`).
+    """
     def __init__(self, db_name):
         self.db_name = db_name
-        self.db_path = 'openc2_commands.db'
+        self.db_path = db_name
+        self._conn = None
+        self._lock = threading.RLock()
+        self._commands = {}
+        """ rule_number -> command """
+        self._networks = {}
+        """ rule_number -> network (for aggregated rules only) """
+        self._rules = {}
+        """ command -> set of rule_numbers """
+        self._timers = {}
+        """ rule_number -> (start_time, stop_time) in milliseconds (start_time is None once the rule is installed) """
+        self._next = 1
+        """ Next rule number (stored in the database, so that rule numbers are never reused) """
 
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS commands (rule_number INTEGER PRIMARY KEY, command TEXT)''')
-        conn.commit()
-        conn.close()
+        with self._lock:
+            if self._conn is not None:
+                return
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS commands (rule_number INTEGER PRIMARY KEY, command TEXT)''')
+            # Original network of the commands that are enforced by an aggregated rule
+            conn.execute('''CREATE TABLE IF NOT EXISTS aggregated (rule_number INTEGER PRIMARY KEY, network TEXT)''')
+            for rule_number, command in conn.execute('SELECT rule_number, command FROM commands'):
+                self._add(rule_number, command)
+            # Rules waiting to be installed (start_time) or removed (stop_time)
+            conn.execute('''CREATE TABLE IF NOT EXISTS timers (rule_number INTEGER PRIMARY KEY, start_time INTEGER, stop_time INTEGER)''')
+            for rule_number, network in conn.execute('SELECT rule_number, network FROM aggregated'):
+                self._networks[rule_number] = network
+            for rule_number, start_time, stop_time in conn.execute('SELECT rule_number, start_time, stop_time FROM timers'):
+                self._timers[rule_number] = (start_time, stop_time)
+            # Next rule number: the last rules may have been deleted, so it cannot be derived from the remaining ones
+            conn.execute('''CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)''')
+            row = conn.execute("SELECT value FROM meta WHERE name = 'next_rule_number'").fetchone()
+            if row is not None and row[0] > self._next:
+                self._next = row[0]
+            self._conn = conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     def get_command_from_rule_number(self, rule_number):
-        try:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute('SELECT command FROM commands WHERE rule_number = ?', (rule_number,))
-            db_result = c.fetchone()
-            conn.close()
-            return db_result
-        except:
-            return None
+        with self._lock:
+            try:
+                return (self._commands[rule_number],)
+            except KeyError:
+                return None
 
     def delete_command_by_rule_number(self, rule_number):
-        try:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            c.execute('DELETE FROM commands WHERE rule_number = ?', (rule_number,))
-            conn.commit()
-            conn.close()
+        return self.delete_commands([rule_number])
+
+    def delete_commands(self, rule_numbers):
+        """ Delete several commands within one transaction
+
+            :return: 0 on success, -1 otherwise.
+        """
+        rows = [(rule_number,) for rule_number in rule_numbers]
+        with self._lock:
+            try:
+                self._write([('DELETE FROM commands WHERE rule_number = ?', rows),
+                             ('DELETE FROM aggregated WHERE rule_number = ?', rows),
+                             ('DELETE FROM timers WHERE rule_number = ?', rows)])
+            except:
+                return -1
+            for rule_number in rule_numbers:
+                if rule_number in self._commands:
+                    self._remove(rule_number)
+                self._networks.pop(rule_number, None)
+                self._timers.pop(rule_number, None)
             return 0
-        except:
-            return -1
 
-    def insert_command(self, iptables_command, rule_number=None):
+    def insert_command(self, iptables_command, rule_number=None, timer=None):
+        timers = None if timer is None else [timer]
+        if rule_number is None:
+            return self.insert_commands([iptables_command], timers=timers)[0]
+        with self._lock:
+            if rule_number in self._commands:
+                return -1
+            try:
+                self._write([('INSERT INTO commands (rule_number, command) VALUES (?, ?)', [(rule_number, iptables_command)])] +
+                            self._timer_statements([rule_number], timers) + self._next_statements(rule_number + 1))
+            except:
+                return -1
+            self._add(rule_number, iptables_command)
+            self._set_timers([rule_number], timers)
+            return rule_number
+
+    def insert_commands(self, commands, networks=None, timers=None):
+        """ Store several commands within one transaction
+
+            :param commands: The commands to store.
+            :param networks: The original network of each command, if the commands are enforced by aggregated rules.
+            :param timers: The (start_time, stop_time) pair of each command, if the commands have timers.
+            :return: The rule number assigned to each command (-1 for all of them if they could not be stored).
+        """
+        with self._lock:
+            rule_numbers = list(range(self._next, self._next + len(commands)))
+            statements = [('INSERT INTO commands (rule_number, command) VALUES (?, ?)', list(zip(rule_numbers, commands)))]
+            if networks is not None:
+                statements.append(('INSERT INTO aggregated (rule_number, network) VALUES (?, ?)', list(zip(rule_numbers, networks))))
+            statements += self._timer_statements(rule_numbers, timers)
+            statements += self._next_statements(self._next + len(commands))
+            try:
+                self._write(statements)
+            except:
+                return [-1] * len(commands)
+            for rule_number, command in zip(rule_numbers, commands):
+                self._add(rule_number, command)
+            if networks is not None:
+                self._networks.update(zip(rule_numbers, networks))
+            self._set_timers(rule_numbers, timers)
+            return rule_numbers
+
+    def get_timers(self, rule_numbers=None):
+        """ Get the timers of the commands
+
+            :param rule_numbers: The commands to look up (all commands with timers if `None`).
+            :return: A dictionary rule_number -> (start_time, stop_time), for the commands with timers.
+        """
+        with self._lock:
+            if rule_numbers is None:
+                return dict(self._timers)
+            return {rule_number: self._timers[rule_number] for rule_number in rule_numbers if rule_number in self._timers}
+
+    def set_timers(self, timers):
+        """ Change the timers of several commands within one transaction
+
+            :param timers: A dictionary rule_number -> (start_time, stop_time). Timers are removed if both are `None`.
+            :return: 0 on success, -1 otherwise.
+        """
+        rule_numbers = list(timers)
+        timers = [timers[rule_number] for rule_number in rule_numbers]
+        with self._lock:
+            try:
+                self._write([('DELETE FROM timers WHERE rule_number = ?', [(rule_number,) for rule_number in rule_numbers])] +
+                            self._timer_statements(rule_numbers, timers))
+            except:
+                return -1
+            for rule_number in rule_numbers:
+                self._timers.pop(rule_number, None)
+            self._set_timers(rule_numbers, timers)
+            return 0
+
+    def insert_aggregated(self, iptables_command, network):
+        return self.insert_commands([iptables_command], [network])[0]
+
+    def get_aggregated(self, iptables_command):
+        with self._lock:
+            return [(rule_number, self._networks[rule_number]) for rule_number in sorted(self._rules.get(iptables_command, ()))
+                    if rule_number in self._networks]
+
+    def get_commands(self):
+        with self._lock:
+            return list(self._commands.items())
+
+    def update_command_by_rule_number(self, rule_number, new_command):
+        """ Replace the command of a rule
+
+            :return: 0 on success, -1 otherwise.
+        """
+        with self._lock:
+            try:
+                self._write([('UPDATE commands SET command = ? WHERE rule_number = ?', [(new_command, rule_number)])])
+            except:
+                return -1
+            if rule_number in self._commands:
+                self._remove(rule_number)
+                self._add(rule_number, new_command)
+            return 0
+
+    def _write(self, statements):
+        """ Run statements within a single transaction (the lock must be held) """
+        if self._conn is None:
+            self.init_db()
+        self._conn.execute('BEGIN')
         try:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
-            if rule_number is None:
-                c.execute('INSERT INTO commands (command) VALUES (?)', (iptables_command,))
-            else:
-                c.execute('INSERT INTO commands (rule_number, command) VALUES (?, ?)', (rule_number, iptables_command))
-            rule_number = c.lastrowid
-            conn.commit()
-            conn.close()
+            for sql, rows in statements:
+                self._conn.executemany(sql, rows)
         except:
-            return -1
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
 
-        return rule_number
+    @staticmethod
+    def _timer_statements(rule_numbers, timers):
+        if timers is None:
+            return []
+        rows = [(rule_number, start, stop) for rule_number, (start, stop) in zip(rule_numbers, timers)
+                if start is not None or stop is not None]
+        return [('INSERT INTO timers (rule_number, start_time, stop_time) VALUES (?, ?, ?)', rows)] if rows else []
 
-    def update_command_by_rule_number(self, rule_number, new_command):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('UPDATE commands SET command = ? WHERE rule_number = ?', (new_command, rule_number))
-        conn.commit()
-        conn.close()
+    def _next_statements(self, next_rule_number):
+        """ Store the next rule number, if it grows """
+        if next_rule_number <= self._next:
+            return []
+        return [("INSERT OR REPLACE INTO meta (name, value) VALUES ('next_rule_number', ?)", [(next_rule_number,)])]
+
+    def _set_timers(self, rule_numbers, timers):
+        if timers is None:
+            return
+        for rule_number, (start, stop) in zip(rule_numbers, timers):
+            if start is not None or stop is not None:
+                self._timers[rule_number] = (start, stop)
+
+    def _add(self, rule_number, command):
+        self._commands[rule_number] = command
+        self._rules.setdefault(command, set()).add(rule_number)
+        if rule_number >= self._next:
+            self._next = rule_number + 1
+
+    def _remove(self, rule_number):
+        command = self._commands.pop(rule_number)
+        rules = self._rules[command]
+        rules.discard(rule_number)
+        if not rules:
+            del self._rules[command]
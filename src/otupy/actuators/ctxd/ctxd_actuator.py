@@ -32,6 +32,9 @@ class CTXDActuator:
 		This class provides an implementation of the CTXD `Actuator`.
 	"""
 
+	rate_limit = None
+	""" Maximum number of requests per minute, reported by `query features` (`None` if not limited) """
+
 	my_services: ArrayOf(Service) = None # type: ignore
 	""" Name of the service """
 	my_links: ArrayOf(Link) = None # type: ignore
@@ -139,7 +142,8 @@ class CTXDActuator:
 				case Feature.pairs:
 					features[Feature.pairs.name]=ctxd.AllowedCommandTarget
 				case Feature.rate_limit:
-					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Feature 'rate_limit' not yet implemented")
+					if self.rate_limit is not None:
+						features[Feature.rate_limit.name]=self.rate_limit
 				case _:
 					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Invalid feature '" + f + "'")
 
@@ -3,11 +3,17 @@
 	This module provides an example to create an `Actuator` for the SLPF profile.
 	It only answers to the request for available features.
 """
+import bisect
 import logging
+import threading
 
-from otupy import ArrayOf,ActionTargets, TargetEnum, Nsid, Version,Actions, Command, Response, StatusCode, StatusCodeDescription, Features, ResponseType, Feature
+from otupy import ArrayOf,ActionTargets, TargetEnum, Nsid, Version,Actions, Command, Response, StatusCode, StatusCodeDescription, Features, ResponseType, Feature, IPv4Net
+from otupy.types.targets.bulk import collapse
 from otupy.actuators.SQLDatabase import SQLDatabase
-from otupy.actuators.iptables_manager import IptablesManager
+from otupy.actuators.iptables_manager import IptablesManager, RuleBatcher, ShellExecutor
+from otupy.actuators.rule_index import RuleIndex, key, key_from_command
+from otupy.actuators import rule_scheduler
+from otupy.actuators.rule_scheduler import RuleScheduler
 from otupy.core.actions import Actions
 import otupy.profiles.slpf as slpf 
 
@@ -27,29 +33,67 @@ class IptablesActuator:
 
 		This class provides an implementation of the SLPF `Actuator` for iptables.
 	"""
+
+	rate_limit = None
+	""" Maximum number of requests per minute, reported by `query features` (`None` if not limited) """
 	
-	def __init__(self, args=None,db_name = "openc2_commands.db"):
+	def __init__(self, args=None,db_name = "openc2_commands.db", executor=ShellExecutor, batch_window=0.05,
+			aggregate_window=None):
+		""" Create the actuator
+
+			Rule changes are applied by a `RuleBatcher`: concurrent commands received within `batch_window` 
+			seconds are programmed with a single iptables-restore invocation.
+			If `aggregate_window` is set, `allow`/`deny` commands on `IPv4Net` targets received by `run` within 
+			`aggregate_window` seconds are run together by `run_batch`, which aggregates their networks. 
+			This adds up to `aggregate_window` seconds to the processing of these commands.
+			Installed rules are indexed (see `RuleIndex`), so that duplicated rules are not installed again.
+			Rules with `start_time`, `stop_time`, or `duration` are installed and removed by a `RuleScheduler`;
+			the timers are stored in the database and restored when the actuator is created again.
+			:param db_name: The database of installed rules.
+			:param executor: The executor of iptables commands (use `FakeExecutor` to run without root privileges).
+			:param batch_window: Batching window (seconds). Set to 0 to program each rule as soon as it is received.
+			:param aggregate_window: Aggregation window (seconds). `None` (default) or 0 to disable aggregation,
+				which is then only available through `run_batch`.
+		"""
 		self.db = SQLDatabase(db_name)
 		self.db.init_db()
+		self.executor = executor
+		self.batcher = RuleBatcher(executor, batch_window)
+		self.__aggregator = _CommandBatcher(self.run_batch, aggregate_window) if aggregate_window else None
+		self.index = RuleIndex()
+		self.__pending = {}
+		self.__pending_lock = threading.Lock()
+		self.__timers_lock = threading.RLock()
+		self.__load_index()
+		self.scheduler = RuleScheduler(self.__fire)
+		self.scheduler.schedule_many({rule_number: start if start is not None else stop 
+			for rule_number, (start, stop) in self.db.get_timers().items()})
+
+	RETRY = 5000
+	""" Delay before trying again to install or remove a rule (milliseconds) """
+
+	def close(self):
+		""" Stop the timers and close the database """
+		if self.__aggregator is not None:
+			self.__aggregator.flush()
+		self.scheduler.close()
+		self.db.close()
 
 	def run(self, cmd):
+		if self.__aggregator is not None and self.__aggregatable(cmd):
+			return self.__aggregator.submit(cmd)
+		return self.__run(cmd)
 
+	def __aggregatable(self, cmd):
+		""" Check whether the networks of a command can be aggregated with others """
+		return cmd.action in self.__aggregated_actions and cmd.target is not None and \
+			isinstance(cmd.target.getObj(), IPv4Net)
 
-		# Check if the Command is compliant with the implemented profile
-		if not slpf.validate_command(cmd):
-			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Invalid Action/Target pair')
-		if not slpf.validate_args(cmd):
-			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Option not supported')
+	def __run(self, cmd):
 
-		# Check if the Specifiers are actually served by this Actuator
-		try:
-			if not self.__is_addressed_to_actuator(cmd.actuator.getObj()):
-				return Response(status=StatusCode.NOTFOUND, status_text='Requested Actuator not available')
-		except AttributeError:
-			# If no actuator is given, execute the command
-			pass
-		except Exception as e:
-			return Response(status=StatusCode.INTERNALERROR, status_text='Unable to identify actuator')
+		response = self.__check(cmd)
+		if response is not None:
+			return response
 
 #return Response(status=StatusCode.NOTFOUND, status_text='Fake response for local testing')
 
@@ -72,6 +116,231 @@ class IptablesActuator:
 
 		return response
 
+	def run_batch(self, cmds):
+		""" Run a batch of commands
+
+			Consecutive `allow` and `deny` commands on `IPv4Net` targets that share the same action and arguments
+			are aggregated: overlapping and adjacent networks are collapsed into the minimal set of 
+			iptables rules. Each command still gets its own `rule_number`, which can be used to delete it.
+			Any other command is run as by `run`. Since iptables applies the first matching rule, commands
+			are never moved across each other: each run of aggregated commands is installed before the 
+			following commands, which are checked against it (e.g., for conflicts).
+			:param cmds: A list of `Command`s.
+			:return: A list with the `Response` to each command.
+		"""
+		responses = [None] * len(cmds)
+		batch = []
+		for i, cmd in enumerate(cmds):
+			if not self.__aggregatable(cmd) or self.__check(cmd) is not None:
+				self.__run_aggregated(cmds, batch, responses)
+				batch = []
+				responses[i] = self.__run(cmd)
+				continue
+			try:
+				start, stop = rule_scheduler.times(cmd.args)
+			except ValueError as e:
+				responses[i] = Response(status=StatusCode.BADREQUEST, status_text=str(e))
+				continue
+			if start is not None:
+				self.__run_aggregated(cmds, batch, responses)
+				batch = []
+				responses[i] = self.__run(cmd)
+				continue
+			if batch and (cmds[batch[0][0]].action != cmd.action or cmds[batch[0][0]].args != cmd.args):
+				self.__run_aggregated(cmds, batch, responses)
+				batch = []
+			batch.append((i, stop))
+		self.__run_aggregated(cmds, batch, responses)
+
+		return responses
+
+	def __run_aggregated(self, cmds, batch, responses):
+		""" Install a run of consecutive commands with the same action and arguments
+
+			:param cmds: All the `Command`s of the batch.
+			:param batch: The (index, stop time) of the commands to install.
+			:param responses: The `Response`s of the batch, which are filled in for the given commands.
+		"""
+		if not batch:
+			return
+		action = self.__aggregated_actions[cmds[batch[0][0]].action]
+		stop = batch[0][1]
+		indexes = []
+		first = {}
+		duplicates = []
+		for i, _ in batch:
+			k = key(cmds[i].target.getObj())
+			if k in first:
+				# Same network as an earlier command of the run
+				duplicates.append((i, first[k]))
+				continue
+			responses[i] = self.__lookup(action, k, stop)
+			if responses[i] is None:
+				first[k] = i
+				indexes.append(i)
+
+		nets = [cmds[i].target.getObj() for i in indexes]
+		try:
+			rules = self.__insert_aggregated(nets, action) if nets else []
+		except Exception as e:
+			for i in indexes:
+				responses[i] = self.__servererror(cmds[i], e)
+			rules = None
+		if rules is not None:
+			inserted = [k for k, rule in enumerate(rules) if rule is not None]
+			rule_numbers = [-1] * len(rules)
+			timers = None if stop is None else [(None, stop)] * len(inserted)
+			for k, rule_number in zip(inserted, self.db.insert_commands([rules[k] for k in inserted], [str(nets[k]) for k in inserted], timers)):
+				rule_numbers[k] = rule_number
+			if stop is not None:
+				self.scheduler.schedule_many((rule_number, stop) for rule_number in rule_numbers if rule_number >= 0)
+			for i, net, rule_number in zip(indexes, nets, rule_numbers):
+				if rule_number < 0:
+					responses[i] = Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+				else:
+					self.index.add(rule_number, action, key(net))
+					res = slpf.Results(rule_number=slpf.RuleID(rule_number))
+					responses[i] = Response(status=StatusCode.OK, status_text="OK", results=res)
+		for i, j in duplicates:
+			responses[i] = responses[j]
+
+	__aggregated_actions = {Actions.allow: "ACCEPT", Actions.deny: "DROP"}
+
+	def __insert_aggregated(self, nets, iptables_target, position=None):
+		""" Insert the minimal set of rules that cover the given networks
+
+			:param nets: A list of `IPv4Net`.
+			:param iptables_target: The iptables target of the rules (e.g., "DROP").
+			:param position: The position of the rules in the INPUT chain (1-based). `None` to append them.
+			:return: A list with the iptables rule that covers each network (`None` if the rule could not be inserted).
+				Rules are always given as append commands.
+		"""
+		aggregates = collapse(nets)
+		starts = [net.network()[0] for net in aggregates]
+		rules = [IptablesManager.build_rule(net, iptables_target) for net in aggregates]
+		cmds = rules
+		if position is not None:
+			cmds = [rule.replace(" -A INPUT ", f" -I INPUT {position + k} ", 1) for k, rule in enumerate(rules)]
+		results = self.batcher.submit_many(cmds)
+		rules = [rule if result == 200 else None for rule, result in zip(rules, results)]
+
+		return [rules[bisect.bisect_right(starts, net.network()[0]) - 1] for net in nets]
+
+	def __load_index(self):
+		""" Index the rules found in the database
+
+			Commands enforced by aggregated rules are indexed by their own network.
+		"""
+		commands = self.db.get_commands() or []
+		timers = self.db.get_timers()
+		networks = {}
+		for command in {command for _, command in commands}:
+			networks.update(self.db.get_aggregated(command) or [])
+		for rule_number, command in commands:
+			parsed = key_from_command(command)
+			if parsed is None or timers.get(rule_number, (None, None))[0] is not None:
+				# Not installed yet
+				continue
+			k, action = parsed
+			if rule_number in networks:
+				k = key(IPv4Net(networks[rule_number]))
+			self.index.add(rule_number, action, k)
+
+	def __lookup(self, action, k, stop=None):
+		""" Look for installed rules that make a new rule useless
+
+			Rules that expire before the new rule does are not taken into account.
+			:param action: The iptables target of the new rule.
+			:param k: The 5-tuple of the new rule (see `rule_index.key`).
+			:param stop: The expiration time of the new rule (`None` if it never expires).
+			:return: `None` if the rule must be installed, otherwise the `Response` to the command: the
+				`rule_number` of the identical (or covering) rule, or an error if the rule is covered by a rule 
+				with a different action.
+		"""
+		rule_number = self.index.find(action, k)
+		if rule_number is None:
+			found = self.index.covering(k)
+			if found is None:
+				return None
+			rule_number, existing = found
+			if existing != action:
+				return Response(status=StatusCode.BADREQUEST, 
+					status_text=f"Conflicts with rule {rule_number} ({existing})")
+		expires = self.db.get_timers([rule_number]).get(rule_number, (None, None))[1]
+		if expires is not None and (stop is None or expires < stop):
+			return None
+		res = slpf.Results(rule_number=slpf.RuleID(rule_number))
+		return Response(status=StatusCode.OK, status_text="Rule already present", results=res)
+
+	def __positions(self, rules):
+		""" Find where the rules that are going to be deleted are in the INPUT chain
+
+			:param rules: The iptables rules.
+			:return: A dictionary with the position (1-based) that each rule leaves free once all of them have
+				been deleted (`None` if the rule is not found).
+		"""
+		positions = dict.fromkeys(rules)
+		listed = self.executor.list_rules('iptables', 'INPUT')
+		if listed is None:
+			return positions
+		deleted = {rule.split(' ', 1)[1]: rule for rule in rules}
+		kept = 0
+		for line in listed:
+			if line not in deleted:
+				kept += 1
+			elif positions[deleted[line]] is None:
+				positions[deleted[line]] = kept + 1
+		return positions
+
+	def __reaggregate(self, rule, position=None):
+		""" Re-insert the commands that were enforced by a deleted aggregated rule
+
+			The new rules take the place of the deleted one, so that the order of the rules does not change.
+			:param rule: The iptables rule that has been deleted.
+			:param position: The position of the deleted rule (see `__positions`). `None` to append the new rules.
+			:return: 0 on success, -1 otherwise.
+		"""
+		remaining = self.db.get_aggregated(rule)
+		if remaining is None:
+			return -1
+		if not remaining:
+			return 0
+
+		if position is None:
+			logger.warning("Position of rule %s not found: the remaining networks are appended", rule)
+		nets = [IPv4Net(network) for _, network in remaining]
+		rules = self.__insert_aggregated(nets, rule.split()[-1], position)
+		for (rule_number, _), new_rule in zip(remaining, rules):
+			if new_rule is None:
+				return -1
+			if self.db.update_command_by_rule_number(rule_number, new_rule) < 0:
+				return -1
+		return 0
+
+	def __check(self, cmd):
+		""" Check that the command can be run by this Actuator
+
+			:param cmd: The `Command` to check.
+			:return: `None` if the command can be run, otherwise the `Response` with the error.
+		"""
+		# Check if the Command is compliant with the implemented profile
+		if not slpf.validate_command(cmd):
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Invalid Action/Target pair')
+		if not slpf.validate_args(cmd):
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Option not supported')
+
+		# Check if the Specifiers are actually served by this Actuator
+		try:
+			if not self.__is_addressed_to_actuator(cmd.actuator.getObj()):
+				return Response(status=StatusCode.NOTFOUND, status_text='Requested Actuator not available')
+		except AttributeError:
+			# If no actuator is given, execute the command
+			pass
+		except Exception as e:
+			return Response(status=StatusCode.INTERNALERROR, status_text='Unable to identify actuator')
+
+		return None
+
 	# def action_mapping(self, action, target):
 	# 	action_method = getattr(self, f"{action}", None)
 	# 	return action_method(target, self.args)
@@ -135,7 +404,8 @@ class IptablesActuator:
 				case Feature.pairs:
 					features[Feature.pairs.name]=slpf.AllowedCommandTarget
 				case Feature.rate_limit:
-					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Feature 'rate_limit' not yet implemented")
+					if self.rate_limit is not None:
+						features[Feature.rate_limit.name]=self.rate_limit
 				case _:
 					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Invalid feature '" + f + "'")
 
@@ -153,8 +423,40 @@ class IptablesActuator:
 	# 	return action_method(target, self.args)
 
 	def insert_handler(self, target, args, action, rule_number=None):
-		error, cmd = IptablesManager.insert_rule(target, action)
-		rule_number = self.db.insert_command(cmd, rule_number)
+		cmd = IptablesManager.build_rule(target, action)
+		if cmd is None:
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Target not supported")
+
+		try:
+			start, stop = rule_scheduler.times(args)
+		except ValueError as e:
+			return Response(status=StatusCode.BADREQUEST, status_text=str(e))
+		if start is not None:
+			return self.__defer(cmd, start, stop, rule_number)
+
+		# Identical commands received at the same time wait for the first one to be installed
+		k = key(target)
+		with self.__pending_lock:
+			response = self.__lookup(action, k, stop)
+			if response is not None:
+				return response
+			pending = self.__pending.get((action, k))
+			if pending is None:
+				self.__pending[(action, k)] = threading.Event()
+		if pending is not None:
+			pending.wait()
+			return self.insert_handler(target, args, action, rule_number)
+
+		try:
+			error = self.batcher.submit(cmd)
+			rule_number = self.db.insert_command(cmd, rule_number, None if stop is None else (None, stop))
+			if error == 200 and rule_number >= 0:
+				self.index.add(rule_number, action, k)
+				if stop is not None:
+					self.scheduler.schedule(rule_number, stop)
+		finally:
+			with self.__pending_lock:
+				self.__pending.pop((action, k)).set()
 
 		if error is not 200:
 			return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
@@ -166,6 +468,15 @@ class IptablesActuator:
 				
 		return error, rule_number 
 
+	def __defer(self, cmd, start, stop, rule_number=None):
+		""" Store a rule that will be installed at `start` """
+		rule_number = self.db.insert_command(cmd, rule_number, (start, stop))
+		if rule_number < 0:
+			return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+		self.scheduler.schedule(rule_number, start)
+		res = slpf.Results(rule_number=slpf.RuleID(rule_number))
+		return Response(status=StatusCode.OK, status_text="OK", results=res)
+
 	def allow(self, cmd):
 		target = cmd.target.getObj()
 		args = cmd.args
@@ -188,17 +499,162 @@ class IptablesActuator:
 		target = cmd.target.getObj()
 		args = cmd.args
 		rule_number = int(target)
-		cmd_data = self.db.get_command_from_rule_number(rule_number)
-		if cmd_data is None:
-			return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
-		modified_cmd = IptablesManager.modify_command_for_deletion(cmd_data[0])
-		err_code = IptablesManager.delete_rule(modified_cmd)
-		if err_code is 200:
-			err_db = self.db.delete_command_by_rule_number(rule_number)
-			if err_db >= 0:
+		try:
+			start, _ = rule_scheduler.times(args)
+		except ValueError as e:
+			return Response(status=StatusCode.BADREQUEST, status_text=str(e))
+
+		with self.__timers_lock:
+			cmd_data = self.db.get_command_from_rule_number(rule_number)
+			if cmd_data is None:
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+			timer = self.db.get_timers([rule_number]).get(rule_number, (None, None))
+			if start is not None:
+				# Delayed deletion: the rule expires at start_time
+				if timer[1] is None or start < timer[1]:
+					timer = (timer[0], start)
+					if self.db.set_timers({rule_number: timer}) < 0:
+						return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+					self.scheduler.schedule(rule_number, timer[0] if timer[0] is not None else timer[1])
 				return Response(status=StatusCode.OK, status_text="OK")
+
+			self.scheduler.cancel(rule_number)
+			if timer[0] is not None:
+				# Not installed yet
+				if self.db.delete_command_by_rule_number(rule_number) >= 0:
+					return Response(status=StatusCode.OK, status_text="OK")
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+
+			# Other commands may be enforced by the same (aggregated) rule
+			position = None
+			if any(n != rule_number for n, _ in self.db.get_aggregated(cmd_data[0])):
+				position = self.__positions([cmd_data[0]])[cmd_data[0]]
+			modified_cmd = IptablesManager.modify_command_for_deletion(cmd_data[0])
+			err_code = self.batcher.submit(modified_cmd)
+			if err_code is 200:
+				err_db = self.db.delete_command_by_rule_number(rule_number)
+				self.index.remove(rule_number)
+				if err_db >= 0 and self.__reaggregate(cmd_data[0], position) >= 0:
+					return Response(status=StatusCode.OK, status_text="OK")
 			
 		return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+
+	def __fire(self, rule_numbers):
+		""" Install and remove the rules whose timers are due (invoked by the `RuleScheduler`) """
+		current = rule_scheduler.now() + self.scheduler.slack
+		activate = []
+		expire = []
+		drop = []
+		later = {}
+		with self.__timers_lock:
+			for rule_number, (start, stop) in self.db.get_timers(rule_numbers).items():
+				if stop is not None and stop <= current:
+					(drop if start is not None else expire).append(rule_number)
+				elif start is not None and start <= current:
+					activate.append(rule_number)
+				else:
+					later[rule_number] = start if start is not None else stop
+
+			if drop:
+				# Expired before being installed
+				self.db.delete_commands(drop)
+			if activate:
+				later.update(self.__activate(activate))
+			if expire:
+				later.update(self.__expire(expire))
+			self.scheduler.schedule_many(later)
+
+	def __activate(self, rule_numbers):
+		""" Install rules with a single firewall transaction
+
+			:param rule_numbers: The rules to install.
+			:return: The next timer of each rule (rule_number -> time).
+		"""
+		rule_numbers, commands = self.__commands(rule_numbers)
+		results = self.batcher.submit_many(commands)
+		timers = self.db.get_timers(rule_numbers)
+		installed = {}
+		later = {}
+		for rule_number, command, result in zip(rule_numbers, commands, results):
+			stop = timers[rule_number][1]
+			if result != 200:
+				logger.warning("Unable to install rule %s: %s", rule_number, command)
+				later[rule_number] = rule_scheduler.now() + self.RETRY
+				continue
+			installed[rule_number] = (None, stop)
+			parsed = key_from_command(command)
+			if parsed is not None:
+				self.index.add(rule_number, parsed[1], parsed[0])
+			if stop is not None:
+				later[rule_number] = stop
+		self.db.set_timers(installed)
+		return later
+
+	def __commands(self, rule_numbers):
+		""" Get the iptables commands of the rules
+
+			Rules that are not found in the database are skipped, and their timers are dropped.
+			:param rule_numbers: The rules.
+			:return: The rules found and their commands (two lists).
+		"""
+		found = []
+		commands = []
+		missing = []
+		for rule_number in rule_numbers:
+			cmd_data = self.db.get_command_from_rule_number(rule_number)
+			if cmd_data is None:
+				missing.append(rule_number)
+			else:
+				found.append(rule_number)
+				commands.append(cmd_data[0])
+		if missing:
+			logger.warning("Rules not found in the database: %s", missing)
+			self.db.delete_commands(missing)
+		return found, commands
+
+	def __expire(self, rule_numbers):
+		""" Remove rules with a single firewall transaction
+
+			Rules enforced by the same aggregated rule are removed together, and the remaining networks
+			(if any) are aggregated again.
+			:param rule_numbers: The rules to remove.
+			:return: The next timer of the rules that could not be removed (rule_number -> time).
+		"""
+		groups = {}
+		for rule_number, command in zip(*self.__commands(rule_numbers)):
+			groups.setdefault(command, []).append(rule_number)
+
+		# An aggregated rule is deleted once, any other rule once for each command
+		deletions = []
+		reaggregated = []
+		for command, numbers in groups.items():
+			aggregated = {rule_number for rule_number, _ in self.db.get_aggregated(command)}
+			count = len([n for n in numbers if n not in aggregated]) + (1 if aggregated.intersection(numbers) else 0)
+			deletions.append((command, count))
+			if aggregated.difference(numbers):
+				reaggregated.append(command)
+		positions = self.__positions(reaggregated) if reaggregated else {}
+		results = iter(self.batcher.submit_many([IptablesManager.modify_command_for_deletion(command) 
+			for command, count in deletions for _ in range(count)]))
+
+		removed = []
+		later = {}
+		for command, count in deletions:
+			if all([next(results) == 200 for _ in range(count)]):
+				removed.append(command)
+			else:
+				logger.warning("Unable to remove rule: %s", command)
+				later.update((rule_number, rule_scheduler.now() + self.RETRY) for rule_number in groups[command])
+
+		expired = [rule_number for command in removed for rule_number in groups[command]]
+		if self.db.delete_commands(expired) < 0:
+			logger.warning("Unable to remove expired rules from the database")
+		for rule_number in expired:
+			self.index.remove(rule_number)
+		# The last positions are filled first, so that the positions computed before are still valid
+		for command in sorted(removed, key=lambda c: positions.get(c) or 0, reverse=True):
+			self.__reaggregate(command, positions.get(command))
+		return later
 				
 	def __notimplemented(self, cmd):
 		""" Default response
@@ -225,3 +681,86 @@ class IptablesActuator:
 			return Response(status=StatusCode.INTERNALERROR, status_text='Internal server error: ' + str(e))
 		else:
 			return Response(status=StatusCode.INTERNALERROR, status_text='Internal server error')
+
+class _CommandBatcher:
+	""" Commands waiting to be aggregated
+
+		Commands submitted within a short time window are run together by a single `run_batch` invocation, in order
+		of arrival. Threads that submit commands wait until their batch has been run and get their own `Response`.
+	"""
+
+	def __init__(self, run_batch, window, max_batch=1000):
+		""" Create a `_CommandBatcher`
+
+			:param run_batch: The function that runs a list of `Command`s and returns their `Response`s.
+			:param window: Time (seconds) to wait for other commands after the first one is submitted.
+			:param max_batch: A batch is run as soon as it includes `max_batch` commands.
+		"""
+		self.run_batch = run_batch
+		self.window = window
+		self.max_batch = max_batch
+		self._lock = threading.Lock()
+		self._run_lock = threading.Lock()
+		self._pending = []
+		self._timer = None
+
+	def submit(self, cmd):
+		""" Run a command
+
+			Blocks until the command has been run.
+			:param cmd: The `Command`.
+			:return: The `Response` to the command.
+		"""
+		pending = _PendingCommand(cmd)
+		batch = None
+		with self._lock:
+			self._pending.append(pending)
+			if len(self._pending) >= self.max_batch:
+				batch = self._take()
+			elif self._timer is None:
+				self._timer = threading.Timer(self.window, self.flush)
+				self._timer.daemon = True
+				self._timer.start()
+		if batch is not None:
+			self._apply(batch)
+		pending.done.wait()
+		return pending.response
+
+	def flush(self):
+		""" Run the pending commands now """
+		with self._lock:
+			batch = self._take()
+		self._apply(batch)
+
+	def _take(self):
+		""" Remove the pending commands (the lock must be held) """
+		batch = self._pending
+		self._pending = []
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		return batch
+
+	def _apply(self, batch):
+		""" Run a batch (one at a time, so that batches do not overlap) and notify the waiting threads """
+		if not batch:
+			return
+		try:
+			with self._run_lock:
+				responses = self.run_batch([p.cmd for p in batch])
+			for p, response in zip(batch, responses):
+				p.response = response
+		except Exception as e:
+			logger.exception("Unable to run the batch of commands")
+		finally:
+			for p in batch:
+				p.done.set()
+
+class _PendingCommand:
+	""" A command waiting to be aggregated """
+	__slots__ = ('cmd', 'response', 'done')
+
+	def __init__(self, cmd):
+		self.cmd = cmd
+		self.response = Response(status=StatusCode.INTERNALERROR, status_text='Internal server error')
+		self.done = threading.Event()
@@ -4,6 +4,7 @@
 	message. Use it for testing only.
 """
 import subprocess
+import threading
 import logging
 
 from otupy import ArrayOf,ActionTargets, TargetEnum, Nsid, Version,Results, StatusCode, StatusCodeDescription, Actions, Command, Response, IPv4Net, IPv4Connection #, IPv6Net, IPv6Connection
@@ -17,28 +18,27 @@ class IptablesManager:
 
 	@staticmethod
 	def parse_iptables(cmd):
-		try:
-		     result = subprocess.run(cmd,
-		                             shell=True,
-		                             check=True,
-		                             stdout=subprocess.PIPE,
-		                             stderr=subprocess.PIPE)
-		     if result.returncode == 0:
-		         logger.debug("Command executed successfully: %s", cmd)
-		         logger.debug("Output: %s", result)
-		         return 200
-		     else:
-		         logger.debug("Command failed: %s", cmd)
-		         logger.debug("Output: %s", result)
-		         return 500
-		except subprocess.CalledProcessError as e:
-		     logger.debug("Execution error for command: %s", cmd)
-		     logger.debug("Exception: %s", str(e))
-		     return 500
+		return ShellExecutor.run(cmd)
 
 	@staticmethod
 	def insert_rule(target, iptables_target):
 		logger.debug("Starting insert rule %s %s", target, iptables_target)
+		cmd = IptablesManager.build_rule(target, iptables_target)
+		if cmd is None:
+			return 501
+
+		result = IptablesManager.parse_iptables([cmd])
+#	result[0]['command'] = cmd
+		return result, cmd
+
+	@staticmethod
+	def build_rule(target, iptables_target):
+		""" Build the iptables command that inserts a rule
+
+			:param target: The target of the rule (`IPv4Connection` or `IPv4Net`).
+			:param iptables_target: The iptables target (e.g., "DROP").
+			:return: The iptables command, or `None` if the `target` is not supported.
+		"""
 		supported_targets = ['ipv4_connection', 'ipv6_connection', 'ipv4_net', 'ipv6_net']
 		cmd = None
 		base_cmd = "iptables -A INPUT"
@@ -47,7 +47,6 @@ class IptablesManager:
 		if isinstance(target, IPv4Connection): # or isinstance(target.IPv6Connection):
 			src_ip = target.src_addr
 			dst_ip = target.dst_addr
-			logger.debug("protocol: %s", protocol)
 			src_port = target.src_port
 			dst_port = target.dst_port
 			protocol = target.protocol.name
@@ -70,16 +69,8 @@ class IptablesManager:
 			if cidr:
 				cmd += f"/{cidr}"
 			cmd += f" -j {iptables_target}"
-		else:
-			return 501
-
-
-		if cmd:
-			result = IptablesManager.parse_iptables([cmd])
-#	result[0]['command'] = cmd
-			return result, cmd
 
-		return 500
+		return cmd
 
 	@staticmethod
 	def delete_rule(cmd):
@@ -102,3 +93,285 @@ class IptablesManager:
 		modified_cmd = ' '.join(cmd_parts)
 		return modified_cmd
 
+
+
+class ShellExecutor:
+	""" Runs iptables commands on the local host
+
+		This is the default executor of `IptablesManager` and `RuleBatcher`. It requires root privileges.
+	"""
+
+	@staticmethod
+	def run(cmd):
+		""" Run a single iptables command
+
+			:param cmd: The command line (a list with the command line as first element is accepted as well).
+			:return: 200 if the command succeeded, 500 otherwise.
+		"""
+		try:
+		     result = subprocess.run(cmd,
+		                             shell=True,
+		                             check=True,
+		                             stdout=subprocess.PIPE,
+		                             stderr=subprocess.PIPE)
+		     if result.returncode == 0:
+		         logger.debug("Command executed successfully: %s", cmd)
+		         logger.debug("Output: %s", result)
+		         return 200
+		     else:
+		         logger.debug("Command failed: %s", cmd)
+		         logger.debug("Output: %s", result)
+		         return 500
+		except subprocess.CalledProcessError as e:
+		     logger.debug("Execution error for command: %s", cmd)
+		     logger.debug("Exception: %s", str(e))
+		     return 500
+
+	@staticmethod
+	def restore(program, payload):
+		""" Apply a set of rules atomically
+
+			Rules are applied with `iptables-restore --noflush` (or `ip6tables-restore`), which either applies all
+			of them or none.
+			:param program: Either "iptables" or "ip6tables".
+			:param payload: The rules, in the iptables-restore format.
+			:return: 200 if the rules have been applied, 500 otherwise.
+		"""
+		try:
+			subprocess.run([program + "-restore", "--noflush"], input=payload.encode(), check=True,
+								stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		except (subprocess.CalledProcessError, OSError) as e:
+			logger.debug("Execution error for %s-restore: %s", program, str(e))
+			return 500
+		logger.debug("Rules restored: %s", payload)
+		return 200
+
+	@staticmethod
+	def list_rules(program, chain):
+		""" List the rules of a chain, in order
+
+			:param program: Either "iptables" or "ip6tables".
+			:param chain: The chain (e.g., "INPUT").
+			:return: The rules as append commands without the program name (e.g., "-A INPUT -s 10.0.0.1/32 -j DROP"),
+				or `None` if the rules cannot be listed.
+		"""
+		try:
+			result = subprocess.run([program, "-S", chain], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		except (subprocess.CalledProcessError, OSError) as e:
+			logger.debug("Unable to list %s rules: %s", program, str(e))
+			return None
+		return [line for line in result.stdout.decode().splitlines() if line.startswith("-A ")]
+
+class FakeExecutor:
+	""" Simulates iptables
+
+		This executor can be used in place of `ShellExecutor` to run `IptablesActuator` without root privileges
+		(e.g., for testing). It keeps the list of rules that would be installed and records all invocations.
+		Only the append (-A), insert (-I, with an optional position) and delete (-D) commands are simulated. 
+		Deleting a rule that does not exist fails, as with iptables.
+	"""
+
+	def __init__(self):
+		self.rules = []
+		""" Installed rules, as append commands (e.g., "iptables -A INPUT -s 10.0.0.1/32 -j DROP") """
+		self.calls = []
+		""" Invocations: a command line for `run`, or a (program, payload) pair for `restore` """
+		self.lock = threading.Lock()
+
+	def run(self, cmd):
+		if isinstance(cmd, list):
+			cmd = cmd[0]
+		with self.lock:
+			self.calls.append(cmd)
+			return 200 if self._apply(cmd) else 500
+
+	def restore(self, program, payload):
+		with self.lock:
+			self.calls.append((program, payload))
+			rules = list(self.rules)
+			table = None
+			for line in payload.splitlines():
+				if line.startswith('*'):
+					table = line[1:]
+				elif line == 'COMMIT':
+					table = None
+				elif line and not line.startswith('#'):
+					table_option = f" -t {table}" if table != 'filter' else ""
+					if table is None or not self._apply(f"{program}{table_option} {line}"):
+						self.rules = rules
+						return 500
+			return 200
+
+	def list_rules(self, program, chain):
+		with self.lock:
+			return [" ".join(args) for prefix, args in map(self._split, self.rules)
+					if prefix == [program] and args[1] == chain]
+
+	@staticmethod
+	def _split(rule):
+		""" Split an installed rule into the part before -A and the rest """
+		parts = rule.split()
+		i = parts.index('-A')
+		return parts[:i], parts[i:]
+
+	def _apply(self, cmd):
+		program, *args = cmd.split()
+		for i, arg in enumerate(args):
+			if arg in ('-A', '-I', '-D'):
+				if arg == '-I' and i + 2 < len(args) and args[i+2].isdigit():
+					position = int(args[i+2])
+					del args[i+2]
+				else:
+					position = 1
+				rule = " ".join([program] + args[:i] + ['-A'] + args[i+1:])
+				if arg == '-A':
+					self.rules.append(rule)
+				elif arg == '-I':
+					prefix = [program] + args[:i]
+					chain = [k for k, (p, a) in enumerate(map(self._split, self.rules)) if p == prefix and a[1] == args[i+1]]
+					if position < 1 or position > len(chain) + 1:
+						return False
+					self.rules.insert(chain[position-1] if position <= len(chain) else len(self.rules), rule)
+				elif rule in self.rules:
+					self.rules.remove(rule)
+				else:
+					return False
+				return True
+		return False
+
+class RuleBatcher:
+	""" Batched rule programming
+
+		Rule changes (iptables/ip6tables command lines) submitted within a short time window are applied
+		together, with a single `iptables-restore --noflush` (or `ip6tables-restore`) invocation. Threads that
+		submit rules wait until their batch has been applied and get the result of their own rules.
+
+		The whole batch is applied atomically: if it fails, its rules are run again one at a time, so that only the
+		failing rules are reported as such. Commands that cannot be expressed in the iptables-restore format are
+		always run one at a time.
+	"""
+
+	def __init__(self, executor=ShellExecutor, window=0.05, max_batch=1000):
+		""" Create a `RuleBatcher`
+
+			:param executor: The executor that runs the commands (`ShellExecutor` or `FakeExecutor`).
+			:param window: Time (seconds) to wait for other rule changes after the first one is submitted. If 0 
+				or `None`, rules are applied immediately (without batching).
+			:param max_batch: A batch is applied as soon as it includes `max_batch` rules.
+		"""
+		self.executor = executor
+		self.window = window
+		self.max_batch = max_batch
+		self._lock = threading.Lock()
+		self._pending = []
+		self._timer = None
+
+	def submit(self, cmd):
+		""" Apply a rule change
+
+			Blocks until the rule has been applied.
+			:param cmd: The iptables command.
+			:return: 200 if the command succeeded, 500 otherwise.
+		"""
+		return self.submit_many([cmd])[0]
+
+	def submit_many(self, cmds):
+		""" Apply several rule changes
+
+			Blocks until all rules have been applied. The rules may be applied in different batches.
+			:param cmds: A list of iptables commands.
+			:return: The result of each command (200 or 500).
+		"""
+		if not self.window:
+			return self._apply([_PendingRule(cmd) for cmd in cmds])
+
+		pending = [_PendingRule(cmd) for cmd in cmds]
+		batches = []
+		with self._lock:
+			for p in pending:
+				self._pending.append(p)
+				if len(self._pending) >= self.max_batch:
+					batches.append(self._take())
+			if self._pending and self._timer is None:
+				self._timer = threading.Timer(self.window, self.flush)
+				self._timer.daemon = True
+				self._timer.start()
+		for batch in batches:
+			self._apply(batch)
+
+		for p in pending:
+			p.done.wait()
+		return [p.result for p in pending]
+
+	def flush(self):
+		""" Apply the pending rule changes now """
+		with self._lock:
+			batch = self._take()
+		self._apply(batch)
+
+	def _take(self):
+		""" Remove the pending rules (the lock must be held) """
+		batch = self._pending
+		self._pending = []
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+		return batch
+
+	def _apply(self, batch):
+		""" Apply a batch and notify the waiting threads """
+		try:
+			programs = {}
+			for p in batch:
+				line = self._restore_line(p.cmd)
+				if line is None:
+					p.result = self.executor.run(p.cmd)
+				else:
+					programs.setdefault(line[0], {}).setdefault(line[1], []).append((p, line[2]))
+
+			for program, tables in programs.items():
+				payload = ""
+				for table, lines in tables.items():
+					payload += f"*{table}\n" + "".join(l + "\n" for _, l in lines) + "COMMIT\n"
+				if self.executor.restore(program, payload) == 200:
+					for lines in tables.values():
+						for p, _ in lines:
+							p.result = 200
+				else:
+					logger.debug("Batch failed, applying rules one at a time")
+					for lines in tables.values():
+						for p, _ in lines:
+							p.result = self.executor.run(p.cmd)
+		finally:
+			for p in batch:
+				p.done.set()
+		return [p.result for p in batch]
+
+	@staticmethod
+	def _restore_line(cmd):
+		""" Convert a command line to the iptables-restore format
+
+			:return: A tuple (program, table, rule), or `None` if the command cannot be converted.
+		"""
+		program, *args = cmd.split()
+		if program not in ('iptables', 'ip6tables'):
+			return None
+		table = 'filter'
+		if '-t' in args:
+			i = args.index('-t')
+			if i + 1 >= len(args):
+				return None
+			table = args[i+1]
+			del args[i:i+2]
+		if not args or args[0] not in ('-A', '-I', '-D'):
+			return None
+		return program, table, " ".join(args)
+
+class _PendingRule:
+	""" A rule change waiting to be applied """
+	__slots__ = ('cmd', 'result', 'done')
+
+	def __init__(self, cmd):
+		self.cmd = cmd
+		self.result = 500
+		self.done = threading.Event()
@@ -28,6 +28,9 @@ class MokupSlpfActuator:
 
 		This class provides a mokup of the SLPF `Actuator`.
 	"""
+
+	rate_limit = None
+	""" Maximum number of requests per minute, reported by `query features` (`None` if not limited) """
 	
 	def run(self, cmd):
 
@@ -134,7 +137,8 @@ class MokupSlpfActuator:
 				case Feature.pairs:
 					features[Feature.pairs.name]=slpf.AllowedCommandTarget
 				case Feature.rate_limit:
-					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Feature 'rate_limit' not yet implemented")
+					if self.rate_limit is not None:
+						features[Feature.rate_limit.name]=self.rate_limit
 				case _:
 					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Invalid feature '" + f + "'")
 
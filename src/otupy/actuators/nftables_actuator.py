@@ -0,0 +1,384 @@
+""" Nftables `Actuator` for SLPF profile
+
+	This module provides an implementation of the SLPF `Actuator` for nftables.
+
+	Instead of one rule for each command, the `NftablesActuator` uses a fixed number of rules, which look up
+	named interval sets (see `otupy.actuators.nftables_manager`). `allow`/`deny` commands add elements to these
+	sets:
+	- `ipv4_net`/`ipv6_net` targets are collapsed into the minimal set of networks;
+	- `ipv4_connection`/`ipv6_connection` targets are concatenations of addresses, protocol, and ports
+	  (missing fields match any value). nftables rejects overlapping connections in the same set.
+
+	Each command gets its own `rule_number`, which can be used to delete it, as with the `IptablesActuator`.
+	Temporary rules (`start_time`, `stop_time`, `duration` arguments) are not supported.
+"""
+import logging
+import threading
+import collections
+
+from otupy import ArrayOf,ActionTargets, ActionArguments, TargetEnum, Nsid, Version,Actions, Command, Response, StatusCode, StatusCodeDescription, Features, ResponseType, Feature, IPv4Net, IPv6Net
+from otupy.types.targets.bulk import collapse
+from otupy.actuators.SQLDatabase import SQLDatabase
+from otupy.actuators.nftables_manager import NftablesManager, NftExecutor
+import otupy.profiles.slpf as slpf
+
+logger = logging.getLogger(__name__)
+
+OPENC2VERS=Version(1,0)
+""" Supported OpenC2 Version """
+
+MY_IDS = {'hostname': None,
+			'named_group': None,
+			'asset_id': 'nftables',
+			'asset_tuple': None }
+
+NETWORKS = {'net_v4': IPv4Net, 'net_v6': IPv6Net}
+""" Kind of set that contains networks -> class of the networks """
+
+UNSUPPORTED_ARGS = ('start_time', 'stop_time', 'duration')
+""" Arguments accepted by the SLPF profile, but not implemented by this `Actuator` """
+
+AllowedCommandTarget = ActionTargets()
+""" Valid `Action`/`Target` pairs: those of the SLPF profile, plus IPv6 targets for `allow`/`deny` """
+for action, targets in slpf.AllowedCommandTarget.items():
+	AllowedCommandTarget[action] = list(targets)
+AllowedCommandTarget[Actions.allow] = [TargetEnum.ipv4_connection, TargetEnum.ipv6_connection,
+	TargetEnum.ipv4_net, TargetEnum.ipv6_net]
+AllowedCommandTarget[Actions.deny] = [TargetEnum.ipv4_connection, TargetEnum.ipv6_connection,
+	TargetEnum.ipv4_net, TargetEnum.ipv6_net]
+
+AllowedCommandArguments = ActionArguments()
+""" Valid `Args` for each `Action`/`Target` pair (IPv6 targets take the same `Args` as IPv4 ones) """
+for pair, args in slpf.AllowedCommandArguments.items():
+	AllowedCommandArguments[pair] = list(args)
+for action in (Actions.allow, Actions.deny):
+	AllowedCommandArguments[(action, TargetEnum.ipv6_net)] = AllowedCommandArguments[(action, TargetEnum.ipv4_net)]
+	AllowedCommandArguments[(action, TargetEnum.ipv6_connection)] = AllowedCommandArguments[(action, TargetEnum.ipv4_connection)]
+
+# An implementation of the slpf profile.
+class NftablesActuator:
+	""" Nftables SLPF implementation
+
+		This class provides an implementation of the SLPF `Actuator` for nftables.
+	"""
+
+	rate_limit = None
+	""" Maximum number of requests per minute, reported by `query features` (`None` if not limited) """
+
+	def __init__(self, args=None, db_name = "nftables_commands.db", executor=NftExecutor):
+		""" Create the actuator
+
+			The nftables table is created (or reset), and the rules found in the database are installed again.
+			:param db_name: The database of installed rules (not to be shared with other `Actuator`s).
+			:param executor: The executor of nft scripts (use `FakeNftExecutor` to run without root privileges).
+		"""
+		self.executor = executor
+		self.db = SQLDatabase(db_name)
+		self.db.init_db()
+		self.lock = threading.Lock()
+		self.members = {}
+		""" Set name -> Counter of the elements requested by the commands """
+		self.installed = {}
+		""" Set name -> elements in the nftables set """
+
+		script = NftablesManager.setup()
+		for verdict in NftablesManager.VERDICTS:
+			for kind in NftablesManager.SETS:
+				self.members[f"{verdict}_{kind}"] = collections.Counter()
+				self.installed[f"{verdict}_{kind}"] = set()
+		for rule_number, command in self.db.get_commands() or []:
+			entry = self.__parse(command)
+			if entry is None:
+				logger.warning("Skipping rule %s, not an nftables rule: %s", rule_number, command)
+				continue
+			set_name, element = entry
+			self.members[set_name][element] += 1
+		for set_name, members in self.members.items():
+			self.installed[set_name] = self.__elements(set_name, members)
+			script += NftablesManager.update(set_name, add=sorted(self.installed[set_name]))
+		if self.executor.run(script) != 200:
+			raise RuntimeError("Unable to set up nftables")
+
+	def run(self, cmd):
+
+		response = self.__check(cmd)
+		if response is not None:
+			return response
+
+		try:
+			match cmd.action:
+				case Actions.query:
+					response = self.query(cmd)
+				case Actions.allow:
+					response = self.allow(cmd)
+				case Actions.deny:
+					response = self.deny(cmd)
+				case Actions.delete:
+					response = self.delete(cmd)
+				case _:
+					response = self.__notimplemented(cmd)
+		except Exception as e:
+			return self.__servererror(cmd, e)
+
+		return response
+
+	def run_batch(self, cmds):
+		""" Run a batch of commands
+
+			All `allow` and `deny` commands in the batch are installed with a single nft script.
+			Any other command is run as by `run`.
+			:param cmds: A list of `Command`s.
+			:return: A list with the `Response` to each command.
+		"""
+		responses = [None] * len(cmds)
+		indexes = []
+		elements = []
+		for i, cmd in enumerate(cmds):
+			entry = None
+			if cmd.action in (Actions.allow, Actions.deny) and self.__check(cmd) is None:
+				entry = self.__entry(cmd)
+			if entry is None:
+				responses[i] = self.run(cmd)
+			else:
+				indexes.append(i)
+				elements.append(entry)
+
+		if elements:
+			for i, response in zip(indexes, self.__insert(elements)):
+				responses[i] = response
+		return responses
+
+	def __check(self, cmd):
+		""" Check that the command can be run by this Actuator
+
+			:param cmd: The `Command` to check.
+			:return: `None` if the command can be run, otherwise the `Response` with the error.
+		"""
+		# Check if the Command is compliant with the implemented profile
+		if not slpf.validate_command(cmd, AllowedCommandTarget):
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Invalid Action/Target pair')
+		if not slpf.validate_args(cmd, AllowedCommandArguments):
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Option not supported')
+		# Elements are shared by commands (and aggregated), so they cannot be given their own timeout
+		if cmd.args is not None and any(arg in cmd.args for arg in UNSUPPORTED_ARGS):
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Option not supported: ' + 
+				', '.join(arg for arg in UNSUPPORTED_ARGS if arg in cmd.args))
+
+		# Check if the Specifiers are actually served by this Actuator
+		try:
+			if not self.__is_addressed_to_actuator(cmd.actuator.getObj()):
+				return Response(status=StatusCode.NOTFOUND, status_text='Requested Actuator not available')
+		except AttributeError:
+			# If no actuator is given, execute the command
+			pass
+		except Exception as e:
+			return Response(status=StatusCode.INTERNALERROR, status_text='Unable to identify actuator')
+
+		return None
+
+	def __is_addressed_to_actuator(self, actuator):
+		""" Checks if this Actuator must run the command """
+		if len(actuator) == 0:
+			# Empty specifier: run the command
+			return True
+
+		for k,v in actuator.items():
+			try:
+				if v == MY_IDS[k]:
+					return True
+			except KeyError:
+				pass
+
+		return False
+
+	def query(self, cmd):
+		""" Query action
+
+			This method implements the `query` action.
+			:param cmd: The `Command` including `Target` and optional `Args`.
+			:return: A `Response` including the result of the query and appropriate status code and messages.
+		"""
+
+		# Sec. 4.1 Implementation of the 'query features' command
+		if cmd.args is not None:
+			if ( len(cmd.args) > 1 ):
+				return Response(status=StatusCode.BADREQUEST, status_text="Invalid query argument")
+			if ( len(cmd.args) == 1 ):
+				try:
+					if cmd.args['response_requested'] != ResponseType.complete:
+						raise KeyError
+				except KeyError:
+					return Response(status=StatusCode.BADREQUEST, status_text="Invalid query argument")
+
+		if ( cmd.target.getObj().__class__ == Features):
+			r = self.query_feature(cmd)
+		else:
+			return Response(status=StatusCode.BADREQUEST, status_text="Querying " + cmd.target.getName() + " not supported")
+
+		return r
+
+	def query_feature(self, cmd):
+		""" Query features
+
+			Implements the 'query features' command according to the requirements in Sec. 4.1 of the Language Specification.
+		"""
+		features = {}
+		for f in cmd.target.getObj():
+			match f:
+				case Feature.versions:
+					features[Feature.versions.name]=ArrayOf(Version)([OPENC2VERS])
+				case Feature.profiles:
+					pf = ArrayOf(Nsid)()
+					pf.append(Nsid(slpf.Profile.nsid))
+					features[Feature.profiles.name]=pf
+				case Feature.pairs:
+					features[Feature.pairs.name]=AllowedCommandTarget
+				case Feature.rate_limit:
+					if self.rate_limit is not None:
+						features[Feature.rate_limit.name]=self.rate_limit
+				case _:
+					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Invalid feature '" + f + "'")
+
+		res = None
+		try:
+			res = slpf.Results(features)
+		except Exception as e:
+			return self.__servererror(cmd, e)
+
+		return  Response(status=StatusCode.OK, status_text=StatusCodeDescription[StatusCode.OK], results=res)
+
+	def allow(self, cmd):
+		return self.__insert_handler(cmd)
+
+	def deny(self, cmd):
+		return self.__insert_handler(cmd)
+
+	def delete(self, cmd):
+		rule_number = int(cmd.target.getObj())
+		with self.lock:
+			cmd_data = self.db.get_command_from_rule_number(rule_number)
+			if cmd_data is None:
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+			entry = self.__parse(cmd_data[0])
+			if entry is None:
+				logger.warning("Rule %s is not an nftables rule: %s", rule_number, cmd_data[0])
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+			set_name, element = entry
+			if self.__update({set_name: [element]}, -1) != 200:
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+			if self.db.delete_command_by_rule_number(rule_number) < 0:
+				return Response(status=StatusCode.INTERNALERROR, status_text="Internal error")
+
+		return Response(status=StatusCode.OK, status_text="OK")
+
+	def __insert_handler(self, cmd):
+		entry = self.__entry(cmd)
+		if entry is None:
+			return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Target not supported")
+		return self.__insert([entry])[0]
+
+	def __entry(self, cmd):
+		""" The set and the element for an `allow`/`deny` command (`None` if the target is not supported) """
+		target = cmd.target.getObj()
+		set_name = NftablesManager.set_name(cmd.action.name, target)
+		if set_name is None:
+			return None
+		if isinstance(target, (IPv4Net, IPv6Net)):
+			return set_name, target
+		return set_name, NftablesManager.element(target)
+
+	def __parse(self, command):
+		""" The set and the element stored in the database (`None` if the command cannot be parsed) """
+		try:
+			set_name, element = command.split(" ", 1)
+			if set_name not in self.members:
+				return None
+			kind = set_name.split("_", 1)[1]
+			if kind in NETWORKS:
+				element = NETWORKS[kind](element)
+		except (ValueError, TypeError):
+			return None
+		return set_name, element
+
+	def __insert(self, entries):
+		""" Install the elements for a list of commands
+
+			:param entries: A list of (set name, element) pairs.
+			:return: The `Response` for each entry.
+		"""
+		elements = {}
+		for set_name, element in entries:
+			elements.setdefault(set_name, []).append(element)
+
+		responses = []
+		with self.lock:
+			if self.__update(elements, 1) != 200:
+				return [Response(status=StatusCode.INTERNALERROR, status_text="Internal error") for e in entries]
+			rule_numbers = self.db.insert_commands([f"{set_name} {element}" for set_name, element in entries])
+			for rule_number in rule_numbers:
+				if rule_number < 0:
+					responses.append(Response(status=StatusCode.INTERNALERROR, status_text="Internal error"))
+				else:
+					res = slpf.Results(rule_number=slpf.RuleID(rule_number))
+					responses.append(Response(status=StatusCode.OK, status_text="OK", results=res))
+		return responses
+
+	def __update(self, elements, delta):
+		""" Add or remove elements from the sets
+
+			Only the differences with the current content of the sets are applied, with a single nft script.
+			The lock must be held.
+			:param elements: Set name -> list of elements.
+			:param delta: 1 to add the elements, -1 to remove them.
+			:return: 200 if the sets have been updated, 500 otherwise.
+		"""
+		members = {}
+		installed = {}
+		script = ""
+		for set_name, values in elements.items():
+			members[set_name] = self.members[set_name].copy()
+			for v in values:
+				members[set_name][v] += delta
+			members[set_name] = +members[set_name]
+			installed[set_name] = self.__elements(set_name, members[set_name])
+			old = self.installed[set_name]
+			script += NftablesManager.update(set_name, add=sorted(installed[set_name] - old),
+				delete=sorted(old - installed[set_name]))
+
+		if script and self.executor.run(script) != 200:
+			return 500
+		self.members.update(members)
+		self.installed.update(installed)
+		return 200
+
+	def __elements(self, set_name, members):
+		""" The elements to install for the members of a set """
+		if set_name.split("_", 1)[1] in NETWORKS:
+			return {str(net) for net in collapse(list(members))}
+		return set(members)
+
+	def __notimplemented(self, cmd):
+		""" Default response
+
+			Default response returned in case an `Action` is not implemented.
+			The `cmd` argument is only present for uniformity with the other handlers.
+			:param cmd: The `Command` that triggered the error.
+			:return: A `Response` with the appropriate error code.
+
+		"""
+		return Response(status=StatusCode.NOTIMPLEMENTED, status_text='Command not implemented')
+
+	def __servererror(self, cmd, e):
+		""" Internal server error
+
+			Default response in case something goes wrong while processing the command.
+			:param cmd: The command that triggered the error.
+			:param e: The Exception returned.
+			:return: A standard INTERNALSERVERERROR response.
+		"""
+		logger.warning("Returning details of internal exception")
+		logger.warning("This is only meant for debugging: change the log level for production environments")
+		if(logging.root.level < logging.INFO):
+			return Response(status=StatusCode.INTERNALERROR, status_text='Internal server error: ' + str(e))
+		else:
+			return Response(status=StatusCode.INTERNALERROR, status_text='Internal server error')
@@ -0,0 +1,171 @@
+""" Nftables Manager
+
+	This module provides the translation of SLPF targets into nftables set elements, and the executors that
+	apply nft scripts.
+
+	All rules live in the `inet openc2` table. Addresses and connections are not matched by individual rules,
+	but by a fixed set of rules that look up named interval sets, so matching and updating costs do not grow
+	with the number of addresses. `allow` sets are looked up before `deny` sets.
+"""
+import subprocess
+import threading
+import logging
+
+from otupy import IPv4Net, IPv6Net, IPv4Connection, IPv6Connection
+
+logger = logging.getLogger(__name__)
+
+TABLE = "inet openc2"
+""" Family and name of the nftables table """
+
+class NftablesManager:
+	""" Builds nft scripts """
+
+	SETS = {
+		'net_v4': ("ipv4_addr", "ip saddr"),
+		'net_v6': ("ipv6_addr", "ip6 saddr"),
+		'conn_v4': ("ipv4_addr . ipv4_addr . inet_proto . inet_service . inet_service",
+			"ip saddr . ip daddr . meta l4proto . th sport . th dport"),
+		'conn_v6': ("ipv6_addr . ipv6_addr . inet_proto . inet_service . inet_service",
+			"ip6 saddr . ip6 daddr . meta l4proto . th sport . th dport"),
+	}
+	""" Kind of set -> (element type, matching expression) """
+
+	VERDICTS = {'allow': "accept", 'deny': "drop"}
+	""" Prefix of set names -> verdict of the rule that looks up the set (in order of evaluation) """
+
+	@staticmethod
+	def set_name(verdict, target):
+		""" Name of the set for a target
+
+			:param verdict: Either 'allow' or 'deny'.
+			:param target: `IPv4Net`, `IPv6Net`, `IPv4Connection`, or `IPv6Connection`.
+			:return: The name of the set, or `None` if the `target` is not supported.
+		"""
+		if isinstance(target, IPv4Net):
+			kind = 'net_v4'
+		elif isinstance(target, IPv6Net):
+			kind = 'net_v6'
+		elif isinstance(target, IPv4Connection):
+			kind = 'conn_v4'
+		elif isinstance(target, IPv6Connection):
+			kind = 'conn_v6'
+		else:
+			return None
+		return f"{verdict}_{kind}"
+
+	@staticmethod
+	def element(target):
+		""" Set element for a connection
+
+			Missing fields of the connection match any value.
+			:param target: `IPv4Connection` or `IPv6Connection`.
+			:return: The text of the set element.
+		"""
+		anyaddr = "0.0.0.0/0" if isinstance(target, IPv4Connection) else "::/0"
+		fields = [
+			str(target.src_addr) if target.src_addr is not None else anyaddr,
+			str(target.dst_addr) if target.dst_addr is not None else anyaddr,
+			target.protocol.name if target.protocol is not None else "0-255",
+			str(int(target.src_port)) if target.src_port is not None else "0-65535",
+			str(int(target.dst_port)) if target.dst_port is not None else "0-65535"]
+		return " . ".join(fields)
+
+	@staticmethod
+	def setup():
+		""" Create the table, the sets and the rules
+
+			The sets are flushed, so that their content can be restored.
+			:return: The nft script.
+		"""
+		lines = [f"add table {TABLE}",
+			f"add chain {TABLE} input {{ type filter hook input priority 0 ; policy accept ; }}",
+			f"flush chain {TABLE} input"]
+		for verdict in NftablesManager.VERDICTS:
+			for kind, (datatype, _) in NftablesManager.SETS.items():
+				name = f"{verdict}_{kind}"
+				lines.append(f"add set {TABLE} {name} {{ type {datatype} ; flags interval ; }}")
+				lines.append(f"flush set {TABLE} {name}")
+		for verdict, statement in NftablesManager.VERDICTS.items():
+			for kind, (_, expression) in NftablesManager.SETS.items():
+				lines.append(f"add rule {TABLE} input {expression} @{verdict}_{kind} {statement}")
+		return "\n".join(lines) + "\n"
+
+	@staticmethod
+	def update(set_name, add=(), delete=()):
+		""" Update the elements of a set
+
+			:param set_name: The name of the set.
+			:param add: Elements to add (text).
+			:param delete: Elements to delete (text).
+			:return: The nft script (empty if there is nothing to change).
+		"""
+		lines = []
+		if delete:
+			lines.append(f"delete element {TABLE} {set_name} {{ {', '.join(delete)} }}")
+		if add:
+			lines.append(f"add element {TABLE} {set_name} {{ {', '.join(add)} }}")
+		return "".join(l + "\n" for l in lines)
+
+
+class NftExecutor:
+	""" Runs nft scripts on the local host
+
+		Scripts are run with `nft -f -`, which applies them atomically. Root privileges are required.
+	"""
+
+	@staticmethod
+	def run(script):
+		""" Apply an nft script
+
+			:param script: The nft commands, one per line.
+			:return: 200 if the script has been applied, 500 otherwise.
+		"""
+		try:
+			subprocess.run(["nft", "-f", "-"], input=script.encode(), check=True,
+								stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		except (subprocess.CalledProcessError, OSError) as e:
+			logger.debug("Execution error for nft script: %s", script)
+			logger.debug("Exception: %s", str(e))
+			return 500
+		logger.debug("Script executed successfully: %s", script)
+		return 200
+
+class FakeNftExecutor:
+	""" Simulates nft
+
+		This executor records the scripts and keeps the elements of each set, so that the `NftablesActuator` can
+		be tested without root privileges. As with nft, a script is applied atomically, and deleting a missing
+		element makes the whole script fail.
+	"""
+
+	def __init__(self):
+		self.scripts = []
+		""" The scripts that have been run """
+		self.sets = {}
+		""" Set name -> set of elements """
+		self.lock = threading.Lock()
+
+	def run(self, script):
+		with self.lock:
+			self.scripts.append(script)
+			sets = {name: set(elements) for name, elements in self.sets.items()}
+			for line in script.splitlines():
+				words = line.split()
+				if words[:2] == ['add', 'set']:
+					sets.setdefault(words[4], set())
+				elif words[:2] == ['flush', 'set']:
+					sets[words[4]] = set()
+				elif words[:1] in (['add'], ['delete']) and words[1:2] == ['element']:
+					elements = line[line.index('{')+1:line.rindex('}')].split(',')
+					target = sets.get(words[4])
+					for e in elements:
+						e = e.strip()
+						if target is None or (words[0] == 'delete' and e not in target):
+							return 500
+						if words[0] == 'add':
+							target.add(e)
+						else:
+							target.remove(e)
+			self.sets = sets
+			return 200
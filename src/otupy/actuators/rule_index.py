@@ -0,0 +1,141 @@
+""" Rule index
+
+	This module provides an in-memory index of the rules installed by an SLPF actuator, which is used to detect
+	duplicated, shadowed, and conflicting rules before they are installed.
+
+	Rules are described by their action and by a normalized 5-tuple (protocol, source network, source port,
+	destination network, destination port), where missing fields match any value. An `ipv4_net` target is the
+	5-tuple with the source network only.
+"""
+import threading
+
+from otupy import IPv4Net, IPv4Connection
+
+ANY = IPv4Net()
+""" Network that matches any address """
+
+def key(target):
+	""" Normalized 5-tuple of a target
+
+		:param target: `IPv4Net` or `IPv4Connection`.
+		:return: The 5-tuple, or `None` if the `target` is not supported.
+	"""
+	if isinstance(target, IPv4Net):
+		return (None, target, None, ANY, None)
+	if isinstance(target, IPv4Connection):
+		return (target.protocol.name if target.protocol is not None else None,
+			target.src_addr if target.src_addr is not None else ANY,
+			int(target.src_port) if target.src_port is not None else None,
+			target.dst_addr if target.dst_addr is not None else ANY,
+			int(target.dst_port) if target.dst_port is not None else None)
+	return None
+
+def key_from_command(cmd):
+	""" Normalized 5-tuple and iptables target of an iptables command
+
+		:param cmd: An iptables command, as created by `IptablesManager.build_rule`.
+		:return: A pair (5-tuple, iptables target), or `None` if the command cannot be parsed.
+	"""
+	options = {}
+	args = cmd.split()
+	try:
+		for i in range(len(args)):
+			if args[i] in ('-p', '-s', '-d', '--sport', '--dport', '-j'):
+				options[args[i]] = args[i+1]
+		return ((options.get('-p'),
+			IPv4Net(options['-s']) if '-s' in options else ANY,
+			int(options['--sport']) if '--sport' in options else None,
+			IPv4Net(options['-d']) if '-d' in options else ANY,
+			int(options['--dport']) if '--dport' in options else None), options['-j'])
+	except (IndexError, KeyError, ValueError):
+		return None
+
+def covers(a, b):
+	""" Check whether all the packets matched by the 5-tuple `b` are also matched by `a` """
+	return (a[0] is None or a[0] == b[0]) and b[1] in a[1] and (a[2] is None or a[2] == b[2]) and \
+		b[3] in a[3] and (a[4] is None or a[4] == b[4])
+
+class RuleIndex:
+	""" Index of installed rules
+
+		Exact duplicates are found with a single dictionary lookup. Rules that cover a new one are searched
+		by source network, with a lookup for each prefix length in use (at most 33), and then checked on the
+		remaining fields.
+
+		The index is thread-safe.
+	"""
+
+	def __init__(self):
+		self._rules = {}
+		""" rule_number -> (action, 5-tuple) """
+		self._exact = {}
+		""" (action, 5-tuple) -> set of rule_numbers """
+		self._sources = {}
+		""" prefix length of the source -> source address -> set of rule_numbers """
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._rules)
+
+	def add(self, rule_number, action, key):
+		""" Add a rule
+
+			:param rule_number: The identifier of the rule.
+			:param action: The action of the rule (e.g., the iptables target).
+			:param key: The 5-tuple of the rule.
+		"""
+		addr, prefix = key[1].network()
+		with self._lock:
+			self._rules[rule_number] = (action, key)
+			self._exact.setdefault((action, key), set()).add(rule_number)
+			self._sources.setdefault(prefix, {}).setdefault(addr, set()).add(rule_number)
+
+	def remove(self, rule_number):
+		""" Remove a rule (if present) """
+		with self._lock:
+			try:
+				action, key = self._rules.pop(rule_number)
+			except KeyError:
+				return
+			self.__discard(self._exact, (action, key), rule_number)
+			addr, prefix = key[1].network()
+			self.__discard(self._sources[prefix], addr, rule_number)
+			if not self._sources[prefix]:
+				del self._sources[prefix]
+
+	@staticmethod
+	def __discard(index, k, rule_number):
+		rules = index[k]
+		rules.discard(rule_number)
+		if not rules:
+			del index[k]
+
+	def find(self, action, key):
+		""" Find an identical rule
+
+			:return: The lowest rule_number of the rules with the same action and 5-tuple (`None` if there is none).
+		"""
+		with self._lock:
+			rules = self._exact.get((action, key))
+			return min(rules) if rules else None
+
+	def covering(self, key):
+		""" Find the rule that takes precedence over a new rule
+
+			Looks for installed rules that match all the packets matched by `key`, which makes a new rule
+			with this `key` useless. Since rules are applied in order, the first one (i.e., the lowest rule_number)
+			is returned.
+			:param key: The 5-tuple of the new rule.
+			:return: A pair (rule_number, action), or `None` if no rule covers `key`.
+		"""
+		addr, prefix = key[1].network()
+		found = None
+		with self._lock:
+			for length, sources in self._sources.items():
+				if length > prefix:
+					continue
+				mask = IPv4Net._netmask(length)
+				for rule_number in sources.get(addr & mask, ()):
+					if (found is None or rule_number < found) and covers(self._rules[rule_number][1], key):
+						found = rule_number
+			return (found, self._rules[found][0]) if found is not None else None
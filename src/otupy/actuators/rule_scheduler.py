@@ -0,0 +1,166 @@
+""" Rule scheduler
+
+	This module provides the timers that activate and expire rules at the times requested by the `start_time`,
+	`stop_time`, and `duration` arguments of SLPF commands.
+
+	Times are expressed in milliseconds from the epoch, as OpenC2 `DateTime`. Timers are kept in a heap, so
+	scheduling, cancelling, and firing a timer cost O(log n). Timers that are due at (about) the same time are
+	fired together, so that the `Actuator` can apply all the changes in a single firewall transaction.
+"""
+import heapq
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def now():
+	""" Current time (milliseconds from the epoch) """
+	return int(time.time() * 1000)
+
+def times(args, current=None):
+	""" Activation and expiration times of a rule
+
+		At most two arguments among `start_time`, `stop_time`, and `duration` can be given (Sec. 3.3.1.4 of the
+		Language Specification).
+		:param args: The `Args` of the command (or `None`).
+		:param current: The current time (defaults to `now()`).
+		:return: A pair (start, stop). `start` is `None` if the rule must be installed immediately, `stop` is `None`
+			if the rule never expires.
+		:raise ValueError: if the arguments are inconsistent or the rule would already be expired.
+	"""
+	if args is None:
+		return None, None
+	start = args.get('start_time')
+	stop = args.get('stop_time')
+	duration = args.get('duration')
+	if start is not None and stop is not None and duration is not None:
+		raise ValueError("Only two of start_time, stop_time, and duration can be given")
+
+	current = now() if current is None else current
+	start = int(start) if start is not None else None
+	stop = int(stop) if stop is not None else None
+	if duration is not None:
+		if stop is not None:
+			start = stop - int(duration)
+		else:
+			stop = (start if start is not None else current) + int(duration)
+	if stop is not None:
+		if stop <= current:
+			raise ValueError("The rule would be already expired")
+		if start is not None and start >= stop:
+			raise ValueError("stop_time must follow start_time")
+	if start is not None and start <= current:
+		start = None
+	return start, stop
+
+class RuleScheduler:
+	""" Timers of the rules
+
+		A single background thread waits for the next timer and invokes the `fire` callback with the rule_numbers
+		of all the timers that are due within `slack` milliseconds. Each rule has at most one pending timer:
+		scheduling a rule again replaces its timer.
+
+		The thread is started when the first timer is scheduled.
+	"""
+
+	def __init__(self, fire, slack=50):
+		""" Create the scheduler
+
+			:param fire: The function invoked with the list of the rule_numbers whose timers are due.
+			:param slack: Timers due within `slack` milliseconds from the first one are fired together.
+		"""
+		self.fire = fire
+		self.slack = slack
+		self._heap = []
+		""" (time, rule_number), including cancelled timers """
+		self._timers = {}
+		""" rule_number -> time """
+		self._cond = threading.Condition()
+		self._thread = None
+		self._closed = False
+
+	def __len__(self):
+		return len(self._timers)
+
+	def schedule(self, rule_number, when):
+		""" Set the timer of a rule
+
+			:param rule_number: The rule.
+			:param when: The time of the timer (milliseconds from the epoch).
+		"""
+		self.schedule_many({rule_number: when})
+
+	def schedule_many(self, timers):
+		""" Set the timers of several rules
+
+			:param timers: A dictionary rule_number -> time (or a list of pairs).
+		"""
+		timers = dict(timers)
+		if not timers:
+			return
+		with self._cond:
+			self._timers.update(timers)
+			entries = [(when, rule_number) for rule_number, when in timers.items()]
+			if len(entries) > len(self._heap):
+				self._heap.extend(entries)
+				heapq.heapify(self._heap)
+			else:
+				for entry in entries:
+					heapq.heappush(self._heap, entry)
+			if self._thread is None and not self._closed:
+				self._thread = threading.Thread(target=self._run, daemon=True)
+				self._thread.start()
+			self._cond.notify()
+
+	def cancel(self, rule_number):
+		""" Cancel the timer of a rule (if any) """
+		with self._cond:
+			self._timers.pop(rule_number, None)
+
+	def close(self):
+		""" Stop the scheduler (pending timers are not fired) """
+		with self._cond:
+			self._closed = True
+			self._cond.notify()
+		if self._thread is not None:
+			self._thread.join()
+
+	def _run(self):
+		while True:
+			with self._cond:
+				due = self._wait()
+			if due is None:
+				return
+			try:
+				self.fire(due)
+			except Exception as e:
+				logger.exception("Unable to run the timers of rules %s", due)
+
+	def _wait(self):
+		""" Wait for the next timers (the lock must be held)
+
+			:return: The rule_numbers of the timers that are due, or `None` if the scheduler has been closed.
+		"""
+		heap = self._heap
+		while not self._closed:
+			# Drop cancelled and replaced timers
+			while heap and self._timers.get(heap[0][1]) != heap[0][0]:
+				heapq.heappop(heap)
+			if not heap:
+				self._cond.wait()
+				continue
+			delay = heap[0][0] - now()
+			if delay > 0:
+				self._cond.wait(delay / 1000)
+				continue
+
+			due = []
+			limit = heap[0][0] + self.slack
+			while heap and heap[0][0] <= limit:
+				when, rule_number = heapq.heappop(heap)
+				if self._timers.get(rule_number) == when:
+					del self._timers[rule_number]
+					due.append(rule_number)
+			return due
+		return None
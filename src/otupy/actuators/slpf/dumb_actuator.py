@@ -17,6 +17,9 @@ OPENC2VERS=Version(1,0)
 # A dumb actuator that does not implement any function but can
 # be used to test the openc2 communication.
 class DumbActuator:
+	rate_limit = None
+	""" Maximum number of requests per minute, reported by `query features` (`None` if not limited) """
+
 	def run(self, cmd):
 
 		try:
@@ -87,7 +90,8 @@ class DumbActuator:
 				case Feature.pairs:
 					features[Feature.pairs.name]=[]
 				case Feature.rate_limit:
-					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Feature 'rate_limit' not yet implemented")
+					if self.rate_limit is not None:
+						features[Feature.rate_limit.name]=self.rate_limit
 				case _:
 					return Response(status=StatusCode.NOTIMPLEMENTED, status_text="Invalid feature '" + str(f) + "'")
 
@@ -5,13 +5,22 @@ to the Actuators.
 """
 
 import logging
+import threading
+import concurrent.futures
 
-from otupy.types.data import DateTime, ResponseType
+from otupy.types.data import DateTime, ResponseType, Feature
+from otupy.types.targets import Features
 
 from otupy.core.encoder import Encoder
 from otupy.core.transfer import Transfer
 from otupy.core.message import Message
+from otupy.core.actions import Actions
 from otupy.core.response import Response, StatusCode, StatusCodeDescription
+from otupy.core.results import Results
+from otupy.core.execution import ExecutionEngine
+from otupy.core.routing import RoutingTable
+from otupy.core.ratelimit import RateLimiter
+from otupy.core.idempotency import ResponseCache
 
 logger = logging.getLogger(__name__)
 
@@ -31,9 +40,29 @@ class Consumer:
 		Each `Consumer` will only run a single `Transfer` protocol. All registered `Encoder`s can be used,
 		and a default `Encoder` is explicitely given that will be used when no other selection is available 
 		(e.g., to answer Messages that the Consumer does not understand).
+
+		`Command`s that request an `ack` or `status` response are run in background by an `ExecutionEngine`; 
+		their final `Response` can be retrieved with `result`, from the Producer and the `request_id` or `command_id`.
+
+		`Command`s addressed to several `Actuator`s (e.g., without `asset_id`) are run by all of them 
+		concurrently, and their `Response`s are merged.
+
+		`Actuator`s are selected through a `RoutingTable`. They can be added and removed at runtime 
+		(`add_actuator`, `remove_actuator`).
+
+		Request rates can be limited for each Producer and for each `Actuator`. `Command`s that exceed the
+		limits are rejected with `SERVICEUNAVAILABLE`, and the limit is reported to `query features`.
+
+		Duplicated `Message`s (same Producer and `request_id`, or same Producer and `command_id`) are answered
+		with the `Response` to the first one, without running the `Command` again (see `ResponseCache`).
+
+		The threads and the database used by the `Consumer` are released by `close`.
 		
 	"""
-	def __init__(self, consumer: str, actuators: [] =None, encoder: Encoder = None, transfer: Transfer = None):
+	def __init__(self, consumer: str, actuators: [] =None, encoder: Encoder = None, transfer: Transfer = None, 
+			workers: int = 4, max_pending: int = 1000, notify = None, timeout: float = None, 
+			rate_limit: int = None, actuator_rate_limit: int = None,
+			dedup_size: int = 10000, dedup_ttl: float = 300, dedup_db: str = None):
 		""" Create a `Consumer`
 			:param consumer: This is a string that identifies the `Consumer` and is used in `from` 
 				and `to` fields of the OpenC2 `Message` (see Table 3.1 of the Language Specification.
@@ -41,14 +70,91 @@ class Consumer:
 				`Actuator` instances that will be used by the `Consumer`.
 			:param encoder: This is an instance of the `Encoder` that will be used by default.
 			:param transfer: This is the `Transfer` protocol that will be used to send/receive `Message`s.
+			:param workers: Maximum number of `Command`s run in background at the same time.
+			:param max_pending: Maximum number of `Command`s waiting to be run in background. Further
+				`Command`s are rejected with `SERVICEUNAVAILABLE`.
+			:param notify: A function invoked with the `Message` that carries the final `Response` of `Command`s 
+				that requested a `status` response (e.g., to push it back to the Producer).
+			:param timeout: Maximum time to wait for each `Actuator`, when a `Command` is run by several
+				`Actuator`s (seconds). `None` to wait indefinitely. Note that an `Actuator` that does not
+				return keeps its thread busy after the timeout.
+			:param rate_limit: Maximum number of requests per minute from each Producer (`None` for no limit).
+			:param actuator_rate_limit: Maximum number of requests per minute to each `Actuator` (`None` for no limit).
+			:param dedup_size: Number of recent `Command`s remembered to detect duplicates (0 to disable).
+			:param dedup_ttl: Time a `Command` is remembered to detect duplicates (seconds).
+			:param dedup_db: The sqlite database that stores the recent `Command`s, to detect duplicates
+				after a restart (`None` to only keep them in memory).
 		"""
 		self.consumer = consumer
 		self.encoder = encoder
 		self.transfer = transfer
-		self.actuators = actuators
+		self.routes = RoutingTable(actuators)
+		self.notify = notify
+		self.engine = ExecutionEngine(workers, max_pending)
+		self.timeout = timeout
+		self.pool = None
+		""" Runs `Command`s addressed to several `Actuator`s (one thread for each `Actuator`) """
+		self.__pool_size = 0
+		self.__pool_lock = threading.Lock()
+		self.__resize()
+		self.producer_limits = RateLimiter(rate_limit) if rate_limit is not None else None
+		self.actuator_limits = RateLimiter(actuator_rate_limit) if actuator_rate_limit is not None else None
+		limits = [r for r in (rate_limit, actuator_rate_limit) if r is not None]
+		self.rate_limit = min(limits) if limits else None
+		""" Rate limit reported to `query features` (requests per minute) """
+		self.cache = ResponseCache(dedup_size, dedup_ttl, dedup_db) if dedup_size else None
+		""" Responses to recent `Command`s """
 
 		# TODO: Read configuration from file
 
+	@property
+	def actuators(self):
+		""" The available `Actuator`s: a dictionary (profile, asset_id) -> `Actuator` """
+		return dict(self.routes.items())
+
+	def add_actuator(self, profile, asset_id, actuator, **specifiers):
+		""" Add (or replace) an `Actuator`
+
+			:param profile: The namespace identifier of the profile implemented by the `Actuator`.
+			:param asset_id: The identifier of the `Actuator`.
+			:param actuator: The `Actuator` instance.
+			:param specifiers: Other specifiers that select this `Actuator` (e.g., `hostname`, `named_group`).
+		"""
+		self.routes.add(profile, asset_id, actuator, **specifiers)
+		self.__resize()
+
+	def remove_actuator(self, profile, asset_id):
+		""" Remove an `Actuator`
+
+			:raise KeyError: if the `Actuator` is unknown.
+		"""
+		self.routes.remove(profile, asset_id)
+
+	def close(self, wait=True):
+		""" Release the resources of the `Consumer`
+
+			Background `Command`s already accepted are still run; further `Command`s are not accepted.
+			The `Transfer` and the `Actuator`s are not closed.
+			:param wait: Wait for the running `Command`s to complete.
+		"""
+		self.engine.shutdown(wait)
+		with self.__pool_lock:
+			self.pool.shutdown(wait, cancel_futures=True)
+		if self.cache is not None:
+			self.cache.close()
+
+	def __resize(self):
+		""" Grow the fan-out pool to the number of `Actuator`s """
+		with self.__pool_lock:
+			size = max(1, len(self.routes))
+			if size <= self.__pool_size:
+				return
+			old, self.pool = self.pool, concurrent.futures.ThreadPoolExecutor(size, thread_name_prefix='otupy-fanout')
+			self.__pool_size = size
+		if old is not None:
+			# Commands already submitted to the old pool are completed by its threads
+			old.shutdown(wait=False)
+
 	# TODO: Manage non-blocking implementation of the Transfer.receive() function
 	def run(self, encoder: Encoder = None, transfer: Transfer = None):
 		"""Runs a `Consumer`
@@ -89,6 +195,16 @@ class Consumer:
 			:return: A `Message` that embeds the `Response` (from the `Actuator` or elaborated by the `Consumer` in
 					case of errors).
 		"""
+		if self.cache is None:
+			return self.__respmsg(msg, self.__process(msg))
+		keys = ((msg.from_, msg.request_id), (msg.from_, getattr(msg.content, 'command_id', None)))
+		return self.__respmsg(msg, self.cache.run(keys, lambda: self.__process(msg)))
+
+	def __process(self, msg):
+		""" Select the `Actuator`s and run the `Command`
+
+			:return: The `Response` to the `Command`.
+		"""
 		#TODO: The logic to select the actuator that matches the request
 		# OC2 Architecture, Sec. 2.1:
 		# The Profile field, if present, specifies the profile that defines the function 
@@ -110,27 +226,18 @@ class Consumer:
 			# TODO: how to mix responses from multiple actuators?
 			# Workaround: strictly require a profile to be present
 			response = Response(status=StatusCode.BADREQUEST, status_text='Missing profile')
-			return self.__respmsg(msg, response)
-
-		try:
-			asset_id = msg.content.actuator.getObj()['asset_id']
-		except KeyError:
-			# assed_id = None means the default actuator that implements the required profile
-			asset_id = None
+			return response
 
 		try:
-			if profile == None:
-				# Select all actuators
-				actuator = list(self.actuators.values())
-			elif asset_id == None:
-				# Select all actuators that implement the specific profile
-				actuator = list(dict(filter(lambda p: p[0][0]==profile, self.actuators.items())).values())
-			else:
-				# Only one instance is expected to be present in this case
-				actuator = [self.actuators[(profile,asset_id)]]
+			# asset_id = None means the default actuator that implements the required profile
+			actuator = self.routes.route(profile, msg.content.actuator.getObj())
 		except KeyError:
 			response = Response(status=StatusCode.NOTFOUND, status_text='No actuator available')
-			return self.__respmsg(msg, response)
+			return response
+
+		response = self.__throttle(msg, actuator)
+		if response is not None:
+			return response
 
 		response_content = None
 		if msg.content.args:
@@ -139,13 +246,9 @@ class Consumer:
 					case ResponseType.none:
 						response_content = None
 					case ResponseType.ack:
-						response_content = Response(status=StatusCode.PROCESSING, status_text=StatusCodeDescription[StatusCode.PROCESSING])
-						# TODO: Spawn a process to run the process offline
-						logger.warn("Command: %s not run! -- Missing code")
+						response_content = self.__submit(msg, actuator)
 					case ResponseType.status:
-						response_content = Response(status=StatusCode.PROCESSING, status_text=StatusCodeDescription[StatusCode.PROCESSING])
-						# TODO: Spawn a process to run the process offline
-						logger.warn("Command: %s not run! -- Missing code")
+						response_content = self.__submit(msg, actuator, self.notify)
 					case ResponseType.complete:
 						response_content = self.__runcmd(msg, actuator)
 					case _:
@@ -157,21 +260,130 @@ class Consumer:
 					
 		logger.debug("Actuator %s returned: %s", actuator, response_content)
 
-		# Add the metadata to be returned to the Producer
-		return self.__respmsg(msg, response_content)
+		return response_content
+
+	def result(self, producer, id, timeout=None):
+		""" Final `Response` of a `Command` run in background
+
+			:param producer: The Producer that sent the `Command` (`from` field of the `Message`).
+			:param id: The `request_id` of the `Message` or the `command_id` of the `Command`.
+			:param timeout: Time to wait for the `Command` to complete (seconds). `None` to not wait.
+			:return: The `Response`, a `PROCESSING` `Response` if the `Command` is still running, or `None` if
+				`id` is unknown (or too old).
+		"""
+		return self.engine.result((producer, id), timeout)
+
+	def __submit(self, msg, actuator, notify=None):
+		# Run the command in background and acknowledge it
+		callback = None
+		if notify is not None:
+			callback = lambda response: notify(self.__respmsg(msg, response))
+		# Identifiers are only unique for each Producer
+		keys = [(msg.from_, id) for id in (msg.request_id, getattr(msg.content, 'command_id', None)) if id is not None]
+		queue = tuple(a for _, a in actuator)
+		try:
+			if not self.engine.submit(queue, lambda: self.__runcmd(msg, actuator), keys, callback):
+				return Response(status=StatusCode.SERVICEUNAVAILABLE, status_text='Too many pending commands')
+		except RuntimeError:
+			return Response(status=StatusCode.SERVICEUNAVAILABLE, status_text='Consumer closed')
+		return Response(status=StatusCode.PROCESSING, status_text=StatusCodeDescription[StatusCode.PROCESSING])
 
 	def __runcmd(self, msg, actuator):
 		# Run the command and collect the response
-		# TODO: Define how to manage concurrent execution from more than one actuator
+		if len(actuator) != 1:
+			return self.__advertise(msg, self.__fanout(msg, actuator))
 		try:
-			# TODO: How to merge multiple responses?
-			# for a in actuators.items(): 
-			logger.info("Dispatching command to: %s", actuator[0])
-			response_content = actuator[0].run(msg.content) 
+			logger.info("Dispatching command to: %s", actuator[0][1])
+			response_content = actuator[0][1].run(msg.content) 
 		except (IndexError,AttributeError):
 			response_content = Response(status=StatusCode.NOTFOUND, status_text='No actuator available')
 
-		return response_content
+		return self.__advertise(msg, response_content)
+
+	def __throttle(self, msg, actuator):
+		""" Enforce the rate limits
+
+			:return: `None` if the command can be run, otherwise a `SERVICEUNAVAILABLE` `Response` that tells when
+				to retry.
+		"""
+		delay = 0
+		if self.producer_limits is not None:
+			delay = self.producer_limits.take(msg.from_)
+		if self.actuator_limits is not None and not delay:
+			# Actuators are only charged for the commands that the producer was allowed to send
+			delay = max([self.actuator_limits.take(key) for key, _ in actuator], default=0)
+		if delay:
+			return Response(status=StatusCode.SERVICEUNAVAILABLE, status_text=f"Rate limit exceeded, retry after {delay:.3f} s")
+		return None
+
+	def __advertise(self, msg, response):
+		""" Report the rate limit to `query features` """
+		if self.rate_limit is None or not response or response['status'] != StatusCode.OK:
+			return response
+		target = msg.content.target.getObj()
+		if msg.content.action != Actions.query or not isinstance(target, Features) or Feature.rate_limit not in target:
+			return response
+		results = response.get('results')
+		if results is None:
+			results = response['results'] = Results()
+		if results.get('rate_limit') is None or results['rate_limit'] > self.rate_limit:
+			results['rate_limit'] = self.rate_limit
+		return response
+
+	def __fanout(self, msg, actuator):
+		""" Run the command on several actuators concurrently
+
+			Each actuator is given at most `timeout` seconds, so the overall latency is that of the slowest
+			actuator (or `timeout`), not the sum of their latencies.
+			:param msg: The `Message` that carries the `Command`.
+			:param actuator: A list of ((profile, asset_id), actuator) pairs.
+			:return: The merged `Response`.
+		"""
+		if not actuator:
+			return Response(status=StatusCode.NOTFOUND, status_text='No actuator available')
+		logger.info("Dispatching command to: %s", [a for _, a in actuator])
+		try:
+			with self.__pool_lock:
+				futures = [self.pool.submit(a.run, msg.content) for _, a in actuator]
+		except RuntimeError:
+			return Response(status=StatusCode.SERVICEUNAVAILABLE, status_text='Consumer closed')
+		concurrent.futures.wait(futures, self.timeout)
+
+		responses = {}
+		for (key, a), future in zip(actuator, futures):
+			if not future.done():
+				future.cancel()
+				responses[key[1]] = Response(status=StatusCode.SERVICEUNAVAILABLE, status_text='Timeout')
+			elif future.exception() is not None or not future.result():
+				logger.warning("Actuator %s failed: %s", key, future.exception())
+				responses[key[1]] = Response(status=StatusCode.INTERNALERROR, status_text='Internal server error')
+			else:
+				responses[key[1]] = future.result()
+		return self.merge(responses)
+
+	@staticmethod
+	def merge(responses):
+		""" Merge the `Response`s of several actuators
+
+			The status is the one shared by all `Response`s or, if they differ, the highest (i.e., most severe)
+			status code. The status text lists the status of each actuator. `Results` are merged, with fields 
+			from earlier `Response`s taking precedence.
+			:param responses: A dictionary asset_id -> `Response`.
+			:return: The merged `Response`.
+		"""
+		statuses = [r['status'] for r in responses.values()]
+		status = statuses[0] if len(set(statuses)) == 1 else max(statuses, key=lambda s: int(s.value))
+		status_text = "; ".join(f"{asset_id}: {int(r['status'].value)} {r.get('status_text') or StatusCodeDescription.get(r['status'], '')}".strip() 
+			for asset_id, r in responses.items())
+
+		results = [r['results'] for r in responses.values() if r.get('results') is not None]
+		if results:
+			try:
+				results = type(results[0])(*[dict(r) for r in reversed(results)])
+			except (KeyError, TypeError, ValueError):
+				results = results[0]
+			return Response(status=status, status_text=status_text, results=results)
+		return Response(status=status, status_text=status_text)
 
 	def __respmsg(self, msg, response):
 		if response:
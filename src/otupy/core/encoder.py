@@ -8,11 +8,13 @@ import copy
 import aenum
 import enum
 import logging
+import dataclasses
 
 logger = logging.getLogger(__name__)
 """ Logging features
 
-	Most of logging from this modules are conceived for debugging only.
+	Most of logging from this modules are conceived for debugging only. Per-object logging is only
+	available through the `Tracer`.
 """
 
 _UNCODED = (bool, str, int, float)
@@ -23,6 +25,440 @@ _NOTSTRING = (bool, int, float)
 class EncoderError(Exception):
 	pass
 
+_todict_functions = {}
+""" Compiled encoding plans
+
+	Cache of the functions that convert otupy objects into the intermediary dictionary representation,
+	indexed by `Encoder` class. Each function keeps the plans compiled for that `Encoder`: a plan is
+	compiled the first time an object of a given class is encoded, and it is indexed by that class. 
+	For internal use only.
+"""
+
+def _todict_function(encoder):
+	""" Get the function that converts objects to dictionaries for an `Encoder` class """
+	try:
+		return _todict_functions[encoder]
+	except KeyError:
+		todict = _todict_functions[encoder] = _make_todict(encoder)
+		return todict
+
+def _make_todict(encoder):
+	""" Build the function that converts objects to dictionaries for an `Encoder` class """
+	plans = {}
+
+	def todict(obj):
+		""" Convert object to dictionary by running the plan compiled for its class """
+		plan = plans.get(type(obj))
+		if plan is None:
+			plan = _compile_todict(type(obj), todict, encoder)
+			if _tracer is not None:
+				plan = _tracer.wrap('todict', type(obj), plan)
+			plans[type(obj)] = plan
+		return plan(obj)
+
+	return todict
+
+def _compile_todict(cls, todict, encoder):
+	""" Compile the encoding plan for a class
+
+		The classes listed in the `todict_overrides` of the `Encoder` are converted by the given functions.
+		Otherwise, the plan is selected by looking at the `todict` method resolved for `cls`. The base 
+		structures (`Record`, `Map`, `Choice`, `Array`, `Enumerated`) are translated by specialized functions
+		that do not go through the `todict` method of the object. Classes that provide their own
+		`todict` method are encoded by invoking it. Classes with no `todict` method are encoded as
+		basic types.
+		:param cls: The class of the objects to encode.
+		:param todict: The function used to convert inner objects.
+		:param encoder: The `Encoder` class the plan is compiled for.
+		:return: A function that takes an instance of `cls` and returns its intermediary representation.
+	"""
+	# Imported here because base types need the `EncoderError` defined in this module
+	from otupy.types.base import Record, Map, Choice, Enumerated, EnumeratedID, Array
+
+	for base in cls.__mro__:
+		if base in encoder.todict_overrides:
+			return encoder.todict_overrides[base]
+
+	method = getattr(cls, 'todict', None)
+	if method is None:
+		if issubclass(cls, list):
+			return _list_todict(todict)
+		if issubclass(cls, dict):
+			return _dict_todict(todict)
+		if issubclass(cls, _NOTSTRING):
+			return _notstring_todict
+		# Default: return a string representation of the object
+		return str
+	if method is Record.todict:
+		return _compile_record_todict(cls, todict)
+	if method is Map.todict:
+		return _compile_map_todict(cls, todict)
+	if method is Choice.todict:
+		return _choice_todict(todict)
+	if method is Array.todict:
+		return _list_todict(todict)
+	if method is Enumerated.todict:
+		return _enumerated_todict
+	if method is EnumeratedID.todict:
+		return _enumeratedid_todict
+	return _method_todict(todict, encoder)
+
+def _compile_record_todict(cls, todict):
+	""" Compile the encoding plan for a `Record`
+
+		Records keep their fields as instance attributes. The translation of attribute names
+		into field names (removal of the trailing '_' used to avoid clashes with Python keywords,
+		and exclusion of private attributes) is computed once for each attribute and then 
+		reused.
+	"""
+	fieldnames = {}
+
+	def record_todict(obj):
+		dic = {}
+		for k, v in vars(obj).items():
+			try:
+				name = fieldnames[k]
+			except KeyError:
+				name = fieldnames[k] = _record_fieldname(k)
+			if name is not None and v is not None:
+				dic[name] = todict(v)
+		return dic
+
+	return record_todict
+
+def _record_fieldname(attr):
+	""" Field name corresponding to a `Record` attribute (`None` for attributes that are not serialized) """
+	if not isinstance(attr, str):
+		return None
+	# Fix keywords corresponding to variable names that clash with Python keywords
+	if attr.endswith('_'):
+		attr = attr.rstrip('_')
+	if attr.startswith('_'):
+		return None
+	return attr
+
+def _compile_map_todict(cls, todict):
+	""" Compile the encoding plan for a `Map`
+
+		Fields defined by extensions are moved under the namespace identifier of the Profile, 
+		while fields of the base class are left at the top level.
+	"""
+	if cls.base is None:
+		return _dict_todict(todict)
+
+	nsid = cls.nsid
+	fieldtypes = cls.fieldtypes
+	basetypes = cls.base.fieldtypes
+
+	def map_todict(obj):
+		ext = {}
+		newdic = {nsid: ext}
+		# Lazy fields that have not been accessed are encoded as they were received
+		for k, v in dict.items(obj):
+			if k not in fieldtypes:
+				raise ValueError('Unknown field: ', k)
+			if v is None:
+				continue
+			if k in basetypes:
+				newdic[todict(k)] = todict(v)
+			else:
+				ext[todict(k)] = todict(v)
+		return newdic
+
+	return map_todict
+
+def _dict_todict(todict):
+	def dict_todict(dic):
+		newdic = {}
+		for k, v in dict.items(dic):
+			if v is not None:
+				newdic[todict(k)] = todict(v)
+		return newdic
+	return dict_todict
+
+def _list_todict(todict):
+	def list_todict(lis):
+		return [todict(i) for i in lis]
+	return list_todict
+
+def _choice_todict(todict):
+	def choice_todict(obj):
+		return {obj.choice: todict(obj.obj)}
+	return choice_todict
+
+def _enumerated_todict(obj):
+	return obj.name
+
+def _enumeratedid_todict(obj):
+	return int(obj.value)
+
+def _notstring_todict(obj):
+	return obj
+
+def _method_todict(todict, encoder):
+	def method_todict(obj):
+		try:
+			return obj.todict(encoder)
+		except AttributeError:
+			# Mimic the behaviour of objects with no `todict` method
+			if isinstance(obj, list):
+				return _list_todict(todict)(obj)
+			if isinstance(obj, dict):
+				return _dict_todict(todict)(obj)
+			if isinstance(obj, _NOTSTRING):
+				return obj
+			return str(obj)
+	return method_todict
+
+_fromdict_plans = {}
+""" Compiled decoding plans
+
+	Cache of the functions that build otupy objects from the intermediary dictionary representation.
+	Each plan is compiled the first time a class is decoded, and it is indexed by that class. 
+	For internal use only.
+"""
+
+def _fromdict(clstype, dic):
+	""" Create an object from dictionary by running the plan compiled for `clstype` """
+	try:
+		plan = _fromdict_plans[clstype]
+	except KeyError:
+		plan = _compile_fromdict(clstype)
+		if _tracer is not None:
+			plan = _tracer.wrap('fromdict', clstype, plan)
+		_fromdict_plans[clstype] = plan
+	return plan(dic)
+
+def _compile_fromdict(clstype):
+	""" Compile the decoding plan for a class
+
+		Classes that provide a `fromdict` method are decoded by invoking it. Any other class is
+		instantiated by passing the dictionary values as arguments to its constructor.
+		:param clstype: The class to decode.
+		:return: A function that takes the intermediary representation and returns an instance of `clstype`.
+	"""
+	# Imported here because base types need the `EncoderError` defined in this module
+	from otupy.types.base import Record, Map, Choice, Enumerated
+
+	fromdict = getattr(clstype, 'fromdict', None)
+
+	if fromdict is None:
+		if clstype in _UNCODED:
+			# Values of basic types are taken as they are
+			def basicfromdict(dic):
+				if type(dic) is clstype:
+					return dic
+				return _objfromdict(clstype, dic)
+			return basicfromdict
+		def objfromdict(dic):
+			return _objfromdict(clstype, dic)
+		return objfromdict
+
+	method = getattr(fromdict, '__func__', None)
+	if method is Record.fromdict.__func__:
+		return _compile_record_fromdict(clstype)
+	if method is Map.fromdict.__func__:
+		return _compile_map_fromdict(clstype)
+	if method is Choice.fromdict.__func__ and clstype.getClass.__func__ is Choice.getClass.__func__:
+		return _compile_choice_fromdict(clstype)
+	if method is Enumerated.fromdict.__func__:
+		return _compile_enumerated_fromdict(clstype)
+
+	def clsfromdict(dic):
+		try:
+			return fromdict(dic, Encoder)
+		except AttributeError:
+			return _objfromdict(clstype, dic)
+		except Exception as e:
+			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
+			raise EncoderError("Invalid message")
+	return clsfromdict
+
+def _compile_record_fromdict(cls):
+	""" Compile the decoding plan for a `Record`
+
+		The plan follows the `Schema` of the class and builds the `Record` directly from the parsed data:
+		each field is decoded by running its own plan, and the constructor is invoked once with all fields.
+	"""
+	from otupy.types.base.schema import get_schema
+
+	def record_fromdict(dic):
+		if not isinstance(dic, dict):
+			raise EncoderError("Invalid data type for Record")
+		try:
+			objdic, _ = get_schema(cls).decode(dic, _fromdict)
+		except TypeError as e:
+			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), e)
+			raise EncoderError("Invalid message")
+
+		try:
+			return cls(**objdic)
+		except Exception as e:
+			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
+			raise EncoderError("Unable to parse message")
+
+	return record_fromdict
+
+def _compile_map_fromdict(cls):
+	""" Compile the decoding plan for a `Map`
+
+		As for `Record`s, fields are decoded by following the `Schema` of the class, including the fields
+		of any registered extension, and the `Map` (or its extension) is then built once.
+	"""
+	from otupy.types.base.schema import get_schema
+
+	def map_fromdict(dic):
+		if not isinstance(dic, dict):
+			logger.warning("Unable to decode: %s. Map type needs a dictionary", str(dic))
+			raise EncoderError("Invalid message")
+		try:
+			objdic, extension = get_schema(cls).decode(dic, _fromdict, cls.lazy)
+		except TypeError:
+			logger.error("Unable to decode. Ill-formed object: %s", cls.__name__)
+			raise EncoderError("Invalid message")
+
+		try:
+			return (extension or cls)(objdic)
+		except Exception as e:
+			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
+			raise EncoderError("Invalid message")
+
+	return map_fromdict
+
+def _compile_choice_fromdict(cls):
+	""" Compile the decoding plan for a `Choice`
+
+		The class of the selected alternative is looked up in the `register` of the `Choice`, and its
+		plan is run directly.
+	"""
+	register = cls.register
+
+	def choice_fromdict(dic):
+		if not isinstance(dic, dict) or len(dic) != 1:
+			logger.warning("Unable to decode: %s. Unexpected dict", str(dic))
+			raise EncoderError("Invalid message")
+		for k, v in dic.items():
+			try:
+				objtype = register[k]
+			except KeyError:
+				logger.warning("Unable to decode: %s. Unknown choice: %s", str(dic), k)
+				raise EncoderError("Invalid message")
+			obj = _fromdict(objtype, v)
+		try:
+			return cls(obj)
+		except Exception as e:
+			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
+			raise EncoderError("Invalid message")
+
+	return choice_fromdict
+
+def _compile_enumerated_fromdict(cls):
+	""" Compile the decoding plan for an `Enumerated` (values are looked up by name) """
+	def enumerated_fromdict(dic):
+		try:
+			return cls[dic if type(dic) is str else str(dic)]
+		except KeyError:
+			logger.warning("Unable to decode: %s. Unexpected enum value", str(dic))
+			raise EncoderError("Invalid message")
+	return enumerated_fromdict
+
+def _objfromdict(clstype, dic):
+	""" Create an object that does not provide the `fromdict` method """
+	if isinstance(dic, dict):
+		return clstype(**dic)
+	if isinstance(dic, list):
+		lis = []
+		for i in dic:
+			lis.append(_fromdict(clstype, i))
+		return lis
+	if isinstance(dic, _UNCODED):
+		return clstype(dic)
+	raise ValueError("Unmanaged obj value: ", dic)
+
+_tracer = None
+""" The active `Tracer` (`None` when tracing is disabled) """
+
+@dataclasses.dataclass
+class TraceNode:
+	""" Trace of a single encoding/decoding step """
+	operation: str
+	""" Either 'todict' or 'fromdict' """
+	cls: type
+	""" The class being encoded/decoded """
+	data: object
+	""" The object to encode, or the intermediary representation to decode """
+	depth: int
+	""" Nesting level (0 for the outermost object) """
+	error: str = None
+	""" Name of the exception raised by this step (if any) """
+
+class Tracer:
+	""" Structured trace of encoding and decoding
+
+		Encoding and decoding plans do not include any logging, so that no time is spent in the
+		logging machinery when debugging is not necessary. A `Tracer` compiles tracing into the plans
+		on demand: while it is active, each object that is encoded or decoded is recorded as a `TraceNode`,
+		and it is optionally logged at the DEBUG level. 
+
+		Usage:
+		```
+		with Tracer() as t:
+			cmd = Encoder.decode(Command, dic)
+		for node in t.nodes:
+			print(node.depth * '  ', node.cls, node.data)
+		```
+
+		Tracing affects all conversions performed while the `Tracer` is active, by any thread.
+		Only one `Tracer` can be active at a time.
+	"""
+
+	def __init__(self, log=False):
+		""" Create a `Tracer`
+
+			:param log: Set to `True` to log each step with the DEBUG level, in addition to recording it.
+		"""
+		self.log = log
+		""" Log each step """
+		self.nodes = []
+		""" Recorded steps, in the same order they were started """
+		self._depth = 0
+
+	def __enter__(self):
+		global _tracer
+		if _tracer is not None:
+			raise RuntimeError("Another Tracer is already active")
+		_tracer = self
+		_clear_plans()
+		return self
+
+	def __exit__(self, *exc):
+		global _tracer
+		_tracer = None
+		_clear_plans()
+		return False
+
+	def wrap(self, operation, cls, plan):
+		""" Add tracing to a plan (for internal use only) """
+		def traced(data):
+			node = TraceNode(operation, cls, data, self._depth)
+			self.nodes.append(node)
+			if self.log:
+				logger.debug("%s%s %s: %s", '  '*node.depth, operation, cls.__name__, data)
+			self._depth += 1
+			try:
+				return plan(data)
+			except Exception as e:
+				node.error = type(e).__name__
+				raise
+			finally:
+				self._depth -= 1
+		return traced
+
+def _clear_plans():
+	""" Drop all compiled plans, which are compiled again on their next use """
+	_todict_functions.clear()
+	_fromdict_plans.clear()
+
 class Encoders(aenum.Enum):
 	""" List of available Encoders
 	
@@ -58,6 +494,13 @@ class Encoder:
 		Currently, this class is only designed to encode into text formats.
 	"""
 	encoder_type = 'dictionary'
+	todict_overrides = {}
+	""" Custom conversions
+
+		Classes that must be represented differently than in the base intermediary representation (e.g.,
+		binary data for binary formats). Keys are classes (including their subclasses) and values are 
+		functions that take an instance and return its representation.
+	"""
 
 	@classmethod
 	def getName(cls):
@@ -83,6 +526,20 @@ class Encoder:
 		"""
 		return str(Encoder.todict(obj))
 
+	@classmethod
+	def encode_bytes(cls, obj):
+		""" Encode an OpenC2 object into bytes
+
+			This method is used by `Transfer` protocols that send binary data. By default, it returns the
+			utf-8 representation of the output of `encode`. Derived classes that natively produce
+			`bytes` should override it to avoid useless conversions.
+
+			:param obj: An OpenC2 object derived from a `BaseType`. 
+			:return: The encoded object (`bytes`).
+		"""
+		data = cls.encode(obj)
+		return data if isinstance(data, bytes) else data.encode('utf-8')
+
 	@staticmethod
 	def decode(msgtype, msg):
 		""" Decode into OpenC2 object
@@ -99,52 +556,8 @@ class Encoder:
 		"""
 		return Encoder.fromdict(msgtype, msg)
 
-	@staticmethod
-	def __objtodict(obj):
-		if isinstance(obj, list):
-			return Encoder.__iteratelist(obj)
-
-		if isinstance(obj, dict):
-			return  Encoder.__iteratedic(obj)
-
-		if isinstance(obj, _NOTSTRING):
-			return obj
-
-		# Default: return a string representation of the object
-		return str(obj)
-
-
-	# This method 
-	def __objfromdict(clstype, dic):
-		if isinstance(dic, dict):
-			return clstype(**dic)
-		if isinstance(dic, list):
-			lis = []
-			for i in dic:
-				lis.append[Encoder.fromdict(clstype, i)]
-			return lis
-		if isinstance(dic, _UNCODED):
-			return clstype(dic)
-		raise ValueError("Unmanaged obj value: ", dic)
-
-	# Convert complex types to string by interatively invoking the todict function
-	@staticmethod
-	def __iteratedic(dic):
-		newdic = {}
-		for k,v in dic.items():
-			if v is not None:
-				newdic[Encoder.todict(k)] = Encoder.todict(v)
-		return newdic
-
-	@staticmethod
-	def __iteratelist(lis):
-		objlist = []
-		for i in lis:
-			objlist.append( Encoder.todict(i) )
-		return objlist	
-
-	@staticmethod
-	def todict(obj):
+	@classmethod
+	def todict(cls, obj):
 		""" Convert object to dictionary
 
 			This is an internal method to convert an otupy object into a dictionary. The dictionary is
@@ -152,14 +565,13 @@ class Encoder:
 
 			This method should only be invoked by derived classes to get the intermediary representation
 			of otupy objects. It will likely be used in the implementation of the `decode` method.	
+			The conversion is driven by an encoding plan which is compiled and cached the first time an object
+			of each class is encoded, so that following conversions do not need to inspect the object again.
+			Plans are compiled separately for each `Encoder` class, according to its `todict_overrides`.
 			:param obj: The otupy object to convert into a dictionary.
 			:return: A dictionary compliant with the OpenC2 syntax rules.
 		"""
-		try:
-			return obj.todict(Encoder)
-		except AttributeError:
-			return Encoder.__objtodict(obj)
-			
+		return _todict_function(cls)(obj)
 
 	@staticmethod
 	def fromdict(clstype, dic):
@@ -170,19 +582,11 @@ class Encoder:
 			intermediate representation and use this method in the `encode` method. It is necessary to 
 			provide the class definition of the otupy object to be instantiated.
 
+			As for `todict`, the decoding is driven by a plan which is compiled and cached the first time
+			each class is decoded. Plans do not log their steps; use a `Tracer` to inspect the decoding.
 			:param clstype: The class definition that must be used to instantiate the object.
 			:param dic: The dictionary with the OpenC2 description.
 			:return: An instance of `clstype` initialized with the data in the `dic`.
 		"""
-		logger.debug("Decondig: %s with %s", dic, clstype)
-		try:
-			logging.debug("Trying: %s", clstype.fromdict)
-			return clstype.fromdict(dic, Encoder)
-		except AttributeError:
-			logger.debug("Falling back: Encoder.objfromdict for %s", clstype)
-			return Encoder.__objfromdict(clstype, dic)
-		except Exception as e:
-			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
-			raise EncoderError("Invalid message")
-		
+		return _fromdict(clstype, dic)
 
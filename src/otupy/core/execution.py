@@ -0,0 +1,157 @@
+""" Background execution of Commands
+
+	This module provides the engine used by the `Consumer` to run `Command`s off the request thread, when the
+	Producer asks for an `ack` or `status` response (Sec. 3.3.1.4 of the Language Specification). The Consumer
+	answers `PROCESSING` as soon as the `Command` is accepted, and the final `Response` is kept so that it can
+	be retrieved later.
+"""
+
+import collections
+import logging
+import threading
+
+from otupy.core.response import Response, StatusCode, StatusCodeDescription
+
+logger = logging.getLogger(__name__)
+
+class ExecutionEngine:
+	""" Bounded pool of workers
+
+		Each `Actuator` has its own queue: `Command`s for the same `Actuator` are run one at a time, in order of
+		arrival, while `Command`s for different `Actuator`s run in parallel (up to the number of workers).
+		A slow `Actuator` therefore never blocks the others.
+
+		The final `Response`s are indexed by the identifiers given at submission (e.g., the `request_id` of the
+		`Message` and the `command_id` of the `Command`). Only the most recent `keep` `Response`s are kept.
+
+		Workers are started on demand.
+	"""
+
+	def __init__(self, workers=4, max_pending=1000, keep=10000):
+		""" Create the engine
+
+			:param workers: Maximum number of `Command`s that run at the same time.
+			:param max_pending: Maximum number of `Command`s that are queued or running.
+			:param keep: Number of final `Response`s that are kept.
+		"""
+		self.workers = workers
+		self.max_pending = max_pending
+		self.keep = keep
+		self._cond = threading.Condition()
+		self._queues = {}
+		""" Actuator -> queue of jobs (only for actuators with queued or running jobs) """
+		self._ready = collections.deque()
+		""" Actuators with queued jobs and no running job """
+		self._pending = {}
+		""" Identifier -> number of queued or running jobs with that identifier """
+		self._results = collections.OrderedDict()
+		""" Identifier -> final `Response` (oldest first) """
+		self._count = 0
+		self._idle = 0
+		self._threads = []
+		self._closed = False
+
+	def __len__(self):
+		""" Number of queued or running jobs """
+		return self._count
+
+	def submit(self, actuator, run, keys=(), callback=None):
+		""" Queue a job
+
+			:param actuator: The `Actuator` that runs the job (used to select the queue).
+			:param run: A function that runs the `Command` and returns its `Response`.
+			:param keys: The identifiers of the `Response`.
+			:param callback: A function invoked with the `Response` when the job has been run (optional).
+			:return: `False` if the job is rejected because too many jobs are pending, `True` otherwise.
+		"""
+		keys = tuple(k for k in keys if k is not None)
+		with self._cond:
+			if self._closed:
+				raise RuntimeError("The execution engine has been shut down")
+			if self._count >= self.max_pending:
+				return False
+			self._count += 1
+			for k in keys:
+				self._pending[k] = self._pending.get(k, 0) + 1
+
+			queue = self._queues.get(actuator)
+			if queue is None:
+				queue = self._queues[actuator] = collections.deque()
+				self._ready.append(actuator)
+			queue.append((run, keys, callback))
+
+			if len(self._ready) > self._idle and len(self._threads) < self.workers:
+				thread = threading.Thread(target=self._work, daemon=True)
+				self._threads.append(thread)
+				thread.start()
+			self._cond.notify_all()
+		return True
+
+	def result(self, key, timeout=None):
+		""" Get the `Response` of a job
+
+			:param key: One of the identifiers given to `submit`.
+			:param timeout: Time to wait for a pending job to complete (seconds). `None` to not wait.
+			:return: The final `Response`, a `PROCESSING` `Response` if the job is still pending, or `None` if
+				the identifier is unknown.
+		"""
+		with self._cond:
+			if timeout is not None:
+				self._cond.wait_for(lambda: key not in self._pending, timeout)
+			if key in self._pending:
+				return Response(status=StatusCode.PROCESSING, status_text=StatusCodeDescription[StatusCode.PROCESSING])
+			return self._results.get(key)
+
+	def shutdown(self, wait=True):
+		""" Stop the engine
+
+			No more jobs are accepted. Queued jobs are still run.
+			:param wait: Wait for all the jobs to complete.
+		"""
+		with self._cond:
+			self._closed = True
+			self._cond.notify_all()
+			threads = list(self._threads)
+		if wait:
+			for thread in threads:
+				thread.join()
+
+	def _work(self):
+		while True:
+			with self._cond:
+				while not self._ready and not self._closed:
+					self._idle += 1
+					self._cond.wait()
+					self._idle -= 1
+				if not self._ready:
+					return
+				actuator = self._ready.popleft()
+				run, keys, callback = self._queues[actuator].popleft()
+
+			try:
+				response = run()
+			except Exception as e:
+				logger.exception("Background execution failed")
+				response = Response(status=StatusCode.INTERNALERROR, status_text='Internal server error')
+
+			with self._cond:
+				self._count -= 1
+				for k in keys:
+					self._pending[k] -= 1
+					if not self._pending[k]:
+						del self._pending[k]
+					self._results[k] = response
+					self._results.move_to_end(k)
+				while len(self._results) > self.keep:
+					self._results.popitem(last=False)
+				if self._queues[actuator]:
+					self._ready.append(actuator)
+				else:
+					del self._queues[actuator]
+				self._cond.notify_all()
+
+			if callback is not None:
+				try:
+					callback(response)
+				except Exception as e:
+					logger.exception("Unable to deliver the response")
@@ -20,6 +20,7 @@
 import copy
 
 from otupy.core.register import Register
+from otupy.types.base.schema import invalidate_schemas
 
 Extensions = dict()
 """ Extensions
@@ -56,6 +57,7 @@ def extension(nsid):
 		setattr(cls, 'nsid', nsid)
 		Extensions[cls.__base__.__name__].add(nsid, cls)
 		cls.fieldtypes.update(copy.deepcopy(cls.__base__.fieldtypes))
+		invalidate_schemas()
 		return cls
 	return extend_wrapper
 
@@ -0,0 +1,206 @@
+""" Duplicate suppression
+
+	This module provides the cache used by the `Consumer` to answer retransmitted `Command`s (e.g., retries
+	from Producers and at-least-once `Transfer`s) without running them again.
+
+	`Command`s are identified by the Producer (the `from` field of the `Message`) together with either the
+	`request_id` of the `Message` or the `command_id` of the `Command`.
+"""
+
+import collections
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+from otupy.core.encoder import Encoder
+from otupy.core.response import Response
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+	""" A `Command` being run """
+	__slots__ = ('event', 'response')
+
+	def __init__(self):
+		self.event = threading.Event()
+		self.response = None
+
+class ResponseCache:
+	""" Recent `Response`s
+
+		`Response`s are kept for `ttl` seconds, and at most `size` of them are kept (the least recently used are
+		dropped first). Duplicates received while the `Command` is still running wait for its `Response`
+		instead of running it again. `Response`s with a server error status (5xx) are not kept, so that retries
+		are run again.
+
+		The cache can be stored in a sqlite database, so that `Command`s are not run again after a restart.
+		The database is written by a background thread, in batches, so that lookups never wait for the disk.
+	"""
+
+	def __init__(self, size=10000, ttl=300, db_path=None):
+		""" Create the cache
+
+			:param size: Maximum number of identifiers kept.
+			:param ttl: Time a `Response` is kept (seconds).
+			:param db_path: The sqlite database that stores the cache (`None` to only keep it in memory).
+		"""
+		self.size = size
+		self.ttl = ttl
+		self._entries = collections.OrderedDict()
+		""" (producer, identifier) -> (time, `Response`), least recently used first """
+		self._running = {}
+		""" (producer, identifier) -> `_Call` """
+		self._lock = threading.Lock()
+		self._conn = None
+		self._writes = None
+		""" Database updates to be written: (added, removed) pairs, `None` stops the writer """
+		self._writer = None
+		if db_path is not None:
+			self.__load(db_path)
+			self._writes = queue.Queue()
+			self._writer = threading.Thread(target=self.__write, args=(self._writes,), name='otupy-response-cache', daemon=True)
+			self._writer.start()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def run(self, keys, execute):
+		""" Run a `Command` unless it is a duplicate
+
+			:param keys: The identifiers of the `Command`: a list of (producer, identifier) pairs. Pairs with
+				a `None` identifier are ignored.
+			:param execute: A function that runs the `Command` and returns its `Response`.
+			:return: The `Response`, either returned by `execute` or by a previous run of the same `Command`.
+		"""
+		keys = [(str(producer or ''), str(id)) for producer, id in keys if id is not None]
+		if not keys:
+			return execute()
+
+		with self._lock:
+			now = time.time()
+			for k in keys:
+				response = self.__get(k, now)
+				if response is not None:
+					return response
+			call = next((self._running[k] for k in keys if k in self._running), None)
+			if call is None:
+				call = _Call()
+				for k in keys:
+					self._running[k] = call
+				owner = True
+			else:
+				owner = False
+
+		if not owner:
+			call.event.wait()
+			if call.response is None:
+				# The first run failed: try again
+				return self.run(keys, execute)
+			return call.response
+
+		try:
+			call.response = execute()
+		finally:
+			with self._lock:
+				for k in keys:
+					if self._running.get(k) is call:
+						del self._running[k]
+				if self.__cacheable(call.response):
+					self.__put(keys, call.response, time.time())
+			call.event.set()
+		return call.response
+
+	def close(self):
+		""" Write the pending updates and close the database (if any) """
+		with self._lock:
+			writes, self._writes = self._writes, None
+		if writes is None:
+			return
+		writes.put(None)
+		self._writer.join()
+		self._conn.close()
+		self._conn = None
+
+	@staticmethod
+	def __cacheable(response):
+		try:
+			return response is not None and int(response['status'].value) < 500
+		except (KeyError, TypeError, AttributeError):
+			return False
+
+	def __get(self, key, now):
+		""" The cached `Response` (the lock must be held) """
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		if now - entry[0] > self.ttl:
+			del self._entries[key]
+			self.__store([], [key])
+			return None
+		self._entries.move_to_end(key)
+		return entry[1]
+
+	def __put(self, keys, response, now):
+		""" Cache a `Response` (the lock must be held) """
+		for k in keys:
+			self._entries[k] = (now, response)
+			self._entries.move_to_end(k)
+		evicted = []
+		while len(self._entries) > self.size:
+			evicted.append(self._entries.popitem(last=False)[0])
+		self.__store([(k, now, response) for k in keys], evicted)
+
+	def __store(self, added, removed):
+		""" Queue an update of the database (the lock must be held, so that updates are written in order) """
+		if self._writes is not None:
+			self._writes.put((added, removed))
+
+	def __write(self, writes):
+		""" Write the queued updates, one transaction for all the updates queued meanwhile (writer thread) """
+		stop = False
+		while not stop:
+			updates = [writes.get()]
+			while True:
+				try:
+					updates.append(writes.get_nowait())
+				except queue.Empty:
+					break
+			if None in updates:
+				stop = True
+				updates = updates[:updates.index(None)]
+			if updates:
+				self.__commit(updates)
+
+	def __commit(self, updates):
+		""" Write updates to the database within one transaction """
+		try:
+			statements = [(removed, [(k[0], k[1], created, json.dumps(Encoder.todict(response))) for k, created, response in added])
+				for added, removed in updates]
+			self._conn.execute('BEGIN')
+			try:
+				for removed, rows in statements:
+					self._conn.executemany('DELETE FROM responses WHERE producer = ? AND id = ?', removed)
+					self._conn.executemany('INSERT OR REPLACE INTO responses (producer, id, created, response) VALUES (?, ?, ?, ?)', rows)
+			except:
+				self._conn.execute('ROLLBACK')
+				raise
+			self._conn.execute('COMMIT')
+		except Exception as e:
+			# The Responses are still cached in memory
+			logger.warning("Unable to store the response cache: %s", e)
+
+	def __load(self, db_path):
+		""" Open the database and load the `Response`s that are not expired """
+		conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+		conn.execute('PRAGMA journal_mode=WAL')
+		conn.execute('PRAGMA synchronous=NORMAL')
+		conn.execute('''CREATE TABLE IF NOT EXISTS responses (producer TEXT, id TEXT, created REAL, response TEXT,
+			PRIMARY KEY (producer, id))''')
+		conn.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+		rows = conn.execute('SELECT producer, id, created, response FROM responses ORDER BY created DESC LIMIT ?', (self.size,))
+		for producer, id, created, response in reversed(rows.fetchall()):
+			self._entries[(producer, id)] = (created, Encoder.fromdict(Response, json.loads(response)))
+		self._conn = conn
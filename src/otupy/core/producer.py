@@ -7,6 +7,7 @@ from otupy.core.message import Message
 from otupy.core.command import Command
 from otupy.core.encoder import Encoder
 from otupy.core.transfer import Transfer
+from otupy.core.ratelimit import TokenBucket
 
 class Producer:
 	"""
@@ -20,8 +21,12 @@ class Producer:
 		Note that the actuator instance is only known to the consumer, which runs it. The producer 
 		 knows the profile of the actuator, which embeds the an identifier for the actual
 		 actuator run by the consumer.
+
+		 When a `Consumer` reports its `rate_limit` (in the `Results` of any `Response`, e.g., to 
+		 `query features`), the `Producer` paces the following `Command`s sent with the same `Transfer` 
+		 so as not to exceed it.
 		"""
-	def __init__(self, producer: str, encoder: Encoder =None, transfer: Transfer =None):
+	def __init__(self, producer: str, encoder: Encoder =None, transfer: Transfer =None, pace: bool =True):
 		""" Initialize an OpenC2 stack
 
 			Creates a `Producer` communication stack made of an identifier, an Encoding format, and a 
@@ -32,12 +37,16 @@ class Producer:
 			:param producer: A string that identifies the `Producer`.
 			:param encoder: An instance of an Encoding class derived from base `Encoder`.
 			:param transfer: An instnace of a Transfer protocol derived from base `Transfer`.
+			:param pace: Pace `Command`s according to the `rate_limit` reported by the `Consumer`.
 		"""
 		if not isinstance(producer, str):
 			raise TypeError('Only strings are allowed for producer identifier')
 		self.producer = producer
 		self.encoder = encoder
 		self.transfer = transfer
+		self.pace = pace
+		self.limits = {}
+		""" `Transfer` -> `TokenBucket` with the rate limit of the `Consumer` """
 
 	def sendcmd(self, cmd: Command, encoder: Encoder =None, transfer: Transfer =None, consumers: [] =None):
 		""" Send an OpenC2 message
@@ -68,7 +77,23 @@ class Producer:
 		msg.from_=self.producer
 		msg.to=consumers
 
-		return transfer.send(msg, encoder)
+		if self.pace and transfer in self.limits:
+			self.limits[transfer].wait()
+		response = transfer.send(msg, encoder)
+		if self.pace:
+			self.__update_limit(transfer, response)
+		return response
+
+	def __update_limit(self, transfer, response):
+		# Track the rate limit reported by the Consumer
+		try:
+			rate = response.content['results']['rate_limit']
+		except (AttributeError, KeyError, TypeError):
+			return
+		if rate is None or rate <= 0:
+			return
+		if transfer not in self.limits or self.limits[transfer].rate != rate:
+			self.limits[transfer] = TokenBucket(rate, burst=1)
 
 
 
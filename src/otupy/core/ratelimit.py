@@ -0,0 +1,99 @@
+""" Rate limiting
+
+	This module provides the token buckets used by the `Consumer` to enforce request rates, and by the
+	`Producer` to pace its `Command`s.
+
+	Rates are expressed in requests per minute, as the `rate_limit` field of OpenC2 `Results` (Sec. 3.3.2.2
+	of the Language Specification).
+"""
+
+import collections
+import threading
+import time
+
+class TokenBucket:
+	""" Token bucket
+
+		The bucket is refilled at `rate` tokens per minute, up to `burst` tokens. Each request takes one token.
+		The bucket is thread-safe.
+	"""
+
+	def __init__(self, rate, burst=None):
+		""" Create a full bucket
+
+			:param rate: Allowed requests per minute.
+			:param burst: Maximum number of requests that can be sent at once (defaults to the requests allowed
+				in one second, and at least 1).
+		"""
+		if rate <= 0:
+			raise ValueError("The rate must be positive")
+		self.rate = rate
+		""" Requests per minute """
+		self.burst = burst if burst is not None else max(1, rate / 60)
+		""" Size of the bucket """
+		self._tokens = self.burst
+		self._last = time.monotonic()
+		self._lock = threading.Lock()
+
+	def take(self):
+		""" Take a token
+
+			:return: 0 if the token has been taken, otherwise the time to wait before a token is available
+				(seconds).
+		"""
+		with self._lock:
+			now = time.monotonic()
+			self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate / 60)
+			self._last = now
+			if self._tokens >= 1:
+				self._tokens -= 1
+				return 0
+			return (1 - self._tokens) * 60 / self.rate
+
+	def wait(self):
+		""" Take a token, waiting for it if needed
+
+			:return: The time spent waiting (seconds).
+		"""
+		waited = 0
+		delay = self.take()
+		while delay:
+			time.sleep(delay)
+			waited += delay
+			delay = self.take()
+		return waited
+
+class RateLimiter:
+	""" Token buckets for several clients
+
+		Each key (e.g., a Producer identifier) gets its own `TokenBucket`. Only the buckets of the most recent
+		`max_keys` keys are kept.
+	"""
+
+	def __init__(self, rate, burst=None, max_keys=10000):
+		""" Create the limiter
+
+			:param rate: Allowed requests per minute, for each key.
+			:param burst: Maximum number of requests that can be sent at once, for each key (see `TokenBucket`).
+			:param max_keys: Maximum number of buckets.
+		"""
+		self.rate = rate
+		self.burst = burst
+		self.max_keys = max_keys
+		self._buckets = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def take(self, key):
+		""" Take a token from the bucket of `key`
+
+			:return: 0 if the request is allowed, otherwise the time to wait (seconds).
+		"""
+		with self._lock:
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+				if len(self._buckets) > self.max_keys:
+					self._buckets.popitem(last=False)
+			else:
+				self._buckets.move_to_end(key)
+		return bucket.take()
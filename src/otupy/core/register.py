@@ -11,8 +11,61 @@ class Register(dict):
 		The class is meant to be instantiated internally and filled in with the elements provided by 
 		the Language Specification. Profiles may fill in with additional definitions, to make their 
 		classes and names available to the core system for encoding/deconding purposes.
+
+		Besides the name->class dictionary, a `Register` keeps a reverse class->name index, so that
+		looking for the name of a class does not depend on the number of registered elements. If the
+		same class is registered with multiple names, the first one is returned.
 	"""
-	
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._reindex()
+
+	def _reindex(self):
+		""" Rebuild the class->name index and clear the lookup cache """
+		self._names = {}
+		""" Reverse index: registered class -> name """
+		for name, register in self.items():
+			self._names.setdefault(register, name)
+		self._lookup = {}
+		""" Lookup cache: class (including subclasses of registered classes) -> name """
+
+	def __setitem__(self, name, register):
+		replaced = name in self
+		super().__setitem__(name, register)
+		if replaced:
+			self._reindex()
+		else:
+			self._names.setdefault(register, name)
+			self._lookup.clear()
+
+	def __delitem__(self, name):
+		super().__delitem__(name)
+		self._reindex()
+
+	def update(self, *args, **kwargs):
+		super().update(*args, **kwargs)
+		self._reindex()
+
+	def setdefault(self, name, register=None):
+		if name not in self:
+			self[name] = register
+		return self[name]
+
+	def pop(self, *args):
+		value = super().pop(*args)
+		self._reindex()
+		return value
+
+	def popitem(self):
+		item = super().popitem()
+		self._reindex()
+		return item
+
+	def clear(self):
+		super().clear()
+		self._reindex()
+
 	def add(self, name: str, register, identifier=None):
 		""" Add a new element
 	
@@ -25,13 +78,9 @@ class Register(dict):
 			:param identifier: A numeric value associated to the standard by the Specification (unused).
 			:return: None
 		"""
-		try:
-			list(self.keys())[list(self.values()).index(register)]
-		except ValueError:
-			# The item is not in the list
-			self[name] = register
-			return
-		raise ValueError("Element already registered")
+		if register in self._names:
+			raise ValueError("Element already registered")
+		self[name] = register
 
 	def get(self, name: str):
 		""" Get element by name
@@ -48,10 +97,21 @@ class Register(dict):
 
 			Given a class element, this method returns its name (the name it was registered with. 
 			Note that the returned name include the namespace prefix.
+			If the class is not registered, the name of its closest registered base class is returned.
+			Lookups are cached.
 
-			Throws an exception if the given element is not registered.
+			Throws an exception if neither the given element nor any of its base classes is registered.
 
 			:param register: The class element to look for.
 			:return: A string with the name of the element.
 		"""
-		return list(self.keys())[list(self.values()).index(register)]
+		try:
+			return self._lookup[register]
+		except KeyError:
+			pass
+
+		for cls in getattr(register, '__mro__', (register,)):
+			if cls in self._names:
+				name = self._lookup[register] = self._names[cls]
+				return name
+		raise ValueError(f"{register} is not registered")
@@ -0,0 +1,139 @@
+""" Actuator routing
+
+	This module provides the routing table used by the `Consumer` to select the `Actuator`s that run a `Command`,
+	based on the profile and on the `Specifiers` carried in the `Command` (e.g., `asset_id`, `hostname`,
+	`named_group` for SLPF, `domain` for CTXD).
+"""
+
+import threading
+
+class RoutingTable:
+	""" Index of the Actuators
+
+		`Actuator`s are identified by their profile (namespace identifier) and `asset_id`, as in the dictionary
+		given to the `Consumer`. Additional specifiers (e.g., `hostname`) can be declared when an `Actuator`
+		is added, and they are indexed as well. All lookups are dictionary accesses, so selecting the
+		`Actuator`s does not depend on the number of `Actuator`s.
+
+		The table can be changed at runtime. Changes never modify the dictionaries in place (they are copied
+		and replaced), so lookups do not need any lock.
+	"""
+
+	def __init__(self, actuators=None):
+		""" Create the table
+
+			:param actuators: A dictionary (profile, asset_id) -> `Actuator` (optional).
+		"""
+		self._lock = threading.Lock()
+		self._actuators = {}
+		""" (profile, asset_id) -> Actuator """
+		self._profiles = {}
+		""" profile -> {(profile, asset_id) -> Actuator} """
+		self._specifiers = {}
+		""" (profile, specifier, value) -> {(profile, asset_id) -> Actuator} """
+		self._declared = {}
+		""" (profile, asset_id) -> declared specifiers """
+		self._names = {}
+		""" profile -> {specifier -> number of Actuators that declared it} """
+		for (profile, asset_id), actuator in (actuators or {}).items():
+			self.add(profile, asset_id, actuator)
+
+	def __len__(self):
+		return len(self._actuators)
+
+	def __contains__(self, key):
+		return key in self._actuators
+
+	def items(self):
+		""" The ((profile, asset_id), `Actuator`) pairs """
+		return self._actuators.items()
+
+	def add(self, profile, asset_id, actuator, **specifiers):
+		""" Add (or replace) an `Actuator`
+
+			:param profile: The namespace identifier of the profile implemented by the `Actuator`.
+			:param asset_id: The identifier of the `Actuator` (may be `None`).
+			:param actuator: The `Actuator`.
+			:param specifiers: Other specifiers served by the `Actuator` (e.g., `hostname='fw1'`).
+		"""
+		key = (profile, asset_id)
+		with self._lock:
+			if key in self._actuators:
+				self.__remove(key)
+			self._actuators = {**self._actuators, key: actuator}
+			self._profiles[profile] = {**self._profiles.get(profile, {}), key: actuator}
+			declared = {name: value for name, value in specifiers.items() if value is not None}
+			for name, value in declared.items():
+				index = (profile, name, value)
+				self._specifiers[index] = {**self._specifiers.get(index, {}), key: actuator}
+			names = dict(self._names.get(profile, {}))
+			for name in declared:
+				names[name] = names.get(name, 0) + 1
+			self._names[profile] = names
+			self._declared[key] = declared
+
+	def remove(self, profile, asset_id):
+		""" Remove an `Actuator`
+
+			:raise KeyError: if the `Actuator` is unknown.
+		"""
+		with self._lock:
+			self.__remove((profile, asset_id))
+
+	def __remove(self, key):
+		profile = key[0]
+		self._actuators = {k: v for k, v in self._actuators.items() if k != key}
+		self._profiles[profile] = {k: v for k, v in self._profiles[profile].items() if k != key}
+		if not self._profiles[profile]:
+			del self._profiles[profile]
+		names = dict(self._names.get(profile, {}))
+		for name, value in self._declared.pop(key).items():
+			index = (profile, name, value)
+			self._specifiers[index] = {k: v for k, v in self._specifiers[index].items() if k != key}
+			if not self._specifiers[index]:
+				del self._specifiers[index]
+			names[name] -= 1
+			if not names[name]:
+				del names[name]
+		if names:
+			self._names[profile] = names
+		else:
+			self._names.pop(profile, None)
+
+	def route(self, profile=None, specifiers=None):
+		""" Select the `Actuator`s for a `Command`
+
+			- Without profile, all `Actuator`s are selected.
+			- With an `asset_id`, only that `Actuator` is selected.
+			- With other specifiers, the `Actuator`s that declared all of them are selected. Specifiers that
+			  no `Actuator` of the profile declared are ignored (the `Actuator`s must check them themselves).
+			- Otherwise, all the `Actuator`s of the profile are selected.
+
+			:param profile: The namespace identifier of the profile (`None` if not given).
+			:param specifiers: The `Specifiers` of the `Command` (a dictionary).
+			:return: A list of ((profile, asset_id), `Actuator`) pairs.
+			:raise KeyError: if the `asset_id` is unknown, or no `Actuator` matches the specifiers.
+		"""
+		if profile is None:
+			return list(self._actuators.items())
+		specifiers = specifiers or {}
+		asset_id = specifiers.get('asset_id')
+		if asset_id is not None:
+			return [((profile, asset_id), self._actuators[(profile, asset_id)])]
+
+		names = self._names.get(profile, {})
+		selected = None
+		for name, value in specifiers.items():
+			if name not in names:
+				continue
+			try:
+				matches = self._specifiers.get((profile, name, value), {})
+			except TypeError:
+				# Unhashable specifiers (e.g., asset_tuple) are not indexed
+				continue
+			selected = dict(matches) if selected is None else {k: v for k, v in selected.items() if k in matches}
+			if not selected:
+				raise KeyError(name)
+		if selected is not None:
+			return list(selected.items())
+		return list(self._profiles.get(profile, {}).items())
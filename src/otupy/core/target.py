@@ -36,17 +36,13 @@ class TargetRegister(Register):
 		"""
 		if nsid is not None:
 			name = nsid + ':' + name
-		try:
-			list(self.keys())[list(self.values()).index(target)]
-		except ValueError:
-			# The item is not in the list
-			self[name] = target
-			if identifier is None:
-				aenum.extend_enum(TargetEnum, name)
-			else:
-				aenum.extend_enum(TargetEnum, name, identifier)
-			return
-		raise ValueError("Target already registered")
+		if target in self._names:
+			raise ValueError("Target already registered")
+		self[name] = target
+		if identifier is None:
+			aenum.extend_enum(TargetEnum, name)
+		else:
+			aenum.extend_enum(TargetEnum, name, identifier)
 
 Extensions['Targets'] = TargetRegister()
 """ List of available `Target`s
@@ -0,0 +1,63 @@
+""" CBOR Encoding
+
+	This module provides the code for encoding OpenC2 messages with CBOR (RFC 8949).
+	It requires the `cbor2` package.
+"""
+import cbor2
+
+from otupy import Encoder, register_encoder, Binary
+
+
+@register_encoder
+class CBOREncoder(Encoder):
+	""" CBOR Encoder
+
+		This class implements the `Encoder` interface for the CBOR format. It leverages
+		the intermediary dictionary representation, but `Binary` and `Binaryx` data are carried
+		as native byte strings instead of base64/hex strings.
+
+		The `CBOREncoder` can be used to create an OpenC2 stack in `Consumer` and `Producer`.
+		Since CBOR is a binary format, encoded messages are `bytes`.
+	"""
+	encoder_type = 'cbor'
+	""" The label that is used to identify this `Encoder` in OpenC2 messages. """
+	todict_overrides = {Binary: Binary.get}
+	""" Binary data (including `Binaryx`) are not converted to text """
+
+	@classmethod
+	def encode(cls, obj):
+		""" Encode an OpenC2 object
+
+			This method is used to encode an otupy object, which usually is a `Command` or `Message`.
+			The implementation leverages the intermediary dictionary representation and it is
+			therefore agnostic of otupy clases.
+
+			:param obj: A valid otupy object.
+			:return: The CBOR representation of the `obj` (`bytes`).
+		"""
+		return cbor2.dumps(cls.todict(obj))
+
+	@classmethod
+	def encode_bytes(cls, obj):
+		""" Encode an OpenC2 object into bytes (same as `encode`) """
+		return cls.encode(obj)
+
+	@classmethod
+	def decode(cls, msg, msgtype=None):
+		""" Decode an OpenC2 message
+
+			This method is used to create an otupy object of type `msgtype` from a CBOR record.
+			The otupy class `msgtype` corresponding to the CBOR record `msg` must be explicitly provided,
+			since parsing and automatically inferring the `msgtype` is not currently implemented.
+
+			:param msg: The CBOR record to decode (`bytes`).
+			:param msgtype: The otupy class to convert the CBOR to.
+			:return: An `msgtype` class initialized according to the CBOR content.
+		"""
+		if msgtype == None:
+			return cbor2.loads(msg)
+
+		if isinstance(msg, (bytes, bytearray)):
+			return Encoder.decode(msgtype, cbor2.loads(msg))
+		else:
+			return Encoder.decode(msgtype, msg)
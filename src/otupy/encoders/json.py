@@ -1,29 +1,164 @@
 """ JSON Encoding
 
 	This module provides the code for encoding OpenC2 messages with JSON.
+
+	The json serialization is delegated to a backend library. The standard `json` module is used by default;
+	faster libraries (`orjson`, `msgspec`, `ujson`) can be selected when installed.
 """
 import json
 
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+try:
+	import msgspec
+except ImportError:
+	msgspec = None
+
+try:
+	import ujson
+except ImportError:
+	ujson = None
+
 from otupy import Encoder, register_encoder
 
 
+class JSONBackend:
+	""" JSON library interface
+
+		Wraps a json library with a common interface. Derived classes return either `str` or `bytes`,
+		according to the native output of the underlying library.
+	"""
+	name = None
+	""" The name of the backend (the name of the python module) """
+
+	@staticmethod
+	def dumps(obj, indent=None):
+		""" Serialize `obj` to json (without indentation if `indent` is `None`) """
+		raise NotImplementedError
+
+	@staticmethod
+	def loads(data):
+		""" Deserialize json `data` (either `str` or `bytes`) """
+		raise NotImplementedError
+
+class StdlibBackend(JSONBackend):
+	""" The `json` module of the standard library """
+	name = 'json'
+
+	@staticmethod
+	def dumps(obj, indent=None):
+		if indent is None:
+			return json.dumps(obj, separators=(',', ':'))
+		return json.dumps(obj, indent=indent)
+
+	@staticmethod
+	def loads(data):
+		return json.loads(data)
+
+class OrjsonBackend(JSONBackend):
+	""" The `orjson` library
+
+		Note that `orjson` only supports indentation with 2 spaces: other indentations are produced
+		by the standard `json` module, so that the output does not depend on the backend.
+	"""
+	name = 'orjson'
+
+	@staticmethod
+	def dumps(obj, indent=None):
+		if indent is None:
+			return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+		if indent == 2:
+			return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2)
+		return StdlibBackend.dumps(obj, indent)
+
+	@staticmethod
+	def loads(data):
+		return orjson.loads(data)
+
+class MsgspecBackend(JSONBackend):
+	""" The `msgspec` library """
+	name = 'msgspec'
+
+	@staticmethod
+	def dumps(obj, indent=None):
+		data = msgspec.json.encode(obj)
+		if indent is not None:
+			data = msgspec.json.format(data, indent=indent)
+		return data
+
+	@staticmethod
+	def loads(data):
+		return msgspec.json.decode(data)
+
+class UjsonBackend(JSONBackend):
+	""" The `ujson` library """
+	name = 'ujson'
+
+	@staticmethod
+	def dumps(obj, indent=None):
+		return ujson.dumps(obj, indent=indent or 0, escape_forward_slashes=False)
+
+	@staticmethod
+	def loads(data):
+		return ujson.loads(data)
+
+JSONBackends = {}
+""" Available json backends, fastest first """
+if orjson is not None:
+	JSONBackends[OrjsonBackend.name] = OrjsonBackend
+if msgspec is not None:
+	JSONBackends[MsgspecBackend.name] = MsgspecBackend
+if ujson is not None:
+	JSONBackends[UjsonBackend.name] = UjsonBackend
+JSONBackends[StdlibBackend.name] = StdlibBackend
+
+
 @register_encoder
 class JSONEncoder(Encoder):
 	""" JSON Encoder
-	
+
 		This class implements the `Encoder` interface for the JSON format. It leverages
 		the intermediary dictionary representation.
 
 		The `JSONEncoder` can be used to create an OpenC2 stack in `Consumer` and `Producer`.
+
+		The json library and the output format are selected by class attributes, because `Transfer`s
+		use the registered class to answer incoming messages:
+		- `backend` is the standard `json` module by default, so that the output does not depend on the
+		  installed packages (see `set_backend`);
+		- `indent` is the indentation used for human-readable messages; set it to `None` to
+		  produce compact messages for the wire.
 	"""
 	encoder_type = 'json'
 	""" The label that is used to identify this `Encoder` in OpenC2 messages. """
+	backend = StdlibBackend
+	""" The `JSONBackend` used for (de)serialization """
+	indent = 3
+	""" Number of spaces for indentation (`None` for compact output) """
 
-	@staticmethod
-	def encode(obj):
+	@classmethod
+	def set_backend(cls, name=None):
+		""" Select the json library
+
+			:param name: The name of the backend (one among the keys of `JSONBackends`). If `None`, the
+				standard `json` module is selected.
+			:return: None
+		"""
+		if name is None:
+			name = StdlibBackend.name
+		try:
+			cls.backend = JSONBackends[name]
+		except KeyError:
+			raise ValueError("Unavailable json backend: " + name)
+
+	@classmethod
+	def encode(cls, obj):
 		""" Encode an OpenC2 object
 
-			This method is used to encode an otupy object, which usually is a `Command` or `Message`. 
+			This method is used to encode an otupy object, which usually is a `Command` or `Message`.
 			The implementation leverages the intermediary dictionary representation and it is
 			therefore agnostic of otupy clases.
 
@@ -31,28 +166,41 @@ class JSONEncoder(Encoder):
 			:return: A string with the json representation of the `obj`.
 
 		"""
-		return json.dumps(Encoder.todict(obj), indent=3)
+		data = cls.backend.dumps(Encoder.todict(obj), cls.indent)
+		return data.decode('utf-8') if isinstance(data, bytes) else data
 
-	@staticmethod
-	def decode(msg, msgtype=None):
+	@classmethod
+	def encode_bytes(cls, obj):
+		""" Encode an OpenC2 object into bytes
+
+			Same as `encode`, but returns the utf-8 representation of the json (avoids conversions
+			when the backend natively produces `bytes`).
+
+			:param obj: A valid otupy object.
+			:return: The json representation of the `obj` (`bytes`).
+		"""
+		data = cls.backend.dumps(Encoder.todict(obj), cls.indent)
+		return data if isinstance(data, bytes) else data.encode('utf-8')
+
+	@classmethod
+	def decode(cls, msg, msgtype=None):
 		""" Decode an OpenC2 message
 
-			This method is used to create an otupy object of type `msgtype` from a json record. 
+			This method is used to create an otupy object of type `msgtype` from a json record.
 			The otupy class `msgtype` corresponding to the json record `msg` must be explicitly provided,
 			since parsing and automatically inferring the `msgtype` is not currently implemented.
 
 			The implementation leverages the intermediary dictionary representation and it is
 			therefore agnostic of otupy classes.
 
-			:param msg: The json record to decode.
+			:param msg: The json record to decode (either `str` or `bytes`).
 			:param msgtype: The otupy class to convert the json to.
 			:return: An `msgtype` class initialized according to the json content.
 		"""
 		if msgtype == None:
-			return json.loads(msg)
+			return cls.backend.loads(msg)
 
-		if isinstance(msg, str):
-			return Encoder.decode(msgtype, json.loads(msg))
+		if isinstance(msg, (str, bytes, bytearray)):
+			return Encoder.decode(msgtype, cls.backend.loads(msg))
 		else:
 			return Encoder.decode(msgtype, msg)
-
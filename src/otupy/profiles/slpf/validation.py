@@ -57,34 +57,42 @@ AllowedCommandArguments[(Actions.query, TargetEnum.features)] = ['response_reque
 AllowedCommandArguments[(Actions.delete, TargetEnum[Profile.nsid+':rule_number'])] = ['response_requested', 'start_time']
 AllowedCommandArguments[(Actions.update, TargetEnum.file)] = ['response_requested', 'start_time']
 
-def validate_command(cmd):
+def validate_command(cmd, targets=None):
 	""" Validate a `Command` 
 
 		Helper function to check the `Target` in a `Command` are valid for the `Action` according
 		to the SLPF profile.
 		:param cmd: The `Command` class to validate.
+		:param targets: The valid `Action`/`Target` pairs, for `Actuator`s that implement a different
+			set of pairs (default: `AllowedCommandTarget`).
 	""" 
+	if targets is None:
+		targets = AllowedCommandTarget
 	try:
 		if cmd.action in AllowedActions and \
-			TargetEnum[cmd.target.getName()] in AllowedCommandTarget[cmd.action]:
+			TargetEnum[cmd.target.getName()] in targets[cmd.action]:
 			return True
 		else:
 			return False
 	except:
 		return False
 
-def validate_args(cmd):
+def validate_args(cmd, arguments=None):
 	""" Validate a `Command` 
 
 		Helper function to check the `Args` in a `Command` are valid for the `Action` and `Target`  according
 		to the SLPF profile.
 		:param cmd: The `Command` class to validate.
+		:param arguments: The valid `Args` for each `Action`/`Target` pair, for `Actuator`s that implement a 
+			different set of pairs (default: `AllowedCommandArguments`).
 	"""
+	if arguments is None:
+		arguments = AllowedCommandArguments
 	try:
 		if cmd.args is None: 
 			return True
 		for k,v in cmd.args.items():
-			if k not in AllowedCommandArguments[cmd.action, TargetEnum[cmd.target.getName()]]:
+			if k not in arguments[cmd.action, TargetEnum[cmd.target.getName()]]:
 				return False
 		return True
 	except:
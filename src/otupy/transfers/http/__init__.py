@@ -1,9 +1,8 @@
 """ HTTP Transfer Protocol
 
 	This module defines implementation of the `Transfer` interface for the 
-  	HTTP/HTTPs protocols. This implementation is mostly provided for 
-	research and development purposes, but it is not suitable for production
-	environments.
+  	HTTP/HTTPs protocols. Incoming messages are served by a multi-threaded WSGI
+	server.
 
 	The implementation follows the Specification for Transfer of OpenC2 Messages via HTTPS
 	Version 1.1, which is indicated as the "Specification" in the following.
@@ -1,9 +1,9 @@
 """ HTTP Transfer Protocol
 
 	This module defines implementation of the `Transfer` interface for the 
-  	HTTP/HTTPs protocols. This implementation is mostly provided for 
-	research and development purposes, but it is not suitable for production
-	environments.
+  	HTTP/HTTPs protocols. Incoming messages are served by a multi-threaded WSGI
+	server with a bounded pool of workers; the Flask development server is still 
+	available for debugging.
 
 	The implementation follows the Specification for Transfer of OpenC2 Messages via HTTPS
 	Version 1.1, which is indicated as the "Specification" in the following.
@@ -12,26 +12,146 @@ import dataclasses
 import requests
 import logging
 import copy
+import concurrent.futures
+import threading
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, make_response
-from werkzeug.exceptions import HTTPException, UnsupportedMediaType
+from werkzeug.exceptions import HTTPException, UnsupportedMediaType, ClientDisconnected
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
 
 import otupy as oc2
 from otupy.transfers.http.message import Message
 
+try:
+	# Registers the CBOR encoder, if the cbor2 package is available
+	import otupy.encoders.cbor
+except ImportError:
+	pass
 
 logger = logging.getLogger(__name__)
 """ The logging facility in otupy """
 
+class _RequestHandler(WSGIRequestHandler):
+	""" HTTP/1.1 request handler with persistent connections
+
+		Werkzeug closes every connection after its `Response` (`Connection: close`), because it cannot find
+		the next request on a connection if the application does not read the whole body. This handler limits 
+		the input of the application to the body (`Content-Length`) and discards the part that was not read, 
+		so that the connection can be kept open. Requests with chunked bodies still close the connection.
+
+		Idle connections are closed after `timeout` seconds, so that they do not hold worker threads forever.
+		A connection is only kept open if the server grants it a keep-alive slot (see `_PooledWSGIServer`); 
+		otherwise it is closed once the `Response` has been sent.
+	"""
+	protocol_version = 'HTTP/1.1'
+	timeout = 5
+
+	def setup(self):
+		super().setup()
+		self._kept = False
+		self._reuse = False
+
+	def run_wsgi(self):
+		length = self.__body_length()
+		if length is not None and not self.close_connection and not self._kept:
+			self._kept = self.server.acquire_keep_alive()
+		if length is None or self.close_connection or not self._kept:
+			super().run_wsgi()
+			return
+
+		rfile = self.rfile
+		self.rfile = body = LimitedStream(rfile, length)
+		self._reuse = True
+		try:
+			super().run_wsgi()
+		finally:
+			self.rfile = rfile
+			self._reuse = False
+		if not self.close_connection:
+			try:
+				# The next request starts after the body
+				body.exhaust()
+			except (ClientDisconnected, OSError):
+				self.close_connection = True
+
+	def send_header(self, keyword, value):
+		if self._reuse and keyword.lower() == 'connection' and value.lower() == 'close':
+			return
+		super().send_header(keyword, value)
+
+	def finish(self):
+		if self._kept:
+			self.server.release_keep_alive()
+			self._kept = False
+		super().finish()
+
+	def __body_length(self):
+		""" Length of the request body, `None` if unknown (chunked or invalid) """
+		if 'Transfer-Encoding' in self.headers:
+			return None
+		try:
+			length = int(self.headers.get('Content-Length', 0))
+		except ValueError:
+			return None
+		return length if length >= 0 else None
+
+class _PooledWSGIServer(BaseWSGIServer):
+	""" WSGI server with a pool of worker threads
+
+		Each connection is served by a thread taken from a pool of fixed size. Connections that 
+		exceed the number of threads wait in queue until a worker is available.
+
+		A worker stays bound to its connection while the connection is idle, so at most `max_keep_alive` 
+		connections (less than the number of threads) are kept open after their first request. The other
+		workers are always available to new connections, which are closed after each request while all
+		the keep-alive slots are taken.
+	"""
+	multithread = True
+
+	def __init__(self, host, port, app, threads, keep_alive, max_keep_alive, ssl_context=None):
+		handler = type('RequestHandler', (_RequestHandler,), {'timeout': keep_alive})
+		super().__init__(host, port, app, handler=handler, ssl_context=ssl_context)
+		self._pool = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='otupy-http')
+		self._keep_alive = threading.BoundedSemaphore(max_keep_alive) if max_keep_alive else None
+
+	def acquire_keep_alive(self):
+		""" Take a keep-alive slot (without waiting). Returns `False` if all slots are taken """
+		return self._keep_alive is not None and self._keep_alive.acquire(blocking=False)
+
+	def release_keep_alive(self):
+		""" Give back a keep-alive slot """
+		self._keep_alive.release()
+
+	def process_request(self, request, client_address):
+		self._pool.submit(self._process_request_thread, request, client_address)
+
+	def _process_request_thread(self, request, client_address):
+		try:
+			self.finish_request(request, client_address)
+		except Exception:
+			self.handle_error(request, client_address)
+		finally:
+			self.shutdown_request(request)
+
+	def server_close(self):
+		""" Stop listening and wait for pending requests """
+		super().server_close()
+		self._pool.shutdown(wait=True)
+
 class HTTPTransfer(oc2.Transfer):
 	""" HTTP Transfer Protocol
 
-		This class provides an implementation of the Specification. It builds on Flask and so it is not
-		suitable for production environments.
+		This class provides an implementation of the Specification. It builds on Flask and Werkzeug.
 
 		Use `HTTPTransfer` to build OpenC2 communication stacks in `Producer` and `Consumer`.
+		When used by a `Consumer`, messages are processed concurrently by a pool of worker threads, so that
+		a slow `Actuator` does not block other `Command`s; `Actuator`s must therefore be thread-safe.
 	"""
-	def __init__(self, host, port = 80, endpoint = '/.well-known/openc2', usessl=False):
+	def __init__(self, host, port = 80, endpoint = '/.well-known/openc2', usessl=False, threads=8, keep_alive=5, max_keep_alive=None,
+			debug=False, pool_size=10, timeout=(5, 60), retries=3, backoff=0.2):
 		""" Builds the `HTTPTransfer` instance
 
 			The `host` and `port` parameters are used either for selecting the remote server (`Producer`) or
@@ -41,6 +161,19 @@ class HTTPTransfer(oc2.Transfer):
 			:param endpoint: The remote endpoint to contact the OpenC2 server (`Producer` only).
 			:param usessl: Enable (`True`) or disable (`False`) SSL. Internal use only. Do not set this argument,
 				use the `HTTPSTransfer` instead.
+			:param threads: Number of worker threads that serve incoming requests (`Consumer` only).
+			:param keep_alive: Timeout (seconds) to close idle persistent connections (`Consumer` only).
+			:param max_keep_alive: Maximum number of persistent connections, which must be lower than `threads`
+				since each idle connection holds a worker thread. Other connections are closed after each request.
+				Defaults to half of the threads (`Consumer` only).
+			:param debug: Run the Flask development server (single thread, with debugger) instead of
+				the multi-threaded server (`Consumer` only). Never use it in production.
+			:param pool_size: Maximum number of persistent connections kept open towards the server (`Producer` only).
+			:param timeout: Timeout (seconds) to connect and to wait for the response, either as a single value or
+				as a (connect, read) tuple. `None` to wait forever (`Producer` only).
+			:param retries: Number of attempts to connect again if the connection fails (`Producer` only). 
+				Requests are never sent again once they have been delivered.
+			:param backoff: Backoff factor (seconds) between retries (`Producer` only).
 		"""
 		self.host = host
 		self.port = port
@@ -48,6 +181,47 @@ class HTTPTransfer(oc2.Transfer):
 		self.scheme = 'https' if usessl else 'http'
 		self.url = f"{self.scheme}://{host}:{port}{endpoint}"
 		self.ssl_context = None
+		self.threads = threads
+		self.keep_alive = keep_alive
+		self.max_keep_alive = threads // 2 if max_keep_alive is None else max_keep_alive
+		if not 0 <= self.max_keep_alive < threads:
+			raise ValueError("The number of persistent connections must be lower than the number of threads")
+		self.debug = debug
+		self._server = None
+		self.pool_size = pool_size
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self._session = None
+		self._session_lock = threading.Lock()
+
+	@property
+	def session(self):
+		""" The HTTP session used to send messages
+
+			The session is created on first use (only once, even if several threads send at the same time), and
+			keeps persistent connections that are reused by all messages sent through this `HTTPTransfer`.
+		"""
+		session = self._session
+		if session is None:
+			with self._session_lock:
+				if self._session is None:
+					retry = Retry(total=self.retries, connect=self.retries, read=0, status=0, other=0,
+						backoff_factor=self.backoff, allowed_methods=None)
+					adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+					session = requests.Session()
+					session.verify = False
+					session.mount(self.scheme + '://', adapter)
+					self._session = session
+				session = self._session
+		return session
+
+	def close(self):
+		""" Close the persistent connections opened to send messages """
+		with self._session_lock:
+			if self._session is not None:
+				self._session.close()
+				self._session = None
 
 	def _tohttp(self, msg, encoder):
 		""" Convert otupy `Message` to HTTP `Message` """
@@ -56,9 +230,9 @@ class HTTPTransfer(oc2.Transfer):
 
 		# Encode the data
 		if encoder is not None:
-			data = encoder.encode(m)
+			data = encoder.encode_bytes(m)
 		else:
-			data = oc2.Encoder().encode(m)
+			data = oc2.Encoder().encode_bytes(m)
 
 		return data
 
@@ -92,6 +266,29 @@ class HTTPTransfer(oc2.Transfer):
 
 		return msg, encoder
 
+	def _negotiate(self, hdr, encoder):
+		""" Select the `Encoder` for the response
+
+			The `Encoder` is selected according to the HTTP `Accept` header, among the registered `Encoders`.
+			:param hdr: HTTP headers of the request.
+			:param encoder: The `Encoder` used when no acceptable encoding is found (usually, the same as the request).
+			:return: The `Encoder` to use for the response.
+		"""
+		accept = hdr.get('Accept')
+		if not accept:
+			return encoder
+
+		prefix = 'application/' + oc2.Message.content_type + '+'
+		for media_type in accept.split(','):
+			media_type = media_type.split(';')[0].strip()
+			if not media_type.startswith(prefix):
+				continue
+			try:
+				return oc2.Encoders[media_type.removeprefix(prefix)].value
+			except KeyError:
+				continue
+
+		return encoder
 
 	# This function is used to send an HTTP request
 	def send(self, msg, encoder):
@@ -123,14 +320,14 @@ class HTTPTransfer(oc2.Transfer):
 		# Send the OpenC2 message and get the response
 		if self.scheme == 'https':
 			logger.warning("Certificate validation disabled!")
-		response = requests.post(self.url, data=openc2data, headers=openc2headers, verify=False)
+		response = self.session.post(self.url, data=openc2data, headers=openc2headers, timeout=self.timeout)
 		logger.info("HTTP got response: %s", response)
 		logger.info("HTTP Response Content:\n%s", response.text)
 	
 		# TODO: How to manage HTTP response code? Can we safely assume they always match the Openc2 response?
 		try:
-			if response.text != "":
-				msg, encoder = self._fromhttp(response.headers, response.text)
+			if response.content:
+				msg, encoder = self._fromhttp(response.headers, response.content)
 			else:
 				msg = None
 		except ValueError as e:
@@ -186,14 +383,53 @@ class HTTPTransfer(oc2.Transfer):
 		""" Listen for incoming messages
 
 			This method implements the `Transfer` interface to listen for and receive OpenC2 messages.
-			The internal implementation uses `Flask` as HTTP server. The method invokes the `callback`
+			The method invokes the `callback`
 			for each received message, which must be provided by a `Producer` to properly dispatch 
 			`Command`s to the relevant server(s). It also takes an `Encoder` that is used to create
 			responses to `Command`s encoded with unknown encoders.
+
+			This method is blocking, until `shutdown` is invoked (e.g., from a signal handler) or the
+			process is interrupted. Pending requests are completed before returning.
 			:param callback: The function that is invoked to process OpenC2 messages.
 			:param encoder: Default `Encoder` instance to respond to unknown or wrong messages.
 			:return :None
 		"""
+		app = self.wsgi_app(callback, encoder)
+
+		if self.debug:
+			app.run(debug=True, host=self.host, port=self.port, ssl_context=self.ssl_context)
+			return
+
+		self._server = _PooledWSGIServer(self.host, self.port, app, self.threads, self.keep_alive,
+			self.max_keep_alive, self.ssl_context)
+		logger.info("Serving %s with %d threads", self.url, self.threads)
+		try:
+			self._server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self._server.server_close()
+			self._server = None
+			logger.info("Server stopped")
+
+	def shutdown(self):
+		""" Stop listening for incoming messages
+
+			Graceful shutdown: `receive` returns after all pending requests have been served.
+			Must not be invoked by the thread that is running `receive`.
+			:return: None
+		"""
+		if self._server is not None:
+			self._server.shutdown()
+
+	def wsgi_app(self, callback, encoder):
+		""" Create the WSGI application
+
+			The application can also be served by any external WSGI server.
+			:param callback: The function that is invoked to process OpenC2 messages.
+			:param encoder: Default `Encoder` instance to respond to unknown or wrong messages.
+			:return: The `Flask` application.
+		"""
 		app = Flask(__name__)
 		app.config['OPENC2']=self
 		app.config['CALLBACK']=callback
@@ -207,7 +443,8 @@ class HTTPTransfer(oc2.Transfer):
 			encoder=app.config['ENCODER']
 			
 			try:
-				cmd, encoder = server._recv(request.headers, request.data.decode('UTF-8') )
+				cmd, encoder = server._recv(request.headers, request.get_data())
+				encoder = server._negotiate(request.headers, encoder)
 				# TODO: Add the code to answer according to 'response_requested'
 			except UnsupportedMediaType as e:
 				# We were not able to understand the OpenC2 Message. 
@@ -266,19 +503,19 @@ class HTTPTransfer(oc2.Transfer):
 
 			return httpresp, resp_code
 
-		app.run(debug=True, host=self.host, port=self.port, ssl_context=self.ssl_context)
+		return app
 
 
 class HTTPSTransfer(HTTPTransfer):
 	""" HTTP Transfer Protocol with SSL
 
-		This class provides an implementation of the Specification. It builds on Flask and so it is not
-		suitable for production environments.
+		This class provides an implementation of the Specification. It builds on Flask and Werkzeug.
 
 		Use `HTTPSTransfer` to build OpenC2 communication stacks in `Producer` and `Consumer`.
 		Usage and methods of `HTTPSTransfer` are semanthically the same as for `HTTPTransfer`.
 	"""
-	def __init__(self, host, port = 443, endpoint = '/.well-known/openc2'):
+	def __init__(self, host, port = 443, endpoint = '/.well-known/openc2', threads=8, keep_alive=5, max_keep_alive=None,
+			debug=False, pool_size=10, timeout=(5, 60), retries=3, backoff=0.2):
 		""" Builds the `HTTPSTransfer` instance
 
 			The `host` and `port` parameters are used either for selecting the remote server (`Producer`) or
@@ -286,8 +523,20 @@ class HTTPSTransfer(HTTPTransfer):
 			:param host: Hostname or IP address of the OpenC2 server.
 			:param port: Transport port of the OpenC2 server.
 			:param endpoint: The remote endpoint to contact the OpenC2 server (`Producer` only).
+			:param threads: Number of worker threads that serve incoming requests (`Consumer` only).
+			:param keep_alive: Timeout (seconds) to close idle persistent connections (`Consumer` only).
+			:param max_keep_alive: Maximum number of persistent connections, which must be lower than `threads`
+				since each idle connection holds a worker thread. Other connections are closed after each request.
+				Defaults to half of the threads (`Consumer` only).
+			:param debug: Run the Flask development server (`Consumer` only). Never use it in production.
+			:param pool_size: Maximum number of persistent connections kept open towards the server (`Producer` only).
+			:param timeout: Timeout (seconds) to connect and to wait for the response (`Producer` only).
+			:param retries: Number of attempts to connect again if the connection fails (`Producer` only).
+			:param backoff: Backoff factor (seconds) between retries (`Producer` only).
 		"""
-		HTTPTransfer.__init__(self, host, port, endpoint, usessl=True)
+		HTTPTransfer.__init__(self, host, port, endpoint, usessl=True, threads=threads, keep_alive=keep_alive,
+			max_keep_alive=max_keep_alive, debug=debug,
+			pool_size=pool_size, timeout=timeout, retries=retries, backoff=backoff)
 		self.ssl_context = "adhoc"
 
 
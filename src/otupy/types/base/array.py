@@ -71,7 +71,7 @@ class Array(Openc2Type, list):
 		"""
 		lis = []
 		for i in self:
-			lis.append = e.todict(i)
+			lis.append(e.todict(i))
 		return lis
 
 	def fromdict(cls, dic, e):
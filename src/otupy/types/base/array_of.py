@@ -5,6 +5,9 @@ from otupy.types.base.array import Array
 
 logger = logging.getLogger(__name__)
 
+_classes = {}
+""" Classes created by `ArrayOf`, indexed by the type of their fields """
+
 class ArrayOf:
 	""" OpenC2 ArrayOf
 
@@ -23,10 +26,17 @@ class ArrayOf:
 		""" `ArrayOf` builder
 
 			Creates a unnamed derived class from `Array`, which `fieldtypes` is set to `fldtype`.
+			Classes are created once for each `fldtype`: following invocations with the same 
+			`fldtype` return the same class.
 			:param fldtype: The type of the fields stored in the array (indicated as *vtype* in 
 					the Language Specification.
-			:return: A new unnamed class definition.
+			:return: An unnamed class definition.
 		"""
+		try:
+			return _classes[fldtype]
+		except KeyError:
+			pass
+
 		class ArrayOf(Array):
 			""" OpenC2 unnamed `ArrayOf`
 
@@ -56,12 +66,28 @@ class ArrayOf:
 					:param e: The `Encoder that is being used.
 					:return: An instance of this class initialized from the dictionary values.
 				"""
-				objlis = cls()
-				logger.debug('Building %s from %s in ArrayOf', cls, lis)
-				logger.debug('-> instantiating: %s', cls.fieldtype)
-				for k in lis:
-					objlis.append(e.fromdict(cls.fieldtype, k))
-		
+				fieldtype = cls.fieldtype
+				fromdict = e.fromdict
+				return cls.from_iterable(fromdict(fieldtype, k) for k in lis)
+
+			@classmethod
+			def from_iterable(cls, items, trusted=False):
+				""" Bulk construction
+
+					Builds the array in a single pass. Items which type is exactly `fieldtype` are taken as 
+					they are, other items (including instances of subclasses) are converted to `fieldtype`,
+					as in the constructor.
+					:param items: Any iterable with the items of the array.
+					:param trusted: Set to `True` to skip the conversion of the items, when they are known to
+						be instances of `fieldtype` (no check is performed).
+					:return: An instance of this class with the given items.
+				"""
+				objlis = cls.__new__(cls)
+				if trusted:
+					list.extend(objlis, items)
+				else:
+					fieldtype = cls.fieldtype
+					list.extend(objlis, (i if type(i) is fieldtype else fieldtype(i) for i in items))
 				return objlis
 			
 			def validate(self, types: bool=True, num_min: int = 0, num_max: int = None):
@@ -87,12 +113,11 @@ class ArrayOf:
 				return item if type(item)==self.fieldtype else self.fieldtype(item)
 
 			def __init__(self, args=[]):
-
-				super().__init__(args)
-
-				converted_items = []
-				for idx, val in enumerate(self):
-					self[idx] = (self.__to_fldtype(val))
+				# Items are converted before reaching `Array.__init__`, so its handling of strings 
+				# (taken as a single item, not as a sequence of characters) must be repeated here
+				if isinstance(args, str):
+					args = [ args ]
+				super().__init__(self.__to_fldtype(val) for val in args)
 
 				
 			def append(self, item):
@@ -111,7 +136,7 @@ class ArrayOf:
 				item = self.__to_fldtype(item)
 				super().__iadd__(item)
 
-		return ArrayOf
+		return _classes.setdefault(fldtype, ArrayOf)
 
 
 
@@ -46,7 +46,9 @@ class Binary(Openc2Type):
 
 	@classmethod
 	def fromdict(cls, dic, e=None):
-		""" Builds from base64encoding """
+		""" Builds from base64encoding (or raw bytes, for binary encoding formats) """
+		if isinstance(dic, bytes):
+			return cls(dic)
 		try:
 #return cls( base64.b64decode(dic.encode('ascii')) )
 			return cls( base64.b64decode(dic))
@@ -37,7 +37,9 @@ class Binaryx(Binary):
 
 	@classmethod
 	def fromdict(cls, dic, e=None):
-		""" Builds from base64encoding """
+		""" Builds from base64encoding (or raw bytes, for binary encoding formats) """
+		if isinstance(dic, bytes):
+			return cls(dic)
 		try:
 			return cls( base64.b16decode(dic.encode('ascii').upper()) )
 		except:		
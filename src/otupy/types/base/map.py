@@ -1,7 +1,10 @@
+import collections.abc
 import logging
 import typing
 
 from otupy.types.base.openc2_type import Openc2Type
+from otupy.types.base.schema import Schema, LazyValue, get_schema, invalidate_schemas
+from otupy.core.encoder import EncoderError
 
 logger = logging.getLogger(__name__)
 
@@ -51,6 +54,13 @@ class Map(Openc2Type, dict):
 		shall register themselves according to the specific documentation of the base type class, but 
 		shall not modify this field.
 	"""
+	lazy = ()
+	""" Lazy fields
+
+		Names of the fields that are not decoded together with the `Map`, but only on their first access
+		(e.g., large `results` in a `Response` that is only forwarded). Use `materialize` to decode 
+		(and validate) all fields at once. Note that decoding errors of lazy fields are raised on first access.
+	"""
 
 	def __init__(self, *args, **kwargs):
 		""" Create and validate objects
@@ -63,24 +73,75 @@ class Map(Openc2Type, dict):
 			:param args: One or more dictionaries or maps used to initialize this object.
 			:param kwargs: keyword arguments used to initialize this object.
 		"""
-		raw = {}
-
-		for arg in args:
-			raw.update(arg)
-		# This step is indeed not strictly necessary, but used to give keyword arguments
-		# precedence over non-keyword arguments.
-		raw.update(kwargs)
+		if len(args) == 1 and not kwargs and isinstance(args[0], dict):
+			# Most common case (e.g., decoding): no need to merge arguments
+			raw = args[0]
+		else:
+			raw = {}
+			for arg in args:
+				raw.update(arg)
+			# This step is indeed not strictly necessary, but used to give keyword arguments
+			# precedence over non-keyword arguments.
+			raw.update(kwargs)
 		for k,v in raw.items():
 			# When a field is an instance of an extensible class, such extensible class can be 
 			# safely used to initialize it. Otherwise, we assume a plain dictionary is given, 
 		 	# or anything else that can be initialized by the plain fieldtype (of course, this
 			# may fail).
-			if isinstance(v, self.fieldtypes[k]):
+			if isinstance(v, self.fieldtypes[k]) or type(v) is LazyValue:
 				self[k] = v
 			else:
-				logger.debug("%s is not an instance of %s. Trying anyway to initialize it....", v, self.fieldtypes[k])
 				self[k] = self.fieldtypes[k](v)
 
+	def __getitem__(self, key):
+		value = dict.__getitem__(self, key)
+		if type(value) is LazyValue:
+			value = value.materialize()
+			dict.__setitem__(self, key, value)
+		return value
+
+	def get(self, key, default=None):
+		return self[key] if key in self else default
+
+	# Lazy fields are also materialized when values are read through the other dict methods.
+	# Maps without lazy fields keep the native (faster) dict methods.
+	def __iter__(self):
+		return dict.__iter__(self)
+
+	def items(self):
+		if not self.lazy:
+			return dict.items(self)
+		return collections.abc.ItemsView(self)
+
+	def values(self):
+		if not self.lazy:
+			return dict.values(self)
+		return collections.abc.ValuesView(self)
+
+	def copy(self):
+		if not self.lazy:
+			return dict.copy(self)
+		return {k: self[k] for k in self}
+
+	def pop(self, key, *default):
+		value = dict.pop(self, key, *default)
+		if type(value) is LazyValue:
+			value = value.materialize()
+		return value
+
+	def materialize(self):
+		""" Decode lazy fields
+
+			Decode all lazy fields, including those of nested objects, so that the whole content is validated.
+			:return: This object.
+		"""
+		for k, v in dict.items(self):
+			if type(v) is LazyValue:
+				self[k]
+			elif hasattr(v, 'materialize'):
+				v.materialize()
+		return self
+
 	def validate_fields(self, min_num=1):
 		""" Check whether field names are valid
 	
@@ -119,6 +180,7 @@ class Map(Openc2Type, dict):
 		for k,v in cls.fieldtypes.items():
 			if v == typing.Self:
 				cls.fieldtypes[k] = cls
+		invalidate_schemas(cls)
 
 		return cls
 
@@ -139,10 +201,10 @@ class Map(Openc2Type, dict):
 		# This is necessary because self.base.fieldtypes does
 		# not exist for non-extended classes
 		if self.base is None:
-			return e.todict(dict(self))
+			return e.todict(dict(dict.items(self)))
 			
 		newdic[self.nsid]={}
-		for k,v in self.items():
+		for k,v in dict.items(self):
 			if k not in self.fieldtypes:
 				raise ValueError('Unknown field: ', k)
 			if k in self.base.fieldtypes:
@@ -165,23 +227,10 @@ class Map(Openc2Type, dict):
 			:param e: The `Encoder that is being used.
 			:return: An instance of this class initialized from the dictionary values.
 		"""
-		objdic = {}
-		extension = None
-		logger.debug('Decoding %s from %s in Map', cls, dic)
 		if not isinstance(dic, dict):
 			raise TypeError("Map type needs a dictionary")
 		try:
-			for k,v in dic.items():
-				# Check whether each field is in the base class on in an extension
-				if k in cls.fieldtypes:
-					objdic[k] = e.fromdict(cls.fieldtypes[k], v)
-				elif k in cls.register:
-					logger.debug('   Using profile %s to decode: %s', k, v)
-					extension = cls.register[k]
-					for l,w in v.items():
-						objdic[l] = e.fromdict(extension.fieldtypes[l], w)
-				else:
-					raise TypeError("Unexpected field: ", k)
+			objdic, extension = get_schema(cls).decode(dic, e.fromdict, cls.lazy)
 		except TypeError:
 			logger.error("Unable to decode. Ill-formed object: %s", cls.__name__)
 			raise(EncoderError)
@@ -191,11 +240,24 @@ class Map(Openc2Type, dict):
 			cls = extension
 
 		try:
-			logger.debug("Building %s with %s", cls, objdic)
 			return  cls(objdic)
 		except Exception as e:
-			logger.ERROR("Unable to instantiate %s from %s", cls, objdic)
-			raise TypeError("Unable to instantiate class " + cls)
+			logger.error("Unable to instantiate %s from %s", cls, objdic)
+			raise TypeError("Unable to instantiate class " + cls.__name__)
+
+	@classmethod
+	def build_schema(cls):
+		""" Builds the decoding schema
+
+			The fields of a `Map` are given by its `fieldtypes`. Additional fields may be carried by
+			the extensions registered for this class, if any.
+
+			This method is invoked internally the first time the class is decoded, and should not be
+			used directly.
+			:return: The `Schema` of this class.
+		"""
+		fields = { k: (k, v) for k, v in cls.fieldtypes.items() }
 
+		return Schema(fields, extensions=cls.register)
 	
 
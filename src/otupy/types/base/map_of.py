@@ -5,6 +5,9 @@ from otupy.types.base.map import Map
 
 logger = logging.getLogger(__name__)
 
+_classes = {}
+""" Classes created by `MapOf`, indexed by the types of their keys and values """
+
 class MapOf:
 	""" OpenC2 MapOf
 
@@ -24,10 +27,17 @@ class MapOf:
 
 			Creates a unnamed derived class from `Map`, which `fieldtypes` is set to a single value
 		 	`ktype: vtype`.
+			Classes are created once for each (`ktype`, `vtype`) pair: following invocations with the same
+			types return the same class.
 			:param ktype: The key type of the items stored in the map.
 			:param vtype: The value type of the items stored in the map.
-			:return: A new unnamed class definition.
+			:return: An unnamed class definition.
 		"""
+		try:
+			return _classes[ktype, vtype]
+		except KeyError:
+			pass
+
 		class MapOf(Map):
 			""" OpenC2 unnamed `MapOf`
 
@@ -75,10 +85,9 @@ class MapOf:
 					:return: An instance of this class initialized from the dictionary values.
 				"""
 				objdic = {}
-				logger.debug('Building %s from %s in MapOf', cls, dic)
 				for k,v in dic.items():
 					objk = e.fromdict(cls.fieldtypes['key'], k)
 					objdic[objk] = e.fromdict(cls.fieldtypes['value'], v)
 				return objdic
 
-		return MapOf
+		return _classes.setdefault((ktype, vtype), MapOf)
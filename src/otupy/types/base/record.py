@@ -1,7 +1,9 @@
-import inspect
+import dataclasses
 import logging
 
 from otupy.types.base.openc2_type import Openc2Type
+from otupy.types.base.schema import Schema, get_schema
+from otupy.core.encoder import EncoderError
 
 logger = logging.getLogger(__name__)
 
@@ -55,28 +57,41 @@ class Record(Openc2Type):
 			:param e: The `Encoder that is being used.
 			:return: An instance of this class initialized from the dictionary values.
 		"""
-		objdic = {}
-		# Retrieve class type for each field in the dictionary
-		fielddesc = None
-		logger.debug("Decondig: %s with %s", dic, clstype)
-		for tpl in inspect.getmembers(clstype):
-			if tpl[0] == '__annotations__':
-				fielddesc = tpl[1]
-
-		
 		if not isinstance(dic, dict):
 			raise EncoderError("Invalid data type for Record")
-		for k,v in dic.items():
-			if k not in fielddesc:
-				raise Exception("Unknown field '" + k + "' from message")
-			objdic[k] = e.fromdict(fielddesc[k], v)
+		objdic, _ = get_schema(clstype).decode(dic, e.fromdict)
 
 		# A record should always have more than one field, so the following statement 
 		# should not raise exceptions
 		try:
-			logger.debug("Building %s with %s", clstype, objdic)
 			return clstype(**objdic)
 		except Exception as e:
 			logger.warning("Unable to decode: %s. Returning EncoderError due to: %s", str(dic), type(e).__name__)
 			raise EncoderError("Unable to parse message")
 
+	@classmethod
+	def build_schema(cls):
+		""" Builds the decoding schema
+
+			The fields of a `Record` are given by its annotations. Fields without a default value
+			(or a `default_factory`, for dataclasses) are mandatory. Field names that clash with Python keywords are expected to be
+			defined with a trailing '_', which is removed in the serialized form.
+
+			This method is invoked internally the first time the class is decoded, and should not be
+			used directly.
+			:return: The `Schema` of this class.
+		"""
+		annotations = getattr(cls, '__annotations__', {})
+		fields = {}
+		for name, fieldtype in annotations.items():
+			fields[name] = (name, fieldtype)
+			# Fix keywords corresponding to variable names that clash with Python keywords
+			if name.endswith('_'):
+				fields.setdefault(name.rstrip('_'), (name, fieldtype))
+		optional = set()
+		if dataclasses.is_dataclass(cls):
+			optional = {f.name for f in dataclasses.fields(cls)
+							if f.default is not dataclasses.MISSING or f.default_factory is not dataclasses.MISSING}
+		required = [name for name in annotations if name not in optional and not hasattr(cls, name)]
+
+		return Schema(fields, required)
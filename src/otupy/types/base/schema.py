@@ -0,0 +1,165 @@
+""" Decoding schema
+
+	This module provides the description of the fields of structured types (`Record`, `Map`) which is used to
+	build otupy objects from their intermediary dictionary representation.
+
+	A `Schema` is built once for each class, the first time an object of that class is decoded, and it is then
+	cached. The cache must be invalidated every time the definition of a class changes (e.g., its `fieldtypes`);
+	this is automatically done by the `@extension` decorator and by `Map.make_recursive`.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_schemas = {}
+""" Cache of decoding schemas, indexed by class """
+
+class Schema:
+	""" Decoding schema
+
+		A `Schema` binds the name of each field, as found in the intermediary dictionary representation, to
+		the name of the corresponding attribute (or key) in the otupy object and to the class used to decode
+		its value. Names of attributes that clash with Python keywords (e.g., `from_`) are bound to both their
+		serialized form (without trailing '_') and their attribute name.
+
+		The `Schema` also lists the fields that must be present, and the `Register` of the extensions that may
+		be carried under the namespace identifier of a Profile.
+	"""
+
+	def __init__(self, fields, required=(), extensions=None):
+		""" Create a `Schema`
+
+			:param fields: A dictionary which keys are the field names and which values are
+				pairs (attribute name, class).
+			:param required: List of attribute names that must always be present.
+			:param extensions: `Register` of the classes that extend the described class (if any).
+		"""
+		self.fields = fields
+		""" Field name -> (attribute name, class) """
+		self.required = tuple(required)
+		""" Attributes that must be present """
+		self.extensions = extensions
+		""" Registered extensions (indexed by their namespace identifier) """
+
+	def decode(self, dic, fromdict, lazy=()):
+		""" Decode the fields
+
+			Decode each field found in `dic` with the class given by the `Schema`. Fields that belong to a registered
+			extension are decoded with the `Schema` of the extension. Fields listed in `lazy` are left
+			undecoded.
+
+			:param dic: The intermediary dictionary representation of the object.
+			:param fromdict: The function used to decode the value of each field, given its class and
+				its intermediary representation (e.g., `Encoder.fromdict`).
+			:param lazy: Names of the fields that are not decoded, but wrapped in a `LazyValue`.
+			:return: A dictionary with the decoded values, indexed by their attribute names, and the extension
+				class found in `dic` (`None` if no extension is present).
+		"""
+		if not isinstance(dic, dict):
+			raise TypeError("Invalid data type: a dictionary is expected")
+
+		objdic = {}
+		extension = None
+		fields = self.fields
+		for k, v in dic.items():
+			try:
+				name, fieldtype = fields[k]
+			except KeyError:
+				if self.extensions is None or k not in self.extensions:
+					raise TypeError("Unexpected field: ", k)
+				if not isinstance(v, dict):
+					raise TypeError("Invalid data type for extension: ", k)
+				extension = self.extensions[k]
+				extfields = get_schema(extension).fields
+				for l, w in v.items():
+					try:
+						name, fieldtype = extfields[l]
+					except KeyError:
+						raise TypeError("Unexpected field: ", l)
+					objdic[name] = fromdict(fieldtype, w)
+			else:
+				if name in lazy:
+					objdic[name] = LazyValue(fieldtype, v, fromdict)
+				else:
+					objdic[name] = fromdict(fieldtype, v)
+
+		for name in self.required:
+			if name not in objdic:
+				raise TypeError("Missing field: ", name)
+
+		return objdic, extension
+
+class LazyValue:
+	""" Field decoded on first access
+
+		Holds the intermediary representation of a field, which is only decoded (and validated) when 
+		`materialize` is invoked. This is used for fields listed as `lazy` in `Map`s, which are 
+		transparently materialized when they are accessed.
+
+		When encoded again before materialization, the original intermediary representation is
+		returned as it is.
+	"""
+	__slots__ = ('fieldtype', 'raw', '_fromdict')
+
+	def __init__(self, fieldtype, raw, fromdict):
+		""" Create a `LazyValue`
+
+			:param fieldtype: The class of the field.
+			:param raw: The intermediary representation of the field.
+			:param fromdict: The function used to decode the field (see `Schema.decode`).
+		"""
+		self.fieldtype = fieldtype
+		""" The class of the field """
+		self.raw = raw
+		""" The intermediary representation of the field """
+		self._fromdict = fromdict
+
+	def materialize(self):
+		""" Decode the field
+
+			Nested lazy fields (if any) are decoded as well.
+			:return: An instance of `fieldtype`.
+		"""
+		value = self._fromdict(self.fieldtype, self.raw)
+		if hasattr(value, 'materialize'):
+			value.materialize()
+		return value
+
+	def todict(self, e):
+		""" Returns the original intermediary representation
+
+			Encoders that need a different representation than the base `Encoder` (see `todict_overrides`)
+			get the representation of the decoded field.
+		"""
+		if e.todict_overrides:
+			return e.todict(self.materialize())
+		return self.raw
+
+	def __repr__(self):
+		return f"LazyValue({self.fieldtype.__name__})"
+
+def get_schema(cls):
+	""" Get the decoding schema of a class
+
+		The schema is built by the `build_schema` class method the first time it is requested, and then cached.
+		:param cls: The class to be decoded.
+		:return: The `Schema` of `cls`.
+	"""
+	try:
+		return _schemas[cls]
+	except KeyError:
+		schema = _schemas[cls] = cls.build_schema()
+		return schema
+
+def invalidate_schemas(cls=None):
+	""" Invalidate cached schemas
+
+		This function must be called every time the definition of the fields of a class is changed.
+		:param cls: The class which definition has changed. If `None`, all schemas are invalidated.
+		:return: None
+	"""
+	if cls is None:
+		_schemas.clear()
+	else:
+		_schemas.pop(cls, None)
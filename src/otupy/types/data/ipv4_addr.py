@@ -23,25 +23,40 @@ class IPv4Addr:
 		   (host/prefix, host/mask, host/hostmask, etc.)
 
 """
-	__ipv4_addr = ipaddress.IPv4Address("0.0.0.0")
-	""" Internal representation of the IPv4 address"""
+	__slots__ = ('_addr', '_text')
 	
 	def __init__(self, ipaddr=None):
 		""" Initialize IPv4 Address 
 
 			An IPv4 address is built from a string that uses the common dotted notation.
 			If no IPv4 address is provided, the null address is used ("0.0.0.0").
+			The address is stored as integer, and its text is only built when needed.
 
-			:param ipaddr: Quad-dotted representation of the IPv4 address.
+			:param ipaddr: Quad-dotted representation of the IPv4 address (or an integer).
 		"""
 		if ipaddr == None:
-			self.__ipv4_addr = ipaddress.IPv4Address("0.0.0.0")
+			self._addr = 0
+		elif isinstance(ipaddr, IPv4Addr):
+			self._addr = ipaddr._addr
 		else:
-			self.__ipv4_addr = ipaddress.IPv4Address(ipaddr)
+			self._addr = int(ipaddress.IPv4Address(ipaddr))
+		self._text = None
+
+	def __int__(self):
+		return self._addr
+
+	def __eq__(self, other):
+		if not isinstance(other, IPv4Addr):
+			return NotImplemented
+		return self._addr == other._addr
+
+	def __hash__(self):
+		return hash(self._addr)
 
 	def __str__(self):
-		return self.__ipv4_addr.exploded
+		if self._text is None:
+			self._text = ipaddress.IPv4Address(self._addr).exploded
+		return self._text
 
 	def __repr__(self):
-		return self.__ipv4_addr.exploded
-
+		return self.__str__()
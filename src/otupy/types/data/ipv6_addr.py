@@ -23,27 +23,40 @@ class IPv6Addr:
 		   (host/prefix, host/mask, host/hostmask, etc.)
 
 """
-	__ipv6_addr = ipaddress.IPv6Address("::")
-	""" Internal representation of the IPv6 address"""
+	__slots__ = ('_addr', '_text')
 	
 	def __init__(self, ipaddr=None):
 		""" Initialize IPv6 Address 
 
 			An IPv6 address is built from a string that uses the common dotted notation.
 			If no IPv6 address is provided, the null address is used ("::").
+			The address is stored as integer, and its text is only built when needed.
 
-			:param ipaddr: Quad-dotted representation of the IPv6 address.
+			:param ipaddr: Quad-dotted representation of the IPv6 address (or an integer).
 		"""
 		if ipaddr == None:
-			self.__ipv6_addr = ipaddress.IPv6Address("::")
+			self._addr = 0
+		elif isinstance(ipaddr, IPv6Addr):
+			self._addr = ipaddr._addr
 		else:
-			self.__ipv6_addr = ipaddress.IPv6Address(ipaddr)
+			self._addr = int(ipaddress.IPv6Address(ipaddr))
+		self._text = None
+
+	def __int__(self):
+		return self._addr
+
+	def __eq__(self, other):
+		if not isinstance(other, IPv6Addr):
+			return NotImplemented
+		return self._addr == other._addr
+
+	def __hash__(self):
+		return hash(self._addr)
 
 	def __str__(self):
-#return self.__ipv6_addr.exploded
-		return self.__ipv6_addr.compressed
+		if self._text is None:
+			self._text = ipaddress.IPv6Address(self._addr).compressed
+		return self._text
 
 	def __repr__(self):
-#return self.__ipv6_addr.exploded
-		return self.__ipv6_addr.compressed
-
+		return self.__str__()
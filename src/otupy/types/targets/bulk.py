@@ -0,0 +1,291 @@
+""" Bulk construction of IP targets
+
+	This module builds large numbers of `IPv4Net`/`IPv6Net` targets at once, e.g., when ingesting
+	threat-intelligence feeds.
+
+	IPv4 networks in the common text form ("a.b.c.d" or "a.b.c.d/n") are parsed in a single vectorized pass
+	when `numpy` is available, and with a lightweight parser otherwise. Any other form accepted by `IPv4Net`
+	(e.g., with netmask or hostmask) falls back to the per-object parser, which also reports invalid entries
+	with the same exceptions as `IPv4Net`.
+	Integer addresses (lists of `int` or `numpy` arrays) are validated and used without any conversion to text.
+
+	`numpy` is an optional dependency.
+"""
+
+import re
+import numbers
+import collections.abc
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from otupy.core.command import Command
+from otupy.types.targets.ipv4_net import IPv4Net
+from otupy.types.targets.ipv6_net import IPv6Net
+
+_IPV4_RE = re.compile(r'([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})(?:/([0-9]{1,2}))?')
+_IPV4_MAXLEN = len("255.255.255.255/32")
+
+def ipv4_nets(nets, prefixes=None, unique=True):
+	""" Build `IPv4Net` targets in bulk
+
+		:param nets: The networks, either as text or as integer addresses (an iterable of `int` or a `numpy`
+			array of integers).
+		:param prefixes: The prefix length of integer addresses (a single value or a sequence with one value
+			for each address). Defaults to 32. Ignored for text.
+		:param unique: Drop duplicated networks (the order of first occurrence is kept).
+		:return: A list of `IPv4Net`.
+	"""
+	nets = _sequence(nets)
+	if _integers(nets):
+		addrs, prefs = _ipv4_from_ints(nets, prefixes)
+	elif numpy is not None:
+		addrs, prefs = _ipv4_from_text_numpy(nets)
+	else:
+		addrs, prefs = _ipv4_from_text(nets)
+
+	return _build(IPv4Net, addrs, prefs, unique)
+
+def ipv6_nets(nets, prefixes=None, unique=True):
+	""" Build `IPv6Net` targets in bulk
+
+		IPv6 text is parsed by `IPv6Net` one network at a time, but duplicates are dropped before parsing.
+		:param nets: The networks, either as text or as integer addresses (an iterable of `int`, or a `numpy`
+			array with two unsigned 64-bit columns: the high and low halves of each address).
+		:param prefixes: The prefix length of integer addresses (a single value or a sequence with one value
+			for each address). Defaults to 128. Ignored for text.
+		:param unique: Drop duplicated networks (the order of first occurrence is kept).
+		:return: A list of `IPv6Net`.
+	"""
+	nets = _sequence(nets)
+	if numpy is not None and isinstance(nets, numpy.ndarray) and nets.dtype.kind in 'ui':
+		if nets.ndim != 2 or nets.shape[1] != 2:
+			raise ValueError("IPv6 addresses must be given as (high, low) pairs")
+		nets = [hi << 64 | lo for hi, lo in nets.astype(numpy.uint64).tolist()]
+
+	if _integers(nets):
+		addrs = list(nets)
+		prefs = _expand(prefixes, 128, len(addrs))
+		for a, p in zip(addrs, prefs):
+			IPv6Net._check(a, p)
+	else:
+		if unique:
+			nets = dict.fromkeys(nets)
+		addrs = []
+		prefs = []
+		for n in nets:
+			net = IPv6Net(n)
+			addrs.append(net._addr)
+			prefs.append(net._prefix)
+
+	return _build(IPv6Net, addrs, prefs, unique)
+
+def commands(action, targets, args=None, actuator=None):
+	""" Wrap targets into `Command`s
+
+		:param action: The `Actions` of all commands.
+		:param targets: The targets (e.g., as returned by `ipv4_nets`).
+		:param args: The `Args` of all commands.
+		:param actuator: The `Actuator` of all commands.
+		:return: A generator of `Command`s, one for each target.
+	"""
+	for target in targets:
+		yield Command(action, target, args=args, actuator=actuator)
+
+def collapse(nets):
+	""" Aggregate networks
+
+		Collapses overlapping and adjacent networks into the minimal set of networks that cover exactly 
+		the same addresses.
+		:param nets: A list of either `IPv4Net` or `IPv6Net` (not mixed).
+		:return: A list of networks of the same class, sorted by address.
+	"""
+	if not nets:
+		return []
+	cls = type(nets[0])
+	bits = cls._MAXPREFIX
+
+	ranges = []
+	for addr, prefix in sorted(n.network() for n in nets):
+		end = addr + (1 << (bits - prefix))
+		if ranges and addr <= ranges[-1][1]:
+			if end > ranges[-1][1]:
+				ranges[-1][1] = end
+		else:
+			ranges.append([addr, end])
+
+	aggregates = []
+	for addr, end in ranges:
+		while addr < end:
+			# Largest block that is aligned to addr and does not exceed end
+			size = (addr & -addr).bit_length() - 1 if addr else bits
+			while 1 << size > end - addr:
+				size -= 1
+			aggregates.append(cls.fromint(addr, bits - size, check=False))
+			addr += 1 << size
+	return aggregates
+
+def _sequence(nets):
+	""" Read one-shot iterables (e.g., generators), which can only be scanned once """
+	if isinstance(nets, collections.abc.Sequence) or (numpy is not None and isinstance(nets, numpy.ndarray)):
+		return nets
+	return list(nets)
+
+def _integers(nets):
+	""" Tell integer addresses from text """
+	if numpy is not None and isinstance(nets, numpy.ndarray):
+		return nets.dtype.kind in 'ui'
+	for n in nets:
+		return isinstance(n, numbers.Integral)
+	return False
+
+def _expand(prefixes, default, count):
+	""" One prefix length for each address """
+	if prefixes is None:
+		prefixes = default
+	if isinstance(prefixes, numbers.Integral):
+		return [int(prefixes)] * count
+	prefixes = list(prefixes)
+	if len(prefixes) != count:
+		raise ValueError("Number of prefixes and addresses differ")
+	return prefixes
+
+def _build(cls, addrs, prefs, unique):
+	""" Create the targets from validated (address, prefix) values """
+	fromint = cls.fromint
+	pairs = zip(addrs, prefs)
+	if unique:
+		pairs = dict.fromkeys(pairs)
+	return [fromint(a, p, check=False) for a, p in pairs]
+
+def _ipv4_from_ints(nets, prefixes):
+	""" Validate integer IPv4 addresses """
+	if numpy is None:
+		addrs = [int(a) for a in nets]
+		prefs = _expand(prefixes, 32, len(addrs))
+		for a, p in zip(addrs, prefs):
+			IPv4Net._check(a, p)
+		return addrs, prefs
+
+	addrs = numpy.asarray(nets).astype(numpy.int64)
+	prefs = numpy.broadcast_to(numpy.asarray(32 if prefixes is None else prefixes, dtype=numpy.int64), addrs.shape)
+	ok = (addrs >= 0) & (addrs < 1 << 32) & (prefs >= 0) & (prefs <= 32)
+	ok &= (addrs & ~_ipv4_netmasks(numpy.where(ok, prefs, 32))) == 0
+	if not ok.all():
+		i = int(numpy.argmin(ok))
+		IPv4Net._check(int(addrs[i]), int(prefs[i]))
+	return addrs.tolist(), prefs.tolist()
+
+def _ipv4_netmasks(prefs):
+	return ((1 << prefs) - 1) << (32 - prefs)
+
+def _ipv4_from_text(nets):
+	""" Parse IPv4 networks (pure python) """
+	addrs = []
+	prefs = []
+	for n in nets:
+		parsed = _parse_ipv4(n) if isinstance(n, str) else None
+		if parsed is None:
+			net = IPv4Net(n)
+			parsed = net._addr, net._prefix
+		addrs.append(parsed[0])
+		prefs.append(parsed[1])
+	return addrs, prefs
+
+def _parse_ipv4(text):
+	""" Parse an IPv4 network in the common form
+
+		:return: The (address, prefix) pair, or `None` if `text` must be parsed by `IPv4Net`.
+	"""
+	m = _IPV4_RE.fullmatch(text)
+	if m is None:
+		return None
+	addr = 0
+	for octet in m.group(1, 2, 3, 4):
+		if len(octet) > 1 and octet[0] == '0':
+			return None
+		value = int(octet)
+		if value > 255:
+			return None
+		addr = addr << 8 | value
+	prefix = m.group(5)
+	prefix = 32 if prefix is None else int(prefix)
+	if prefix > 32 or addr & ~IPv4Net._netmask(prefix):
+		return None
+	return addr, prefix
+
+def _ipv4_from_text_numpy(nets):
+	""" Parse IPv4 networks (vectorized) """
+	nets = nets if isinstance(nets, numpy.ndarray) else list(nets)
+	try:
+		data = numpy.asarray(nets, dtype=numpy.bytes_)
+		length = numpy.fromiter(map(len, nets), dtype=numpy.int64, count=len(nets))
+	except (UnicodeEncodeError, TypeError, ValueError):
+		return _ipv4_from_text(nets)
+	if data.ndim != 1:
+		return _ipv4_from_text(nets)
+
+	n = len(data)
+	addrs = numpy.zeros(n, dtype=numpy.int64)
+	prefs = numpy.zeros(n, dtype=numpy.int64)
+	# numpy drops trailing null characters, which must be rejected by IPv4Net
+	short = (length <= _IPV4_MAXLEN) & (numpy.char.str_len(data) == length)
+	ok = numpy.zeros(n, dtype=bool)
+	addrs[short], prefs[short], ok[short] = _parse_ipv4_array(data[short].astype(f'S{_IPV4_MAXLEN}'))
+
+	addrs = addrs.tolist()
+	prefs = prefs.tolist()
+	for i in numpy.flatnonzero(~ok).tolist():
+		net = IPv4Net(nets[i])
+		addrs[i] = net._addr
+		prefs[i] = net._prefix
+	return addrs, prefs
+
+def _parse_ipv4_array(data):
+	""" Parse fixed-length byte strings in the common IPv4 form
+
+		The strings are scanned column by column, for all of them at once: digits are accumulated in the
+		value of the current field, which is shifted into the address at each separator.
+		:return: Addresses, prefixes, and a mask of the strings that have been correctly parsed.
+	"""
+	n = len(data)
+	width = data.dtype.itemsize
+	columns = numpy.ascontiguousarray(data.view(numpy.uint8).reshape(n, width).T, dtype=numpy.int64)
+
+	bad = numpy.zeros(n, dtype=bool)
+	ended = numpy.zeros(n, dtype=bool)
+	slashed = numpy.zeros(n, dtype=bool)
+	leading_zero = numpy.zeros(n, dtype=bool)
+	dots = numpy.zeros(n, dtype=numpy.int64)
+	digits = numpy.zeros(n, dtype=numpy.int64)
+	value = numpy.zeros(n, dtype=numpy.int64)
+	addr = numpy.zeros(n, dtype=numpy.int64)
+	for c in columns:
+		digit = (c >= ord('0')) & (c <= ord('9'))
+		dot = c == ord('.')
+		slash = c == ord('/')
+		pad = c == 0
+		bad |= ~(digit | dot | slash | pad) | (ended & ~pad)
+		ended |= pad
+
+		sep = dot | slash
+		bad |= sep & ((digits == 0) | (value > 255) | (leading_zero & (digits > 1)) | slashed)
+		bad |= slash & (dots != 3)
+		dots += dot
+		slashed |= slash
+		addr = numpy.where(sep, addr << 8 | value, addr)
+
+		leading_zero = numpy.where(digit & (digits == 0), c == ord('0'), leading_zero & ~sep)
+		value = numpy.where(sep, 0, numpy.where(digit, value * 10 + c - ord('0'), value))
+		digits = numpy.where(sep, 0, digits + digit)
+
+	# The last field is either the fourth octet or the prefix
+	bad |= (digits == 0) | (dots != 3)
+	bad |= ~slashed & ((value > 255) | (leading_zero & (digits > 1)))
+	bad |= slashed & ((digits > 2) | (value > 32))
+	prefs = numpy.where(slashed & ~bad, value, 32)
+	addrs = numpy.where(slashed, addr, addr << 8 | value)
+	bad |= (addrs & ~_ipv4_netmasks(prefs)) != 0
+	return addrs, prefs, ~bad
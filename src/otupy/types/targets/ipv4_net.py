@@ -26,6 +26,9 @@ class IPv4Net:
 		
 	"""
 #ipv4_net: str
+	__slots__ = ('_addr', '_prefix', '_text')
+
+	_MAXPREFIX = 32
 	
 	def __init__(self, ipv4_net=None, prefix=None):
 		""" Initialize IPv4 Address Range
@@ -33,30 +36,111 @@ class IPv4Net:
 			Initialize `IPv4Net with IPv4 address and prefix.
 			If no IPv4 address is given, initialize to null address.
 			If no prefix is given, assume /32 (iPv4 address only).
-			:param ipv4_net: IPv4 Network Address.
+			The text is parsed only once: the network is stored as a pair of integers
+			(network address, prefix length).
+			:param ipv4_net: IPv4 Network Address (text, `IPv4Net`, or `ipaddress.IPv4Network`).
 			:param prefix: IPv4 Network Adress Prefix.
 		"""
 		if ipv4_net is None:
-		    net = ipaddress.IPv4Network("0.0.0.0/0")
-		elif prefix is None:
+			self._addr = 0
+			self._prefix = 0
+			self._text = None
+			return
+		if isinstance(ipv4_net, IPv4Net) and prefix is None:
+			self._addr = ipv4_net._addr
+			self._prefix = ipv4_net._prefix
+			self._text = ipv4_net._text
+			return
+
+		if prefix is None:
 		    net = ipaddress.IPv4Network(ipv4_net)
 		else:
-		    tmp = ipv4_net + "/" + str(prefix)
+		    tmp = str(ipv4_net) + "/" + str(prefix)
 		    net = ipaddress.IPv4Network(tmp)
 
-		self.__ipv4_net = net.exploded
+		self._addr = int(net.network_address)
+		self._prefix = net.prefixlen
+		self._text = None
+
+	@classmethod
+	def fromint(cls, addr, prefix=32, check=True):
+		""" Create an `IPv4Net` from integers
+
+			This is the fast path to build networks without any text parsing.
+			:param addr: The network address, as integer.
+			:param prefix: The prefix length.
+			:param check: Validate the values (only skip it for values that have already been validated).
+			:return: A new `IPv4Net`.
+		"""
+		if check:
+			cls._check(addr, prefix)
+		net = object.__new__(cls)
+		net._addr = addr
+		net._prefix = prefix
+		net._text = None
+		return net
+
+	@classmethod
+	def _check(cls, addr, prefix):
+		if not 0 <= prefix <= cls._MAXPREFIX:
+			raise ValueError("Invalid prefix length: " + str(prefix))
+		if not 0 <= addr < 1 << cls._MAXPREFIX:
+			raise ValueError("Invalid IPv4 address: " + str(addr))
+		if addr & ~cls._netmask(prefix):
+			raise ValueError("Host bits set in IPv4 network: " + str(addr))
+
+	@classmethod
+	def _netmask(cls, prefix):
+		return ((1 << prefix) - 1) << (cls._MAXPREFIX - prefix)
 	
 	def addr(self):
 		""" Returns address part only (no prefix) """
-		return ipaddress.IPv4Network(self.__ipv4_net).network_address.exploded
+		a = self._addr
+		return f"{a >> 24}.{(a >> 16) & 0xff}.{(a >> 8) & 0xff}.{a & 0xff}"
 	
 	def prefix(self):
 		""" Returns prefix only """
-		return ipaddress.IPv4Network(self.__ipv4_net).prefixlen
+		return self._prefix
+
+	def network(self):
+		""" Returns the network as (integer address, prefix length) """
+		return self._addr, self._prefix
+
+	def overlaps(self, other):
+		""" Check whether two networks share any address
+
+			:param other: An `IPv4Net`.
+			:return: `True` if any address belongs to both networks.
+			:raise TypeError: if `other` is not an `IPv4Net`.
+		"""
+		if not isinstance(other, IPv4Net):
+			raise TypeError("Cannot compare IPv4Net with " + type(other).__name__)
+		prefix = min(self._prefix, other._prefix)
+		mask = self._netmask(prefix)
+		return (self._addr & mask) == (other._addr & mask)
+
+	def __contains__(self, item):
+		""" Check whether an address (`IPv4Addr`) or a network (`IPv4Net`) falls within this network """
+		if isinstance(item, IPv4Net):
+			if item._prefix < self._prefix:
+				return False
+			return (item._addr & self._netmask(self._prefix)) == self._addr
+		if isinstance(item, otupy.types.data.IPv4Addr):
+			return (int(item) & self._netmask(self._prefix)) == self._addr
+		return False
+
+	def __eq__(self, other):
+		if not isinstance(other, IPv4Net):
+			return NotImplemented
+		return self._addr == other._addr and self._prefix == other._prefix
+
+	def __hash__(self):
+		return hash((self._addr, self._prefix))
 	
 	def __str__(self):
-	    return ipaddress.IPv4Network(self.__ipv4_net).exploded
+		if self._text is None:
+			self._text = self.addr() + "/" + str(self._prefix)
+		return self._text
 	
 	def __repr__(self):
-	    return ipaddress.IPv4Network(self.__ipv4_net).exploded
-
+		return self.__str__()
@@ -1,6 +1,7 @@
 import ipaddress
 
 from otupy.core.target import target
+from otupy.types.data.ipv6_addr import IPv6Addr
 
 @target('ipv6_net')
 class IPv6Net:
@@ -25,38 +26,121 @@ class IPv6Net:
 		
 	"""
 	
+	__slots__ = ('_addr', '_prefix', '_text')
+
+	_MAXPREFIX = 128
+	
 	def __init__(self, ipv6_net=None, prefix=None):
 		""" Initialize IPv6 Address Range
 
 			Initialize `IPv6Net with IPv6 address and prefix.
 			If no IPv6 address is given, initialize to null address.
 			If no prefix is given, assume /128 (IPv6 address only).
-			:param ipv6_net: IPv6 Network Address.
+			The text is parsed only once: the network is stored as a pair of integers
+			(network address, prefix length).
+			:param ipv6_net: IPv6 Network Address (text, `IPv6Net`, or `ipaddress.IPv6Network`).
 			:param prefix: IPv6 Network Adress Prefix.
 		"""
 		if ipv6_net is None:
-		    net = ipaddress.IPv6Network("::/0")
-		elif prefix is None:
+			self._addr = 0
+			self._prefix = 0
+			self._text = None
+			return
+		if isinstance(ipv6_net, IPv6Net) and prefix is None:
+			self._addr = ipv6_net._addr
+			self._prefix = ipv6_net._prefix
+			self._text = ipv6_net._text
+			return
+
+		if prefix is None:
 		    net = ipaddress.IPv6Network(ipv6_net)
 		else:
-		    tmp = ipv6_net + "/" + str(prefix)
+		    tmp = str(ipv6_net) + "/" + str(prefix)
 		    net = ipaddress.IPv6Network(tmp)
 
-		self.__ipv6_net = net.exploded
+		self._addr = int(net.network_address)
+		self._prefix = net.prefixlen
+		self._text = None
+
+	@classmethod
+	def fromint(cls, addr, prefix=128, check=True):
+		""" Create an `IPv6Net` from integers
+
+			This is the fast path to build networks without any text parsing.
+			:param addr: The network address, as integer.
+			:param prefix: The prefix length.
+			:param check: Validate the values (only skip it for values that have already been validated).
+			:return: A new `IPv6Net`.
+		"""
+		if check:
+			cls._check(addr, prefix)
+		net = object.__new__(cls)
+		net._addr = addr
+		net._prefix = prefix
+		net._text = None
+		return net
+
+	@classmethod
+	def _check(cls, addr, prefix):
+		if not 0 <= prefix <= cls._MAXPREFIX:
+			raise ValueError("Invalid prefix length: " + str(prefix))
+		if not 0 <= addr < 1 << cls._MAXPREFIX:
+			raise ValueError("Invalid IPv6 address: " + str(addr))
+		if addr & ~cls._netmask(prefix):
+			raise ValueError("Host bits set in IPv6 network: " + str(addr))
+
+	@classmethod
+	def _netmask(cls, prefix):
+		return ((1 << prefix) - 1) << (cls._MAXPREFIX - prefix)
 	
 	def addr(self):
 		""" Returns address part only (no prefix) """
-		return ipaddress.IPv6Network(self.__ipv6_net).network_address.exploded
+		return ipaddress.IPv6Address(self._addr).exploded
 	
 	def prefix(self):
 		""" Returns prefix only """
-		return ipaddress.IPv6Network(self.__ipv6_net).prefixlen
+		return self._prefix
+
+	def network(self):
+		""" Returns the network as (integer address, prefix length) """
+		return self._addr, self._prefix
+
+	def overlaps(self, other):
+		""" Check whether two networks share any address
+
+			:param other: An `IPv6Net`.
+			:return: `True` if any address belongs to both networks.
+			:raise TypeError: if `other` is not an `IPv6Net`.
+		"""
+		if not isinstance(other, IPv6Net):
+			raise TypeError("Cannot compare IPv6Net with " + type(other).__name__)
+		prefix = min(self._prefix, other._prefix)
+		mask = self._netmask(prefix)
+		return (self._addr & mask) == (other._addr & mask)
+
+	def __contains__(self, item):
+		""" Check whether an address (`IPv6Addr`) or a network (`IPv6Net`) falls within this network """
+		if isinstance(item, IPv6Net):
+			if item._prefix < self._prefix:
+				return False
+			return (item._addr & self._netmask(self._prefix)) == self._addr
+		if isinstance(item, IPv6Addr):
+			return (int(item) & self._netmask(self._prefix)) == self._addr
+		return False
+
+	def __eq__(self, other):
+		if not isinstance(other, IPv6Net):
+			return NotImplemented
+		return self._addr == other._addr and self._prefix == other._prefix
+
+	def __hash__(self):
+		return hash((self._addr, self._prefix))
 	
 	def __str__(self):
-#return ipaddress.IPv6Network(self.__ipv6_net).exploded
-	    return ipaddress.IPv6Network(self.__ipv6_net).compressed
+		if self._text is None:
+#self._text = ipaddress.IPv6Address(self._addr).exploded + "/" + str(self._prefix)
+			self._text = ipaddress.IPv6Address(self._addr).compressed + "/" + str(self._prefix)
+		return self._text
 	
 	def __repr__(self):
-#return ipaddress.IPv6Network(self.__ipv6_net).exploded
-	    return ipaddress.IPv6Network(self.__ipv6_net).compressed
-
+		return self.__str__()
@@ -0,0 +1,239 @@
+import pytest
+import threading
+import time
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.actuators.iptables_manager import FakeExecutor, RuleBatcher
+from otupy.actuators.iptables_actuator import IptablesActuator
+from otupy.actuators.rule_scheduler import now
+
+
+@pytest.fixture
+def executor(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	return FakeExecutor()
+
+def deny(net):
+	return oc2.Command(oc2.Actions.deny, oc2.IPv4Net(net))
+
+def rule_number(rsp):
+	assert rsp['status'] == oc2.StatusCode.OK
+	return int(rsp['results']['rule_number'])
+
+def test_aggregation(executor):
+	actuator = IptablesActuator(executor=executor)
+	rules = executor.rules
+	nets = ["10.0.0.0/25", "10.0.0.128/25", "10.0.0.64/26", "10.0.1.0/24", "192.168.1.1"]
+	rsps = actuator.run_batch([deny(n) for n in nets])
+
+	assert rules == ["iptables -A INPUT -s 10.0.0.0/23 -j DROP", "iptables -A INPUT -s 192.168.1.1/32 -j DROP"]
+	assert len({rule_number(r) for r in rsps}) == len(nets)
+
+	# Deleting one of the aggregated commands re-inserts the others
+	delete = oc2.Command(oc2.Actions.delete, slpf.RuleID(rule_number(rsps[0])))
+	assert actuator.run(delete)['status'] == oc2.StatusCode.OK
+	assert sorted(rules) == ["iptables -A INPUT -s 10.0.0.128/25 -j DROP", "iptables -A INPUT -s 10.0.0.64/26 -j DROP",
+		"iptables -A INPUT -s 10.0.1.0/24 -j DROP", "iptables -A INPUT -s 192.168.1.1/32 -j DROP"]
+
+	delete = oc2.Command(oc2.Actions.delete, slpf.RuleID(rule_number(rsps[4])))
+	assert actuator.run(delete)['status'] == oc2.StatusCode.OK
+	assert "iptables -A INPUT -s 192.168.1.1/32 -j DROP" not in rules
+
+def allow(net):
+	return oc2.Command(oc2.Actions.allow, oc2.IPv4Net(net))
+
+def test_aggregation_order(executor):
+	actuator = IptablesActuator(executor=executor)
+	rsps = actuator.run_batch([deny("10.0.0.0/24"), allow("10.0.1.5/32"), deny("10.0.1.0/24")])
+	assert all(r['status'] == oc2.StatusCode.OK for r in rsps)
+	# Only consecutive commands are aggregated: the allow rule is still matched first
+	assert executor.rules == ["iptables -A INPUT -s 10.0.0.0/24 -j DROP", "iptables -A INPUT -s 10.0.1.5/32 -j ACCEPT",
+		"iptables -A INPUT -s 10.0.1.0/24 -j DROP"]
+
+	# Commands are checked against the previous ones in the batch
+	rsps = actuator.run_batch([deny("10.2.0.0/16"), allow("10.2.3.0/24"), deny("10.2.4.0/24"), deny("10.2.4.0/24")])
+	assert rsps[1]['status'] == oc2.StatusCode.BADREQUEST
+	assert rule_number(rsps[2]) == rule_number(rsps[0])
+	assert rule_number(rsps[3]) == rule_number(rsps[0])
+	assert len(executor.rules) == 4
+
+def test_aggregation_delete_order(executor):
+	actuator = IptablesActuator(executor=executor)
+	rsps = actuator.run_batch([deny("10.0.0.0/25"), deny("10.0.0.128/25"), deny("10.0.1.0/24")])
+	actuator.run(allow("192.168.0.0/16"))
+	assert executor.rules == ["iptables -A INPUT -s 10.0.0.0/23 -j DROP", "iptables -A INPUT -s 192.168.0.0/16 -j ACCEPT"]
+
+	# The remaining networks take the place of the deleted rule
+	delete = oc2.Command(oc2.Actions.delete, slpf.RuleID(rule_number(rsps[1])))
+	assert actuator.run(delete)['status'] == oc2.StatusCode.OK
+	assert executor.rules == ["iptables -A INPUT -s 10.0.0.0/25 -j DROP", "iptables -A INPUT -s 10.0.1.0/24 -j DROP",
+		"iptables -A INPUT -s 192.168.0.0/16 -j ACCEPT"]
+
+def test_aggregation_window(executor):
+	actuator = IptablesActuator(executor=executor, aggregate_window=0.2)
+	nets = [f"10.7.{i}.0/24" for i in range(4)]
+	rsps = [None] * len(nets)
+	def run(i):
+		rsps[i] = actuator.run(deny(nets[i]))
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(len(nets))]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	# Commands received by run are aggregated
+	assert len({rule_number(r) for r in rsps}) == len(nets)
+	assert executor.rules == ["iptables -A INPUT -s 10.7.0.0/22 -j DROP"]
+	conn = oc2.Command(oc2.Actions.deny, oc2.IPv4Connection(src_addr=oc2.IPv4Net("192.168.0.0/16"), protocol=oc2.L4Protocol.tcp))
+	assert rule_number(actuator.run(conn)) > 0
+	actuator.close()
+
+def test_ipv6_not_supported(executor):
+	actuator = IptablesActuator(executor=executor)
+	rsp = actuator.run(oc2.Command(oc2.Actions.query, oc2.Features([oc2.Feature.pairs])))
+	assert oc2.TargetEnum.ipv6_net not in rsp['results']['pairs'][oc2.Actions.deny]
+	rsp = actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv6Net("2001:db8::/32")))
+	assert rsp['status'] == oc2.StatusCode.NOTIMPLEMENTED
+	assert rsp['status_text'] == 'Invalid Action/Target pair'
+	actuator.close()
+
+def test_batching(executor):
+	actuator = IptablesActuator(executor=executor, batch_window=0.5)
+	nets = [f"10.0.{i}.0/24" for i in range(20)]
+	rsps = [None] * len(nets)
+	def run(i):
+		rsps[i] = actuator.run(deny(nets[i]))
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(len(nets))]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	assert all(r['status'] == oc2.StatusCode.OK for r in rsps)
+	assert len(executor.calls) == 1
+	program, payload = executor.calls[0]
+	assert program == "iptables"
+	assert payload.startswith("*filter\n") and payload.endswith("COMMIT\n")
+	assert sorted(executor.rules) == sorted(f"iptables -A INPUT -s {n} -j DROP" for n in nets)
+
+def test_batch_failure(executor):
+	batcher = RuleBatcher(executor, window=0.01)
+	results = batcher.submit_many(["iptables -A INPUT -s 10.0.0.1/32 -j DROP", "iptables -D INPUT -s 10.0.0.2/32 -j DROP"])
+	# The batch fails as a whole, then each rule is applied on its own
+	assert results == [200, 500]
+	assert executor.rules == ["iptables -A INPUT -s 10.0.0.1/32 -j DROP"]
+
+def test_duplicates(executor):
+	actuator = IptablesActuator(executor=executor)
+	first = rule_number(actuator.run(deny("10.1.0.0/16")))
+	# Identical and shadowed rules are not installed again
+	assert rule_number(actuator.run(deny("10.1.0.0/16"))) == first
+	assert rule_number(actuator.run(deny("10.1.2.0/24"))) == first
+	assert actuator.run_batch([deny("10.1.3.4")])[0]['results']['rule_number'] == first
+	assert executor.rules == ["iptables -A INPUT -s 10.1.0.0/16 -j DROP"]
+
+	# A different action on the same addresses is a conflict
+	rsp = actuator.run(oc2.Command(oc2.Actions.allow, oc2.IPv4Net("10.1.2.0/24")))
+	assert rsp['status'] == oc2.StatusCode.BADREQUEST
+	# Partial overlaps are installed
+	assert rule_number(actuator.run(deny("10.0.0.0/8"))) != first
+	assert len(executor.rules) == 2
+
+	conn = oc2.Command(oc2.Actions.deny, oc2.IPv4Connection(src_addr=oc2.IPv4Net("192.168.0.0/16"), protocol=oc2.L4Protocol.tcp, dst_port=22))
+	assert rule_number(actuator.run(conn)) == rule_number(actuator.run(conn))
+	assert len(executor.rules) == 3
+
+	# The index is rebuilt from the database, and updated when rules are deleted
+	actuator = IptablesActuator(executor=executor)
+	assert rule_number(actuator.run(deny("10.1.2.0/24"))) == first
+	assert actuator.run(oc2.Command(oc2.Actions.delete, slpf.RuleID(first)))['status'] == oc2.StatusCode.OK
+	assert rule_number(actuator.run(deny("10.1.2.0/24"))) != first
+
+def test_concurrent_duplicates(executor):
+	actuator = IptablesActuator(executor=executor, batch_window=0.2)
+	rsps = [None] * 10
+	def run(i):
+		rsps[i] = actuator.run(deny("10.3.0.0/16"))
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(len(rsps))]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+
+	assert len({rule_number(r) for r in rsps}) == 1
+	assert executor.rules == ["iptables -A INPUT -s 10.3.0.0/16 -j DROP"]
+
+def wait_for(condition, timeout=5):
+	deadline = time.time() + timeout
+	while not condition():
+		assert time.time() < deadline
+		time.sleep(0.01)
+
+def test_expiry(executor):
+	actuator = IptablesActuator(executor=executor)
+	args = oc2.Args({'duration': oc2.Duration(300)})
+	rsps = actuator.run_batch([oc2.Command(oc2.Actions.deny, oc2.IPv4Net(f"10.4.{i}.0/24"), args=args) for i in range(100)])
+	assert all(r['status'] == oc2.StatusCode.OK for r in rsps)
+	permanent = rule_number(actuator.run(deny("10.5.0.0/16")))
+	expiring = rule_number(actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("10.6.0.0/16"), args=args)))
+	assert len(executor.rules) == 5
+	calls = len(executor.calls)
+
+	wait_for(lambda: len(actuator.db.get_commands()) == 1)
+	assert executor.rules == ["iptables -A INPUT -s 10.5.0.0/16 -j DROP"]
+	# Simultaneous expirations are applied with a single transaction
+	assert len(executor.calls) <= calls + 2
+	assert [rule_number for rule_number, _ in actuator.db.get_commands()] == [permanent]
+	assert actuator.db.get_timers() == {}
+	# Expired rules do not shadow new rules
+	assert rule_number(actuator.run(deny("10.6.1.0/24"))) != expiring
+	actuator.close()
+
+def test_expiry_missing_rule(executor):
+	actuator = IptablesActuator(executor=executor)
+	args = oc2.Args({'duration': oc2.Duration(300)})
+	rsps = actuator.run_batch([oc2.Command(oc2.Actions.deny, oc2.IPv4Net(f"10.11.{i}.0/24"), args=args) for i in (0, 2)])
+	missing, present = [rule_number(r) for r in rsps]
+	# The row is lost, but the timer is still there
+	with actuator.db._lock:
+		actuator.db._write([('DELETE FROM commands WHERE rule_number = ?', [(missing,)])])
+		actuator.db._remove(missing)
+
+	wait_for(lambda: actuator.db.get_timers() == {})
+	assert actuator.db.get_command_from_rule_number(present) is None
+	assert executor.rules == ["iptables -A INPUT -s 10.11.0.0/24 -j DROP"]
+	actuator.close()
+
+def test_start_time(executor):
+	actuator = IptablesActuator(executor=executor)
+	start = now() + 300
+	args = oc2.Args({'start_time': oc2.DateTime(start), 'stop_time': oc2.DateTime(start + 300)})
+	rule = rule_number(actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("10.7.0.0/16"), args=args)))
+	assert executor.rules == []
+	wait_for(lambda: len(executor.rules) == 1)
+	assert now() >= start - actuator.scheduler.slack
+	wait_for(lambda: actuator.db.get_command_from_rule_number(rule) is None)
+	assert executor.rules == []
+
+	args = oc2.Args({'start_time': oc2.DateTime(now() + 10000)})
+	rule = rule_number(actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("10.8.0.0/16"), args=args)))
+	assert actuator.run(oc2.Command(oc2.Actions.delete, slpf.RuleID(rule)))['status'] == oc2.StatusCode.OK
+	assert len(actuator.scheduler) == 0
+
+	bad = oc2.Args({'start_time': oc2.DateTime(now()), 'stop_time': oc2.DateTime(now() + 1000), 'duration': oc2.Duration(1000)})
+	assert actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("10.9.0.0/16"), args=bad))['status'] == oc2.StatusCode.BADREQUEST
+	actuator.close()
+
+def test_timers_restart(executor):
+	actuator = IptablesActuator(executor=executor)
+	args = oc2.Args({'duration': oc2.Duration(400)})
+	actuator.run_batch([oc2.Command(oc2.Actions.deny, oc2.IPv4Net(f"10.10.{i}.0/24"), args=args) for i in range(0, 256, 2)])
+	actuator.close()
+	assert len(executor.rules) == 128
+
+	# Timers are restored from the database
+	actuator = IptablesActuator(executor=executor)
+	assert len(actuator.scheduler) == 128
+	wait_for(lambda: len(executor.rules) == 0)
+	actuator.close()
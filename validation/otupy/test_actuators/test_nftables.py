@@ -0,0 +1,90 @@
+import pytest
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.actuators.nftables_manager import FakeNftExecutor
+from otupy.actuators.nftables_actuator import NftablesActuator
+from otupy.actuators.SQLDatabase import SQLDatabase
+
+
+@pytest.fixture
+def nft(monkeypatch, tmp_path):
+	monkeypatch.chdir(tmp_path)
+	return FakeNftExecutor()
+
+def rule_number(rsp):
+	assert rsp['status'] == oc2.StatusCode.OK
+	return int(rsp['results']['rule_number'])
+
+def delete(actuator, rsp):
+	return actuator.run(oc2.Command(oc2.Actions.delete, slpf.RuleID(rule_number(rsp))))
+
+def test_nets(nft):
+	actuator = NftablesActuator(executor=nft)
+	rsps = actuator.run_batch([oc2.Command(oc2.Actions.deny, oc2.IPv4Net(n)) for n in ["10.0.0.0/25", "10.0.0.128/25", "10.0.0.0/24"]])
+	rsps.append(actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv6Net("2001:db8::/32"))))
+	assert nft.sets['deny_net_v4'] == {"10.0.0.0/24"}
+	assert nft.sets['deny_net_v6'] == {"2001:db8::/32"}
+	# One script to set up the table, one for the batch, one for the IPv6 network
+	assert len(nft.scripts) == 3
+
+	assert delete(actuator, rsps[2])['status'] == oc2.StatusCode.OK
+	assert delete(actuator, rsps[0])['status'] == oc2.StatusCode.OK
+	assert nft.sets['deny_net_v4'] == {"10.0.0.128/25"}
+	assert "delete element inet openc2 deny_net_v4 { 10.0.0.0/24 }" in nft.scripts[-1]
+
+def test_connections(nft):
+	actuator = NftablesActuator(executor=nft)
+	conn = oc2.IPv4Connection(src_addr="10.0.0.1", dst_port=80, protocol='tcp')
+	rsp = actuator.run(oc2.Command(oc2.Actions.allow, conn))
+	assert nft.sets['allow_conn_v4'] == {"10.0.0.1/32 . 0.0.0.0/0 . tcp . 0-65535 . 80"}
+	assert delete(actuator, rsp)['status'] == oc2.StatusCode.OK
+	assert nft.sets['allow_conn_v4'] == set()
+
+def test_restart(nft):
+	actuator = NftablesActuator(executor=nft)
+	actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("192.168.0.0/16")))
+	# Rules are installed again from the database
+	nft.sets.clear()
+	NftablesActuator(executor=nft)
+	assert nft.sets['deny_net_v4'] == {"192.168.0.0/16"}
+
+def test_foreign_rules(nft, tmp_path):
+	actuator = NftablesActuator(executor=nft)
+	assert (tmp_path / "nftables_commands.db").exists()
+	rsp = actuator.run(oc2.Command(oc2.Actions.deny, oc2.IPv4Net("192.168.0.0/16")))
+	db = SQLDatabase("nftables_commands.db")
+	db.init_db()
+	foreign = db.insert_command("iptables -A INPUT -s 10.0.0.0/8 -j DROP")
+	db.close()
+
+	# Rules that are not nftables elements are skipped
+	nft.sets.clear()
+	actuator = NftablesActuator(executor=nft)
+	assert nft.sets['deny_net_v4'] == {"192.168.0.0/16"}
+	rsp = actuator.run(oc2.Command(oc2.Actions.delete, slpf.RuleID(foreign)))
+	assert rsp['status'] == oc2.StatusCode.INTERNALERROR
+	assert nft.sets['deny_net_v4'] == {"192.168.0.0/16"}
+
+def test_query_features(nft):
+	actuator = NftablesActuator(executor=nft)
+	rsp = actuator.run(oc2.Command(oc2.Actions.query, oc2.Features([oc2.Feature.profiles])))
+	assert rsp['status'] == oc2.StatusCode.OK
+
+def test_pairs(nft):
+	actuator = NftablesActuator(executor=nft)
+	rsp = actuator.run(oc2.Command(oc2.Actions.query, oc2.Features([oc2.Feature.pairs])))
+	assert oc2.TargetEnum.ipv6_net in rsp['results']['pairs'][oc2.Actions.deny]
+	assert oc2.TargetEnum.ipv6_connection in rsp['results']['pairs'][oc2.Actions.allow]
+	conn = oc2.IPv6Connection(src_addr="2001:db8::1", protocol='tcp')
+	assert actuator.run(oc2.Command(oc2.Actions.allow, conn, args=slpf.Args({'direction': slpf.Direction.ingress})))['status'] == oc2.StatusCode.OK
+	# The pairs of the SLPF profile, shared by the other actuators, are unchanged
+	assert oc2.TargetEnum.ipv6_net not in slpf.AllowedCommandTarget[oc2.Actions.deny]
+
+def test_temporary_rules(nft):
+	actuator = NftablesActuator(executor=nft)
+	args = slpf.Args({'duration': 60000})
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net("10.0.0.0/8"), args=args)
+	assert actuator.run(cmd)['status'] == oc2.StatusCode.NOTIMPLEMENTED
+	assert actuator.run_batch([cmd])[0]['status'] == oc2.StatusCode.NOTIMPLEMENTED
+	assert nft.sets['deny_net_v4'] == set()
@@ -0,0 +1,61 @@
+import sqlite3
+
+from otupy.actuators.SQLDatabase import SQLDatabase
+
+
+def test_store(tmp_path):
+	path = str(tmp_path / "rules.db")
+	db = SQLDatabase(path)
+	db.init_db()
+	assert db.insert_command("iptables -A INPUT -s 10.0.0.1/32 -j DROP") == 1
+	assert db.insert_commands(["rule 2", "rule 3"]) == [2, 3]
+	assert db.insert_aggregated("rule 4", "10.0.0.0/24") == 4
+	assert db.delete_command_by_rule_number(2) == 0
+	assert db.update_command_by_rule_number(3, "rule 4") == 0
+	assert db.get_aggregated("rule 4") == [(4, "10.0.0.0/24")]
+	db.close()
+
+	# The database is stored in the given file
+	conn = sqlite3.connect(path)
+	assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+	conn.close()
+
+	db = SQLDatabase(path)
+	db.init_db()
+	assert db.get_command_from_rule_number(1) == ("iptables -A INPUT -s 10.0.0.1/32 -j DROP",)
+	assert db.get_command_from_rule_number(2) is None
+	assert sorted(db.get_commands()) == [(1, "iptables -A INPUT -s 10.0.0.1/32 -j DROP"), (3, "rule 4"), (4, "rule 4")]
+	# Rule numbers are not reused
+	assert db.insert_command("rule 5") == 5
+	assert db.insert_command("rule 1", 1) == -1
+
+def test_rule_numbers_not_reused(tmp_path):
+	path = str(tmp_path / "rules.db")
+	db = SQLDatabase(path)
+	db.init_db()
+	assert db.insert_commands(["rule 1", "rule 2", "rule 3"]) == [1, 2, 3]
+	assert db.delete_command_by_rule_number(3) == 0
+	db.close()
+
+	# The last rule has been deleted, but its number is not given again after a restart
+	db = SQLDatabase(path)
+	db.init_db()
+	assert db.insert_command("rule 4") == 4
+	assert db.insert_command("rule 9", 9) == 9
+	assert db.delete_commands([4, 9]) == 0
+	db.close()
+
+	db = SQLDatabase(path)
+	db.init_db()
+	assert db.insert_command("rule 10") == 10
+	db.close()
+
+def test_update_failure(tmp_path):
+	db = SQLDatabase(str(tmp_path / "rules.db"))
+	db.init_db()
+	assert db.insert_command("rule 1") == 1
+	db._conn.execute('DROP TABLE commands')
+	# The error is reported, and the in-memory copy is left unchanged
+	assert db.update_command_by_rule_number(1, "rule 2") == -1
+	assert db.get_command_from_rule_number(1) == ("rule 1",)
+	db.close()
@@ -0,0 +1,43 @@
+import pytest
+
+cbor2 = pytest.importorskip("cbor2")
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.transfers.http import HTTPTransfer
+from otupy.encoders.cbor import CBOREncoder
+from otupy.encoders.json import JSONEncoder
+
+
+@pytest.fixture
+def artifact():
+	return oc2.Artifact(payload=oc2.Payload(oc2.Binary(b'\x00\x01abc')), hashes=oc2.Hashes({'sha256': oc2.Binaryx(b'\xff'*32)}))
+
+def test_native_binary(artifact):
+	dic = CBOREncoder.todict(artifact)
+	assert dic['payload']['bin'] == b'\x00\x01abc'
+	assert dic['hashes']['sha256'] == b'\xff'*32
+	# The intermediary representation of other encoders is not affected
+	assert JSONEncoder.todict(artifact)['payload']['bin'] == 'AAFhYmM='
+
+def test_roundtrip(artifact):
+	a = CBOREncoder.decode(CBOREncoder.encode(artifact), oc2.Artifact)
+	assert a.payload.obj.get() == b'\x00\x01abc'
+	assert type(a.hashes['sha256']) == oc2.Binaryx
+	assert a.hashes['sha256'].get() == b'\xff'*32
+
+def test_http_negotiation():
+	t = HTTPTransfer('127.0.0.1', 8080)
+	m = oc2.Message(oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8')))
+	m.from_ = 'producer'
+	m.to = ['consumer']
+	data = t._tohttp(m, CBOREncoder)
+	assert isinstance(data, bytes)
+
+	msg, encoder = t._fromhttp({'Content-type': 'application/openc2+cbor;version=1.0'}, data)
+	assert encoder == CBOREncoder
+	assert msg.content.action == oc2.Actions.deny
+
+	assert t._negotiate({'Accept': 'text/html, application/openc2+cbor;version=1.0'}, JSONEncoder) == CBOREncoder
+	assert t._negotiate({'Accept': 'application/openc2+xml'}, JSONEncoder) == JSONEncoder
+	assert t._negotiate({}, JSONEncoder) == JSONEncoder
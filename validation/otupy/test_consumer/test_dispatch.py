@@ -0,0 +1,292 @@
+import pytest
+import sqlite3
+import threading
+import time
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.actuators.mokup_slpf_actuator import MokupSlpfActuator
+from otupy.core.idempotency import ResponseCache
+
+
+class SlowActuator:
+	def __init__(self, delay=0.2):
+		self.delay = delay
+		self.commands = []
+		self.lock = threading.Lock()
+
+	def run(self, cmd):
+		time.sleep(self.delay)
+		with self.lock:
+			self.commands.append(cmd)
+		return oc2.Response(status=oc2.StatusCode.OK, status_text=str(cmd.target.getObj()))
+
+def message(net, asset_id='slow', response=oc2.ResponseType.ack, command_id=None):
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net(net), args=slpf.Args({'response_requested': response}),
+		actuator=slpf.Specifiers({'asset_id': asset_id}), command_id=command_id)
+	msg = oc2.Message(cmd)
+	msg.from_ = 'producer'
+	return msg
+
+def test_ack(): 
+	actuator = SlowActuator()
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): actuator})
+	msg = message('10.0.0.0/8', command_id='cmd-1')
+
+	start = time.perf_counter()
+	rsp = consumer.dispatch(msg)
+	assert time.perf_counter() - start < actuator.delay
+	assert rsp.content['status'] == oc2.StatusCode.PROCESSING
+	assert rsp.request_id == msg.request_id
+	assert consumer.result('producer', msg.request_id)['status'] == oc2.StatusCode.PROCESSING
+
+	# The final response is addressable by request_id and command_id
+	final = consumer.result('producer', msg.request_id, timeout=5)
+	assert final['status'] == oc2.StatusCode.OK
+	assert consumer.result('producer', 'cmd-1') is final
+	assert consumer.result('producer', 'unknown') is None
+
+def test_ack_producers():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): SlowActuator(0)}, dedup_size=0)
+	first = message('10.0.0.0/8', command_id='cmd-1')
+	second = message('192.168.0.0/16', command_id='cmd-1')
+	second.from_ = 'other'
+	consumer.dispatch(first)
+	consumer.dispatch(second)
+
+	# The same command_id from different Producers does not mix up the results
+	assert consumer.result('producer', 'cmd-1', timeout=5)['status_text'] == '10.0.0.0/8'
+	assert consumer.result('other', 'cmd-1', timeout=5)['status_text'] == '192.168.0.0/16'
+	assert consumer.result('other', first.request_id) is None
+
+def test_status_notify():
+	notified = []
+	done = threading.Event()
+	def notify(msg):
+		notified.append(msg)
+		done.set()
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): SlowActuator(0.01)}, notify=notify)
+	msg = message('10.0.0.0/8', response=oc2.ResponseType.status)
+	assert consumer.dispatch(msg).content['status'] == oc2.StatusCode.PROCESSING
+
+	assert done.wait(5)
+	assert notified[0].request_id == msg.request_id
+	assert notified[0].to == ['producer']
+	assert notified[0].content['status'] == oc2.StatusCode.OK
+
+def test_queues():
+	slow = SlowActuator(0.2)
+	fast = SlowActuator(0)
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): slow, (slpf.nsid, 'fast'): fast}, workers=2)
+	msgs = [message(f'10.0.{i}.0/24') for i in range(3)]
+	for m in msgs:
+		consumer.dispatch(m)
+	# Commands for another actuator are not delayed by the slow one
+	other = message('192.168.0.0/16', asset_id='fast')
+	consumer.dispatch(other)
+	assert consumer.result('producer', other.request_id, timeout=5)['status'] == oc2.StatusCode.OK
+	assert len(slow.commands) < len(msgs)
+
+	# Commands for the same actuator run in order
+	for m in msgs:
+		assert consumer.result('producer', m.request_id, timeout=5)['status'] == oc2.StatusCode.OK
+	assert [str(c.target.getObj()) for c in slow.commands] == [f'10.0.{i}.0/24' for i in range(3)]
+
+def test_overload():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): SlowActuator(0.2)}, max_pending=2)
+	statuses = [consumer.dispatch(message(f'10.0.{i}.0/24')).content['status'] for i in range(3)]
+	assert statuses == [oc2.StatusCode.PROCESSING, oc2.StatusCode.PROCESSING, oc2.StatusCode.SERVICEUNAVAILABLE]
+	consumer.close()
+	assert len(consumer.engine) == 0
+
+def test_close():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, f'fw{i}'): SlowActuator(0.1) for i in range(3)})
+	assert consumer.pool._max_workers == 3
+	consumer.add_actuator(slpf.nsid, 'fw3', SlowActuator(0.1))
+	assert consumer.pool._max_workers == 4
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8'), actuator=slpf.Specifiers({}))
+	assert consumer.dispatch(oc2.Message(cmd)).content['status_text'].count('200') == 4
+	assert consumer.dispatch(message('10.0.0.0/8', asset_id='fw0')).content['status'] == oc2.StatusCode.PROCESSING
+
+	consumer.close()
+	assert consumer.result('producer', 'unknown') is None
+	assert not any(t.is_alive() for t in consumer.pool._threads)
+	assert consumer.dispatch(message('10.0.0.0/8', asset_id='fw0')).content['status'] == oc2.StatusCode.SERVICEUNAVAILABLE
+
+class FailingActuator:
+	def run(self, cmd):
+		return oc2.Response(status=oc2.StatusCode.NOTIMPLEMENTED, status_text='Target not supported')
+
+def test_fanout():
+	actuators = {(slpf.nsid, f'fw{i}'): SlowActuator(0.2) for i in range(20)}
+	consumer = oc2.Consumer('consumer', actuators)
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8'), actuator=slpf.Specifiers({}))
+
+	start = time.perf_counter()
+	rsp = consumer.dispatch(oc2.Message(cmd))
+	assert time.perf_counter() - start < 1
+	assert all(len(a.commands) == 1 for a in actuators.values())
+	assert rsp.content['status'] == oc2.StatusCode.OK
+	assert rsp.content['status_text'].count('200') == 20
+
+def test_fanout_merge():
+	actuators = {(slpf.nsid, 'fast'): SlowActuator(0), (slpf.nsid, 'failing'): FailingActuator(),
+		(slpf.nsid, 'hung'): SlowActuator(2)}
+	consumer = oc2.Consumer('consumer', actuators, timeout=0.2)
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8'), actuator=slpf.Specifiers({}))
+
+	start = time.perf_counter()
+	rsp = consumer.dispatch(oc2.Message(cmd)).content
+	assert time.perf_counter() - start < 1
+	assert rsp['status'] == oc2.StatusCode.SERVICEUNAVAILABLE
+	assert rsp['status_text'] == 'fast: 200 10.0.0.0/8; failing: 501 Target not supported; hung: 503 Timeout'
+
+def test_merge_results():
+	rsp = oc2.Consumer.merge({
+		'a': oc2.Response(status=oc2.StatusCode.OK, results=slpf.Results(rule_number=slpf.RuleID(1))),
+		'b': oc2.Response(status=oc2.StatusCode.OK, results=slpf.Results(rate_limit=10, rule_number=slpf.RuleID(2)))})
+	assert rsp['status'] == oc2.StatusCode.OK
+	assert rsp['results'] == {'rule_number': 1, 'rate_limit': 10}
+
+def test_routing():
+	actuators = {(slpf.nsid, f'fw{i}'): SlowActuator(0) for i in range(300)}
+	consumer = oc2.Consumer('consumer', actuators)
+	consumer.add_actuator(slpf.nsid, 'edge1', SlowActuator(0), hostname='edge1.example.net', named_group='edge')
+	consumer.add_actuator(slpf.nsid, 'edge2', SlowActuator(0), named_group='edge')
+
+	def route(specifiers):
+		return sorted(key[1] for key, _ in consumer.routes.route(slpf.nsid, specifiers))
+
+	assert route({'asset_id': 'fw7'}) == ['fw7']
+	assert route({'named_group': 'edge'}) == ['edge1', 'edge2']
+	assert route({'hostname': 'edge1.example.net'}) == ['edge1']
+	# All the specifiers must match
+	assert route({'hostname': 'edge1.example.net', 'named_group': 'edge'}) == ['edge1']
+	with pytest.raises(KeyError):
+		route({'hostname': 'edge1.example.net', 'named_group': 'core'})
+	with pytest.raises(KeyError):
+		route({'hostname': 'unknown'})
+	# Specifiers that no actuator declared select the whole profile
+	assert len(route({'asset_tuple': ['unknown']})) == 302
+	assert route({'asset_tuple': ['unknown'], 'named_group': 'edge'}) == ['edge1', 'edge2']
+	assert len(consumer.routes.route()) == 302
+
+	consumer.remove_actuator(slpf.nsid, 'edge1')
+	assert route({'named_group': 'edge'}) == ['edge2']
+	assert (slpf.nsid, 'edge1') not in consumer.actuators
+	with pytest.raises(KeyError):
+		consumer.routes.route(slpf.nsid, {'asset_id': 'edge1'})
+
+	msg = message('10.0.0.0/8', asset_id='edge1', response=oc2.ResponseType.complete)
+	assert consumer.dispatch(msg).content['status'] == oc2.StatusCode.NOTFOUND
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8'), actuator=slpf.Specifiers({'named_group': 'core'}))
+	assert consumer.dispatch(oc2.Message(cmd)).content['status'] == oc2.StatusCode.NOTFOUND
+	msg = message('10.0.0.0/8', asset_id='fw299', response=oc2.ResponseType.complete)
+	assert consumer.dispatch(msg).content['status'] == oc2.StatusCode.OK
+	assert len(actuators[(slpf.nsid, 'fw299')].commands) == 1
+
+class LocalTransfer:
+	""" Delivers messages to a Consumer in the same process """
+	def __init__(self, consumer):
+		self.consumer = consumer
+
+	def send(self, msg, encoder):
+		return self.consumer.dispatch(msg)
+
+def test_rate_limit():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'fast'): SlowActuator(0)}, rate_limit=60, actuator_rate_limit=120)
+	msg = lambda: message('10.0.0.0/8', asset_id='fast', response=oc2.ResponseType.complete)
+	assert consumer.dispatch(msg()).content['status'] == oc2.StatusCode.OK
+	rsp = consumer.dispatch(msg()).content
+	assert rsp['status'] == oc2.StatusCode.SERVICEUNAVAILABLE
+	assert rsp['status_text'].startswith('Rate limit exceeded, retry after')
+	# Each producer has its own bucket
+	other = msg()
+	other.from_ = 'another producer'
+	assert consumer.dispatch(other).content['status'] == oc2.StatusCode.OK
+
+def test_rate_limit_advertised():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'mokup'): MokupSlpfActuator()}, actuator_rate_limit=600)
+	producer = oc2.Producer('producer', transfer=LocalTransfer(consumer), encoder=True)
+	query = oc2.Command(oc2.Actions.query, oc2.Features([oc2.Feature.versions, oc2.Feature.rate_limit]),
+		actuator=slpf.Specifiers({'asset_id': 'mokup'}))
+	rsp = producer.sendcmd(query).content
+	assert rsp['status'] == oc2.StatusCode.OK
+	assert rsp['results']['rate_limit'] == 600
+
+	# The producer paces the following commands (10 per second, without bursts)
+	cmd = oc2.Command(oc2.Actions.query, oc2.Features([oc2.Feature.versions]), actuator=slpf.Specifiers({'asset_id': 'mokup'}))
+	start = time.perf_counter()
+	statuses = [producer.sendcmd(cmd).content['status'] for i in range(5)]
+	assert statuses == [oc2.StatusCode.OK] * 5
+	assert time.perf_counter() - start >= 0.35
+
+def test_duplicates(tmp_path):
+	actuator = SlowActuator(0.2)
+	db = str(tmp_path / 'responses.db')
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): actuator}, dedup_db=db)
+	msg = message('10.0.0.0/8', response=oc2.ResponseType.complete, command_id='cmd-1')
+
+	# Concurrent duplicates wait for the first run
+	rsps = [None] * 5
+	def run(i):
+		rsps[i] = consumer.dispatch(msg)
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(len(rsps))]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	assert len(actuator.commands) == 1
+	assert all(r.content['status'] == oc2.StatusCode.OK for r in rsps)
+
+	# Retransmissions are answered from the cache, also with a new request_id and after a restart
+	assert consumer.dispatch(msg).content['status_text'] == '10.0.0.0/8'
+	consumer.close()
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): actuator}, dedup_db=db)
+	again = message('10.0.0.0/8', response=oc2.ResponseType.complete, command_id='cmd-1')
+	assert consumer.dispatch(again).content['status'] == oc2.StatusCode.OK
+	assert len(actuator.commands) == 1
+
+	# The same command_id from another producer is a different command
+	again.from_ = 'another producer'
+	consumer.dispatch(again)
+	assert len(actuator.commands) == 2
+
+def test_duplicates_not_cached():
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'fast'): SlowActuator(0)}, rate_limit=60)
+	msg = lambda: message('10.0.0.0/8', asset_id='fast', response=oc2.ResponseType.complete)
+	assert consumer.dispatch(msg()).content['status'] == oc2.StatusCode.OK
+	rejected = msg()
+	assert consumer.dispatch(rejected).content['status'] == oc2.StatusCode.SERVICEUNAVAILABLE
+	# Errors are not cached, so that retries are run again
+	consumer.producer_limits.take = lambda key: 0
+	assert consumer.dispatch(rejected).content['status'] == oc2.StatusCode.OK
+
+	actuator = SlowActuator(0)
+	consumer = oc2.Consumer('consumer', {(slpf.nsid, 'fast'): actuator}, dedup_size=0)
+	m = msg()
+	consumer.dispatch(m)
+	consumer.dispatch(m)
+	assert len(actuator.commands) == 2
+
+def test_duplicates_db_writer(tmp_path):
+	db = str(tmp_path / 'responses.db')
+	cache = ResponseCache(db_path=db)
+	ok = lambda: oc2.Response(status=oc2.StatusCode.OK)
+	cache.run([('producer', 'cmd-0')], ok)
+	# Lock the database: responses are still cached while the writer waits
+	other = sqlite3.connect(db, isolation_level=None)
+	other.execute('BEGIN IMMEDIATE')
+	start = time.perf_counter()
+	for i in range(1, 100):
+		assert cache.run([('producer', f'cmd-{i}')], ok)['status'] == oc2.StatusCode.OK
+	assert time.perf_counter() - start < 1
+	assert len(cache) == 100
+	other.execute('ROLLBACK')
+	other.close()
+
+	# Pending updates are written on close
+	cache.close()
+	cache = ResponseCache(db_path=db)
+	assert len(cache) == 100
+	cache.close()
@@ -0,0 +1,147 @@
+import pytest
+import socket
+import threading
+import time
+import concurrent.futures
+import urllib3
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.encoders.json import JSONEncoder
+from otupy.transfers.http import HTTPTransfer
+from otupy.transfers.http.http_transfer import _PooledWSGIServer
+
+
+DELAY = 0.5
+
+class SlowActuator:
+	def run(self, cmd):
+		time.sleep(DELAY)
+		return oc2.Response(status=oc2.StatusCode.OK)
+
+def free_port():
+	with socket.socket() as s:
+		s.bind(('127.0.0.1', 0))
+		return s.getsockname()[1]
+
+@pytest.fixture
+def consumer():
+	port = free_port()
+	transfer = HTTPTransfer('127.0.0.1', port, threads=4)
+	c = oc2.Consumer('consumer', {(slpf.nsid, 'slow'): SlowActuator()}, JSONEncoder(), transfer)
+	server = threading.Thread(target=c.run)
+	server.start()
+	while transfer._server is None:
+		time.sleep(0.01)
+	yield port
+	transfer.shutdown()
+	server.join(5)
+	assert not server.is_alive()
+
+def send(port, transfer=None):
+	producer = oc2.Producer('producer', JSONEncoder(), transfer or HTTPTransfer('127.0.0.1', port))
+	cmd = oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/8'), actuator=slpf.Specifiers({'asset_id': 'slow'}))
+	return producer.sendcmd(cmd)
+
+def test_concurrent_requests(consumer):
+	start = time.perf_counter()
+	with concurrent.futures.ThreadPoolExecutor(4) as pool:
+		responses = list(pool.map(send, [consumer]*4))
+	elapsed = time.perf_counter() - start
+
+	assert all(r.content['status'] == oc2.StatusCode.OK for r in responses)
+	assert elapsed < 3 * DELAY
+
+def test_persistent_connections(consumer, monkeypatch):
+	connects = []
+	connect = urllib3.connection.HTTPConnection.connect
+	def count(conn):
+		connects.append(conn)
+		connect(conn)
+	monkeypatch.setattr(urllib3.connection.HTTPConnection, 'connect', count)
+
+	transfer = HTTPTransfer('127.0.0.1', consumer)
+	for i in range(3):
+		assert send(consumer, transfer).content['status'] == oc2.StatusCode.OK
+	assert len(connects) == 1
+	transfer.close()
+
+def test_keep_alive(consumer, monkeypatch):
+	accepted = []
+	process_request = _PooledWSGIServer.process_request
+	def count(server, request, client_address):
+		accepted.append(client_address)
+		process_request(server, request, client_address)
+	monkeypatch.setattr(_PooledWSGIServer, 'process_request', count)
+
+	transfer = HTTPTransfer('127.0.0.1', consumer)
+	for i in range(3):
+		assert send(consumer, transfer).content['status'] == oc2.StatusCode.OK
+	assert len(accepted) == 1
+	transfer.close()
+
+def serve(app, max_keep_alive):
+	server = _PooledWSGIServer('127.0.0.1', 0, app, threads=2, keep_alive=3, max_keep_alive=max_keep_alive)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def exchange(server, data, responses):
+	""" Send raw data and read until `responses` responses are received or the connection is closed """
+	received = b''
+	with socket.create_connection(server.server_address, timeout=3) as s:
+		s.sendall(data)
+		while received.count(b'HTTP/1.1 200') < responses:
+			chunk = s.recv(4096)
+			if not chunk:
+				break
+			received += chunk
+	return received
+
+def test_keep_alive_unread_body():
+	# The application does not read the request body
+	app = lambda environ, start_response: start_response('200 OK', [('Content-Length', '2')]) and [b'ok']
+	request = b'POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: 5\r\n\r\nhello'
+	server = serve(app, 1)
+	try:
+		received = exchange(server, request * 2, 2)
+		assert received.count(b'HTTP/1.1 200') == 2
+		assert b'Connection: close' not in received
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	# Without keep-alive slots, connections are closed after each request
+	server = serve(app, 0)
+	try:
+		received = exchange(server, request * 2, 2)
+		assert received.count(b'HTTP/1.1 200') == 1
+		assert b'Connection: close' in received
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def test_keep_alive_limit():
+	server = _PooledWSGIServer('127.0.0.1', 0, None, threads=2, keep_alive=3, max_keep_alive=1)
+	try:
+		assert server.acquire_keep_alive()
+		# The last worker is never bound to an idle connection
+		assert not server.acquire_keep_alive()
+		server.release_keep_alive()
+		assert server.acquire_keep_alive()
+	finally:
+		server.server_close()
+
+def test_keep_alive_threads():
+	with pytest.raises(ValueError):
+		HTTPTransfer('127.0.0.1', free_port(), threads=2, max_keep_alive=2)
+
+def test_single_session():
+	transfer = HTTPTransfer('127.0.0.1', free_port())
+	barrier = threading.Barrier(8)
+	def get():
+		barrier.wait()
+		return transfer.session
+	with concurrent.futures.ThreadPoolExecutor(8) as pool:
+		sessions = list(pool.map(lambda i: get(), range(8)))
+	assert all(s is sessions[0] for s in sessions)
+	transfer.close()
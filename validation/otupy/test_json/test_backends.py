@@ -0,0 +1,58 @@
+import pytest
+import json
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.transfers.http.message import Message
+from otupy.encoders.json import JSONEncoder, JSONBackends
+
+
+cmd = {'action': 'deny', 'target': {'ipv4_net': '192.168.0.0/24'}, 'args': {'slpf': {'drop_process': 'none'}}}
+
+@pytest.fixture(params=list(JSONBackends))
+def backend(request):
+	JSONEncoder.set_backend(request.param)
+	yield request.param
+	JSONEncoder.set_backend()
+
+@pytest.fixture(params=[3, None])
+def indent(request):
+	JSONEncoder.indent = request.param
+	yield request.param
+	JSONEncoder.indent = 3
+
+def test_roundtrip(backend, indent):
+	c = JSONEncoder.decode(json.dumps(cmd), oc2.Command)
+	data = JSONEncoder.encode_bytes(c)
+	assert isinstance(data, bytes)
+	assert json.loads(data) == cmd
+	assert JSONEncoder.todict(JSONEncoder.decode(data, oc2.Command)) == cmd
+	assert json.loads(JSONEncoder.encode(c)) == cmd
+	if indent is None:
+		assert b'\n' not in data and b', ' not in data
+
+def test_http_message(backend):
+	m = Message()
+	m.set(oc2.Message(JSONEncoder.decode(json.dumps(cmd), oc2.Command)))
+	assert JSONEncoder.todict(JSONEncoder.decode(JSONEncoder.encode_bytes(m), Message)) == JSONEncoder.todict(m)
+
+def test_default_backend():
+	c = JSONEncoder.decode(json.dumps(cmd), oc2.Command)
+	assert JSONEncoder.backend.name == 'json'
+	assert JSONEncoder.encode(c) == json.dumps(cmd, indent=3)
+
+@pytest.mark.parametrize('indent', [2, 3])
+def test_orjson_indent(indent):
+	pytest.importorskip('orjson')
+	c = JSONEncoder.decode(json.dumps(cmd), oc2.Command)
+	JSONEncoder.set_backend('orjson')
+	JSONEncoder.indent = indent
+	try:
+		assert JSONEncoder.encode(c) == json.dumps(cmd, indent=indent)
+	finally:
+		JSONEncoder.set_backend()
+		JSONEncoder.indent = 3
+
+def test_unknown_backend():
+	with pytest.raises(ValueError):
+		JSONEncoder.set_backend('nojson')
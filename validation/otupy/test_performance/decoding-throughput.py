@@ -0,0 +1,57 @@
+#!../../../.oc2-env/bin/python3
+# Measure the decoding throughput of otupy
+#
+# All commands in the "good" corpus are loaded in memory as dictionaries and
+# decoded NUM_TESTS times. The json parsing is not included in the measure,
+# so only the otupy decoding is considered.
+
+import sys
+import time
+import json
+
+import otupy as oc2
+
+import otupy.profiles.slpf as slpf
+import otupy.profiles.dumb as dumb
+
+from helpers import load_files
+
+import sys
+sys.path.insert(0, "../profiles/")
+
+import acme
+import mycompany
+import mycompany_with_underscore
+import example
+import esm
+import digits
+import digits_and_chars
+
+command_path_good = "openc2-commands-good"
+NUM_TESTS = 100
+
+def main():
+
+	cmds = []
+	for c in load_files(command_path_good):
+		with open(c) as f:
+			cmds.append(json.load(f))
+
+	# Warm up: the first decoding of each class builds its schema
+	for c in cmds:
+		oc2.Encoder.decode(oc2.Command, c)
+
+	start = time.perf_counter()
+	for i in range(1, NUM_TESTS+1):
+		for c in cmds:
+			oc2.Encoder.decode(oc2.Command, c)
+	elapsed = time.perf_counter() - start
+
+	count = NUM_TESTS * len(cmds)
+	print("Decoded commands: ", count)
+	print("Total time (s): ", elapsed)
+	print("Throughput (commands/s): ", count / elapsed)
+
+
+if __name__ == '__main__':
+	main()
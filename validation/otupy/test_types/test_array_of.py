@@ -0,0 +1,34 @@
+import pytest
+
+import otupy as oc2
+from otupy import ArrayOf, MapOf, Version, Nsid
+
+
+def test_arrayof_interning():
+	assert ArrayOf(Version) is ArrayOf(Version)
+	assert ArrayOf(Version) is not ArrayOf(Nsid)
+	assert type(ArrayOf(Version)([Version(1,0)])) is ArrayOf(Version)
+
+def test_mapof_interning():
+	assert MapOf(str, int) is MapOf(str, int)
+	assert MapOf(str, int) is not MapOf(int, str)
+
+def test_from_iterable():
+	versions = ArrayOf(Version).from_iterable(['1.0', Version(2,0)])
+	assert type(versions) is ArrayOf(Version)
+	assert all(type(v) is Version for v in versions)
+	assert versions == ArrayOf(Version)(['1.0', '2.0'])
+
+	nsids = ArrayOf(Nsid).from_iterable((Nsid(n) for n in ['slpf', 'x-acme']), trusted=True)
+	assert nsids == ['slpf', 'x-acme']
+
+def test_decoding():
+	versions = oc2.Encoder.decode(ArrayOf(Version), ['1.0', '2.0'])
+	assert type(versions) is ArrayOf(Version)
+	assert versions == [Version(1,0), Version(2,0)]
+	assert ArrayOf(str)('abc') == ['abc']
+
+def test_string_item():
+	# As for Array, a string is a single item
+	assert oc2.Array('abc') == ['abc']
+	assert ArrayOf(Version)('1.0') == [Version(1,0)]
@@ -0,0 +1,68 @@
+import pytest
+import ipaddress
+
+import otupy as oc2
+from otupy import IPv4Net, IPv6Net
+from otupy.types.targets import bulk
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+	if request.param == 'numpy':
+		pytest.importorskip('numpy')
+	else:
+		monkeypatch.setattr(bulk, 'numpy', None)
+	return request.param
+
+def test_ipv4_text(backend):
+	nets = ["130.251.17.0/24", "192.168.10.1", "10.0.0.0/255.0.0.0", "10.0.0.0/8", "1.1.0.0/0.0.255.255"]
+	assert bulk.ipv4_nets(nets, unique=False) == [IPv4Net(n) for n in nets]
+	assert [str(n) for n in bulk.ipv4_nets(nets)] == ["130.251.17.0/24", "192.168.10.1/32", "10.0.0.0/8", "1.1.0.0/16"]
+
+@pytest.mark.parametrize('net', ["10.0.0.1/24", "10.0.0.00", "12.12.12.260", "1.2.3.4/33", "1.2.3.4/", "10.0.0", "1.2.3.4\x00"])
+def test_ipv4_bad_text(backend, net):
+	with pytest.raises(ValueError):
+		bulk.ipv4_nets(["10.0.0.0/8", net])
+
+def test_ipv4_ints(backend):
+	nets = bulk.ipv4_nets([0x0a000000, 0x0a000000, 0xc0a80a01], prefixes=[8, 8, 32])
+	assert nets == [IPv4Net("10.0.0.0/8"), IPv4Net("192.168.10.1")]
+	with pytest.raises(ValueError):
+		bulk.ipv4_nets([0x0a000001], prefixes=8)
+
+def test_ipv4_numpy_array():
+	numpy = pytest.importorskip('numpy')
+	addrs = numpy.array([0x0a000000, 0xc0a80000], dtype=numpy.uint32)
+	assert bulk.ipv4_nets(addrs, prefixes=numpy.array([8, 16])) == [IPv4Net("10.0.0.0/8"), IPv4Net("192.168.0.0/16")]
+	assert bulk.ipv4_nets(numpy.array(["10.0.0.0/8"])) == [IPv4Net("10.0.0.0/8")]
+
+def test_ipv6(backend):
+	assert bulk.ipv6_nets(["2001:db8::/32", "2001:0db8::/32", "::1"]) == [IPv6Net("2001:db8::/32"), IPv6Net("::1")]
+	addr = int(ipaddress.IPv6Address("2001:db8::"))
+	assert bulk.ipv6_nets([addr], prefixes=32) == [IPv6Net("2001:db8::/32")]
+
+def test_ipv6_numpy_array():
+	numpy = pytest.importorskip('numpy')
+	addrs = numpy.array([[0x20010db800000000, 0]], dtype=numpy.uint64)
+	assert bulk.ipv6_nets(addrs, prefixes=32) == [IPv6Net("2001:db8::/32")]
+
+def test_commands():
+	cmds = list(bulk.commands(oc2.Actions.deny, bulk.ipv4_nets(["10.0.0.0/8", "11.0.0.0/8"])))
+	assert len(cmds) == 2
+	assert oc2.Encoder.todict(cmds[0]) == {'action': 'deny', 'target': {'ipv4_net': '10.0.0.0/8'}}
+
+def test_collapse():
+	nets = bulk.ipv4_nets(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.64/26", "10.0.1.0/24", "192.168.1.1", "10.0.3.0/24"])
+	assert [str(n) for n in bulk.collapse(nets)] == ["10.0.0.0/23", "10.0.3.0/24", "192.168.1.1/32"]
+	nets = bulk.ipv6_nets(["2001:db8::/33", "2001:db8:8000::/33"])
+	assert bulk.collapse(nets) == [IPv6Net("2001:db8::/32")]
+	assert bulk.collapse([]) == []
+
+def test_generators(backend):
+	nets = ["10.0.0.0/8", "11.0.0.0/8", "12.0.0.0/8"]
+	assert bulk.ipv4_nets(n for n in nets) == [IPv4Net(n) for n in nets]
+	assert bulk.ipv4_nets((a << 24 for a in (10, 11, 12)), prefixes=8) == [IPv4Net(n) for n in nets]
+	nets = ["2001:db8::/32", "2001:db9::/32", "::1"]
+	assert bulk.ipv6_nets(iter(nets)) == [IPv6Net(n) for n in nets]
+	addr = int(ipaddress.IPv6Address("2001:db8::"))
+	assert bulk.ipv6_nets((a for a in [addr, addr + 1]), prefixes=128) == [IPv6Net.fromint(addr, 128), IPv6Net.fromint(addr + 1, 128)]
@@ -0,0 +1,53 @@
+import pytest
+
+from otupy import IPv4Net, IPv6Net
+from otupy.types.data import IPv4Addr, IPv6Addr
+
+
+def test_ipv4_text():
+	net = IPv4Net("10.0.0.0/255.0.0.0")
+	assert net.addr() == "10.0.0.0"
+	assert net.prefix() == 8
+	assert str(net) == "10.0.0.0/8"
+	assert str(IPv4Net()) == "0.0.0.0/0"
+	assert str(IPv4Net("192.168.10.1")) == "192.168.10.1/32"
+
+def test_ipv6_text():
+	net = IPv6Net("2001:db8::", 32)
+	assert net.addr() == "2001:0db8:0000:0000:0000:0000:0000:0000"
+	assert str(net) == "2001:db8::/32"
+	assert str(IPv6Net()) == "::/0"
+
+def test_fromint():
+	assert IPv4Net.fromint(0x0a000000, 8) == IPv4Net("10.0.0.0/8")
+	assert IPv6Net.fromint(0x20010db8 << 96, 32) == IPv6Net("2001:db8::/32")
+	with pytest.raises(ValueError):
+		IPv4Net.fromint(0x0a000001, 8)
+	with pytest.raises(ValueError):
+		IPv4Net.fromint(0, 33)
+
+def test_hash_eq():
+	nets = {IPv4Net("10.0.0.0/8"), IPv4Net("10.0.0.0", 8), IPv4Net(IPv4Net("10.0.0.0/8"))}
+	assert len(nets) == 1
+	assert IPv4Net("10.0.0.0/8") != IPv4Net("10.0.0.0/16")
+	assert IPv4Addr("1.2.3.4") == IPv4Addr("1.2.3.4")
+	assert len({IPv6Addr("::1"), IPv6Addr("0::1")}) == 1
+
+def test_containment():
+	net = IPv4Net("10.0.0.0/8")
+	assert IPv4Net("10.1.0.0/16") in net
+	assert net not in IPv4Net("10.1.0.0/16")
+	assert IPv4Addr("10.2.3.4") in net
+	assert IPv4Addr("11.2.3.4") not in net
+	assert net.overlaps(IPv4Net("10.1.0.0/16"))
+	assert not net.overlaps(IPv4Net("11.0.0.0/8"))
+	assert IPv6Addr("2001:db8::1") in IPv6Net("2001:db8::/32")
+	assert IPv6Net("2001:db8:1::/48") in IPv6Net("2001:db8::/32")
+
+def test_overlaps_type():
+	assert IPv6Net("2001:db8::/32").overlaps(IPv6Net("2001:db8:1::/48"))
+	for other in (IPv6Net("::/0"), "10.0.0.0/8", IPv4Addr("10.0.0.1")):
+		with pytest.raises(TypeError):
+			IPv4Net("10.0.0.0/8").overlaps(other)
+	with pytest.raises(TypeError):
+		IPv6Net("::/0").overlaps(IPv4Net("10.0.0.0/8"))
@@ -0,0 +1,92 @@
+import pytest
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+from otupy.core import encoder
+from otupy.profiles.slpf.data import DropProcess
+
+
+class PrefixEncoder(oc2.Encoder):
+	encoder_type = 'prefix'
+	todict_overrides = {oc2.IPv4Net: lambda net: 'net:' + str(net)}
+
+
+def make_command():
+	args = slpf.Args({'response_requested': oc2.ResponseType.complete, 'drop_process': DropProcess.none,
+			'direction': slpf.Direction.ingress})
+	return oc2.Command(oc2.Actions.deny, oc2.IPv4Net('10.0.0.0/24'), args=args,
+			actuator=slpf.Specifiers({'hostname': 'fw1'}), command_id='cmd-1')
+
+cmd = {'action': 'deny', 'target': {'ipv4_net': '10.0.0.0/24'},
+		'args': {'slpf': {'drop_process': 'none', 'direction': 'ingress'}, 'response_requested': 'complete'},
+		'actuator': {'slpf': {'hostname': 'fw1'}}, 'command_id': 'cmd-1'}
+
+
+def test_encoding_roundtrip():
+	assert oc2.Encoder.todict(make_command()) == cmd
+	response = oc2.Response(status=oc2.StatusCode.OK, results=slpf.Results(rule_number=3))
+	assert oc2.Encoder.todict(response) == {'status': 200, 'results': {'slpf': {'rule_number': 3}}}
+
+def test_todict_plans_per_encoder():
+	command = make_command()
+	assert oc2.Encoder.todict(command)['target'] == {'ipv4_net': '10.0.0.0/24'}
+	assert PrefixEncoder.todict(command)['target'] == {'ipv4_net': 'net:10.0.0.0/24'}
+	# Each Encoder keeps its own plans, which are reused
+	base = encoder._todict_function(oc2.Encoder)
+	prefixed = encoder._todict_function(PrefixEncoder)
+	assert base is not prefixed
+	assert encoder._todict_function(PrefixEncoder) is prefixed
+	assert oc2.Encoder.todict(command) == cmd
+
+def test_record_roundtrip():
+	command = oc2.Encoder.decode(oc2.Command, cmd)
+	assert type(command) == oc2.Command
+	assert command.command_id == 'cmd-1'
+	assert oc2.Encoder.todict(command) == cmd
+
+def test_map_extension_roundtrip():
+	command = oc2.Encoder.decode(oc2.Command, cmd)
+	assert type(command.args) == slpf.Args
+	assert command.args['response_requested'] == oc2.ResponseType.complete
+	assert command.args['direction'] == slpf.Direction.ingress
+
+	response = oc2.Response(status=oc2.StatusCode.OK, results=slpf.Results(rule_number=3))
+	dic = oc2.Encoder.todict(response)
+	assert dic == {'status': 200, 'results': {'slpf': {'rule_number': 3}}}
+	response = oc2.Encoder.decode(oc2.Response, dic)
+	assert type(response['results']) == slpf.Results
+	assert response['results']['rule_number'] == 3
+	assert oc2.Encoder.todict(response) == dic
+
+def test_choice_roundtrip():
+	command = oc2.Encoder.decode(oc2.Command, cmd)
+	assert type(command.target.getObj()) == oc2.IPv4Net
+	assert str(command.target.getObj()) == '10.0.0.0/24'
+	assert type(command.actuator.getObj()) == slpf.Specifiers
+	assert command.actuator.getObj()['hostname'] == 'fw1'
+
+def test_enumerated_roundtrip():
+	command = oc2.Encoder.decode(oc2.Command, cmd)
+	assert command.action == oc2.Actions.deny
+	assert command.args['drop_process'] == DropProcess.none
+	# Enumerated by identifier
+	assert oc2.Encoder.decode(oc2.Response, {'status': 404})['status'] == oc2.StatusCode.NOTFOUND
+	with pytest.raises(oc2.EncoderError):
+		oc2.Encoder.decode(oc2.Command, {**cmd, 'action': 'unknown'})
+
+def test_fromdict_plans_cached():
+	oc2.Encoder.decode(oc2.Command, cmd)
+	plan = encoder._fromdict_plans[oc2.Command]
+	oc2.Encoder.decode(oc2.Command, cmd)
+	assert encoder._fromdict_plans[oc2.Command] is plan
+
+def test_extension_invalidates_plans():
+	@oc2.extension(nsid='x-plans')
+	class PlanResults(oc2.Results):
+		fieldtypes = {'counter': int}
+
+	dic = {'status': 200, 'results': {'x-plans': {'counter': 7}}}
+	response = oc2.Encoder.decode(oc2.Response, dic)
+	assert type(response['results']) == PlanResults
+	assert response['results']['counter'] == 7
+	assert oc2.Encoder.todict(response) == dic
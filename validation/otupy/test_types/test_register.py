@@ -0,0 +1,40 @@
+import pytest
+
+import otupy as oc2
+
+
+class Base:
+	pass
+
+class Derived(Base):
+	pass
+
+class Other:
+	pass
+
+
+def test_reverse_lookup():
+	reg = oc2.Register({'base': Base, 'other': Other})
+	assert reg.getName(Base) == 'base'
+	assert reg.getName(Other) == 'other'
+	with pytest.raises(ValueError):
+		reg.add('again', Base)
+
+def test_subclass_lookup():
+	reg = oc2.Register({'base': Base})
+	assert reg.getName(Derived) == 'base'
+	reg.add('derived', Derived)
+	assert reg.getName(Derived) == 'derived'
+	with pytest.raises(ValueError):
+		reg.getName(Other)
+
+def test_index_consistency():
+	reg = oc2.Register()
+	reg.add('base', Base)
+	reg['base'] = Other
+	assert reg.getName(Other) == 'base'
+	with pytest.raises(ValueError):
+		reg.getName(Base)
+	del reg['base']
+	with pytest.raises(ValueError):
+		reg.getName(Other)
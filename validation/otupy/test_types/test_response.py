@@ -43,3 +43,41 @@ def test_invalid_status(status):
 		Response({'status': status})
 
 
+
+
+lazy_response = {'status': 200, 'status_text': 'OK', 'results': {'versions': ['1.0'], 'pairs': {'query': ['features']}}}
+
+@pytest.fixture
+def lazy_results(monkeypatch):
+	monkeypatch.setattr(Response, 'lazy', ('results',))
+
+def test_lazy_results(lazy_results):
+	from otupy import Encoder
+	from otupy.types.base.schema import LazyValue
+
+	resp = Encoder.decode(Response, lazy_response)
+	assert resp['status'] == StatusCode.OK
+	assert type(dict.__getitem__(resp, 'results')) == LazyValue
+	# Not materialized fields are encoded as they were received
+	assert Encoder.todict(resp) == lazy_response
+
+	assert type(resp['results']) == Results
+	assert type(dict.__getitem__(resp, 'results')) == Results
+	assert Encoder.todict(resp) == lazy_response
+
+def test_lazy_materialize(lazy_results):
+	from otupy import Encoder, EncoderError
+
+	resp = Encoder.decode(Response, {'status': 200, 'results': {'versions': 1}})
+	with pytest.raises(EncoderError):
+		resp.materialize()
+	resp = Encoder.decode(Response, lazy_response).materialize()
+	assert type(dict.__getitem__(resp, 'results')) == Results
+
+def test_lazy_dict_methods(lazy_results):
+	from otupy import Encoder
+
+	for read in (lambda r: dict(r)['results'], lambda r: {**r}['results'], lambda r: r.copy()['results'],
+			lambda r: dict(r.items())['results'], lambda r: list(r.values())[-1], lambda r: r.pop('results')):
+		resp = Encoder.decode(Response, lazy_response)
+		assert type(read(resp)) == Results
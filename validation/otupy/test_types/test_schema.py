@@ -0,0 +1,54 @@
+import pytest
+import dataclasses
+
+import otupy as oc2
+from otupy.types.base.schema import get_schema
+from otupy.core.extensions import extensible
+
+
+@dataclasses.dataclass
+class Envelope(oc2.Record):
+	recipient: str
+	from_: str = None
+
+@dataclasses.dataclass
+class Batch(oc2.Record):
+	name: str
+	items: list = dataclasses.field(default_factory=list)
+
+@extensible
+class Options(oc2.Map):
+	fieldtypes = {'verbose': bool}
+
+
+def test_keyword_rename():
+	env = oc2.Encoder.decode(Envelope, {'recipient': 'consumer', 'from': 'producer'})
+	assert env.from_ == 'producer'
+	assert oc2.Encoder.todict(env) == {'recipient': 'consumer', 'from': 'producer'}
+
+def test_required_field():
+	assert get_schema(Envelope).required == ('recipient',)
+	with pytest.raises(oc2.EncoderError):
+		oc2.Encoder.decode(Envelope, {'from': 'producer'})
+
+def test_default_factory():
+	assert get_schema(Batch).required == ('name',)
+	batch = oc2.Encoder.decode(Batch, {'name': 'empty'})
+	assert batch.items == []
+
+def test_unknown_field():
+	with pytest.raises(oc2.EncoderError):
+		oc2.Encoder.decode(Envelope, {'recipient': 'consumer', 'to': 'producer'})
+
+def test_extension_invalidation():
+	assert type(oc2.Encoder.decode(Options, {'verbose': True})) == Options
+	with pytest.raises(oc2.EncoderError):
+		oc2.Encoder.decode(Options, {'verbose': True, 'x-test': {'level': 3}})
+
+	@oc2.extension(nsid='x-test')
+	class TestOptions(Options):
+		fieldtypes = {'level': int}
+
+	opts = oc2.Encoder.decode(Options, {'verbose': True, 'x-test': {'level': 3}})
+	assert type(opts) == TestOptions
+	assert opts['level'] == 3
@@ -0,0 +1,39 @@
+import pytest
+
+import otupy as oc2
+import otupy.profiles.slpf as slpf
+
+
+cmd = {'action': 'deny', 'target': {'ipv4_net': '192.168.0.0/24'}, 'args': {'slpf': {'drop_process': 'none'}}}
+
+def test_trace_decoding():
+	with oc2.Tracer() as t:
+		oc2.Encoder.decode(oc2.Command, cmd)
+
+	assert t.nodes[0].cls == oc2.Command
+	assert t.nodes[0].depth == 0
+	assert oc2.IPv4Net in [n.cls for n in t.nodes if n.depth == 2]
+	assert all(n.operation == 'fromdict' and n.error is None for n in t.nodes)
+
+	# Plans are compiled again without tracing
+	nodes = len(t.nodes)
+	oc2.Encoder.decode(oc2.Command, cmd)
+	assert len(t.nodes) == nodes
+
+def test_trace_encoding():
+	with oc2.Tracer() as t:
+		oc2.Encoder.todict(oc2.Command(oc2.Actions.deny, oc2.IPv4Net('192.168.0.0/24')))
+	assert t.nodes[0].cls == oc2.Command
+	assert t.nodes[0].operation == 'todict'
+
+def test_trace_error():
+	with oc2.Tracer() as t:
+		with pytest.raises(oc2.EncoderError):
+			oc2.Encoder.decode(oc2.Command, {'action': 'deny'})
+	assert t.nodes[0].error == 'EncoderError'
+
+def test_single_tracer():
+	with oc2.Tracer():
+		with pytest.raises(RuntimeError):
+			with oc2.Tracer():
+				pass